@@ -36,20 +36,63 @@ def create_app(config_name):
 
     # Add our cache
     if config_name == 'production':  # pragma: no cover
-        app.cache = FileSystemCache('recent_calls')
+        app.cache = FileSystemCache(
+            'recent_calls', threshold=app.config['CACHE_THRESHOLD'])
     else:
         app.cache = SimpleCache()
 
     bootstrap.init_app(app)
     db.init_app(app)
 
+    from . import database
+    database.init_app(app)
+
+    from . import deadlines
+    deadlines.init_app(app)
+
     from .setup import setup as setup_blueprint
     app.register_blueprint(setup_blueprint)
 
     from .voice import voice as voice_blueprint
     app.register_blueprint(voice_blueprint)
 
-    # Register our custom template filter
+    from .status import status as status_blueprint
+    app.register_blueprint(status_blueprint)
+
+    # Register our custom template filters
+    from .whitelist import format_entry
     app.jinja_env.filters['national_format'] = convert_to_national_format
+    app.jinja_env.filters['whitelist_entry'] = format_entry
+
+    from . import templating
+    templating.init_app(app)
+
+    from . import tracing
+    tracing.init_app(app)
+
+    from . import capture
+    capture.init_app(app)
+
+    from . import profiling
+    profiling.init_app(app)
+
+    from . import allocations
+    allocations.init_app(app)
+
+    # Our worker for jobs which shouldn't hold up a webhook
+    from .worker import BackgroundWorker
+    app.worker = BackgroundWorker(app)
+
+    # And our mailer, which sends emails in the background
+    from .mailer import Mailer
+    app.mailer = Mailer(app)
+
+    # And our analytics events, which are written in batches
+    from .analytics import EventRecorder
+    app.analytics = EventRecorder(app)
+
+    # And the delivery statuses Twilio sends us, also written in batches
+    from .deliveries import StatusBuffer
+    app.deliveries = StatusBuffer(app)
 
     return app
@@ -0,0 +1,80 @@
+from flask import current_app, request
+from threading import Lock
+from time import time
+
+
+class AdmissionController(object):
+    """
+    Decides whether we have the capacity to handle another request properly.
+
+    We turn requests away when too many are already in flight in this
+    process, when the router says a request waited in its queue for longer
+    than our latency budget, or when recent requests have been taking longer
+    than the budget (a smoothed average, so one slow request doesn't count).
+    """
+
+    def __init__(self, max_in_flight, latency_budget, smoothing=0.2):
+        self.max_in_flight = max_in_flight
+        self.latency_budget = latency_budget
+        self.smoothing = smoothing
+
+        self.lock = Lock()
+        self.in_flight = 0
+        self.latency = 0.0
+
+    def admit(self, queued_for=0):
+        """
+        Returns None if a request can go ahead (and counts it as in flight),
+        or why we should shed it
+        """
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                return 'in_flight'
+            if queued_for > self.latency_budget:
+                return 'queued'
+
+            # Always let one request through, so our average latency can
+            # recover once things calm down
+            if self.in_flight and self.latency > self.latency_budget:
+                return 'latency'
+
+            self.in_flight += 1
+            return None
+
+    def release(self, elapsed):
+        """Records that an admitted request finished after elapsed seconds"""
+        with self.lock:
+            self.in_flight -= 1
+            self.latency += self.smoothing * (elapsed - self.latency)
+
+
+def get_admission_controller():
+    """Returns this process's AdmissionController"""
+    controller = current_app.extensions.get('admission')
+
+    if controller is None:
+        controller = current_app.extensions.setdefault(
+            'admission', AdmissionController(
+                current_app.config['ADMISSION_MAX_IN_FLIGHT'],
+                current_app.config['ADMISSION_LATENCY_BUDGET']))
+
+    return controller
+
+
+def get_queue_time():
+    """
+    How long this request waited in our router's queue (in seconds), from
+    the X-Request-Start header Heroku's router and nginx can add
+    """
+    header = request.headers.get('X-Request-Start', '')
+
+    try:
+        # nginx sends 't=<seconds>', Heroku sends milliseconds
+        if header.startswith('t='):
+            started = float(header[2:])
+        else:
+            started = float(header) / 1000
+    except ValueError:
+        return 0
+
+    return max(time() - started, 0)
@@ -0,0 +1,252 @@
+from flask import current_app, request
+from itsdangerous import BadSignature, TimestampSigner
+from random import random
+from threading import Lock
+from time import time
+
+import os
+import sys
+import tracemalloc
+
+
+# What each endpoint's sampled requests have left allocated, shared by every
+# worker through the app cache
+ALLOCATIONS_PREFIX = 'allocations:'
+ENDPOINTS_KEY = 'allocations:endpoints'
+
+# Send a token from 'manage.py allocations --token' in this header to see
+# /allocations, which shows our source paths
+ALLOCATIONS_HEADER = 'X-Allocations-Token'
+ALLOCATIONS_SALT = 'allocations'
+
+# Our background threads, which keep running while we track a request
+BACKGROUND_MODULES = ('analytics.py', 'deliveries.py', 'mailer.py',
+                      'worker.py')
+
+# Allocations by tracemalloc itself, or by the import system, aren't ours.
+# Neither are our background threads' - so we skip any allocation made with
+# one of their modules anywhere in its traceback. (That includes the events
+# and statuses a request buffers for them, which they soon free anyway)
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+) + tuple(
+    tracemalloc.Filter(False, os.path.join(os.path.dirname(__file__), name),
+                       all_frames=True)
+    for name in BACKGROUND_MODULES)
+
+
+class AllocationTracker(object):
+    """
+    Takes tracemalloc snapshots before and after a sample of requests, and
+    adds what each one left allocated to its endpoint's totals.
+
+    tracemalloc sees the whole process, so we only sample one request at a
+    time, and leave out our background threads' allocations. Other requests
+    running at the same time (in threaded workers), and one-off threads like
+    send_async_message's, can still add to a sampled request's totals.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = Lock()
+
+    def begin(self):
+        """Starts tracking this request, if it's sampled"""
+        if random() >= self.app.config['ALLOCATION_SAMPLE_RATE']:
+            return
+
+        # Skip this one if another thread's request is being tracked
+        if not self.lock.acquire(blocking=False):
+            return
+
+        try:
+            request.environ['allocations.before'] = \
+                tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        except Exception:
+            # Don't let tracking break a request. end() won't release the
+            # lock without a snapshot, so release it here
+            self.lock.release()
+            self.app.logger.exception('Taking an allocations snapshot failed')
+
+    def end(self):
+        """Records what this request left allocated, if it was tracked"""
+        before = request.environ.pop('allocations.before', None)
+        if before is None:
+            return
+
+        try:
+            after = tracemalloc.take_snapshot().filter_traces(
+                SNAPSHOT_FILTERS)
+            differences = after.compare_to(before, 'traceback')
+        finally:
+            self.lock.release()
+
+        record_allocations(request.endpoint or request.path, differences)
+
+
+def _frame_name(frame):
+    parts = frame.filename.split(os.sep)
+    return '{0}:{1}'.format(os.sep.join(parts[-2:]), frame.lineno)
+
+
+def _site_name(traceback):
+    """
+    Names an allocation site by the line which allocated, and (if that's in
+    a library) the line in our code which led to it
+    """
+    frames = list(traceback)
+    # Python 3.7 lists frames oldest first, and earlier versions newest first
+    if sys.version_info >= (3, 7):
+        frames.reverse()
+
+    name = _frame_name(frames[0])
+    if not frames[0].filename.startswith(current_app.root_path):
+        for frame in frames[1:]:
+            if frame.filename.startswith(current_app.root_path):
+                return '{0} via {1}'.format(name, _frame_name(frame))
+
+    return name
+
+
+def record_allocations(endpoint, differences):
+    """
+    Adds one request's tracemalloc differences to an endpoint's totals:
+    its net growth, and the sites which grew most over all its requests
+    """
+    key = ALLOCATIONS_PREFIX + endpoint
+    totals = current_app.cache.get(key) or {
+        'requests': 0, 'net_bytes': 0, 'net_blocks': 0, 'sites': {}}
+
+    totals['requests'] += 1
+    totals['last_seen'] = time()
+    totals['traced_bytes'] = tracemalloc.get_traced_memory()[0]
+
+    sites = totals['sites']
+    for difference in differences:
+        if not difference.size_diff:
+            continue
+
+        totals['net_bytes'] += difference.size_diff
+        totals['net_blocks'] += difference.count_diff
+
+        site = _site_name(difference.traceback)
+        bytes_, requests = sites.get(site, (0, 0))
+        sites[site] = (bytes_ + difference.size_diff, requests + 1)
+
+    # Keep the sites which have grown the most, so the totals stay small
+    keep = current_app.config['ALLOCATION_TOP_SITES']
+    totals['sites'] = dict(sorted(sites.items(), key=lambda item: item[1][0],
+                                  reverse=True)[:keep])
+
+    current_app.cache.set(key, totals, timeout=0)
+
+    endpoints = current_app.cache.get(ENDPOINTS_KEY) or set()
+    if endpoint not in endpoints:
+        current_app.cache.set(ENDPOINTS_KEY, endpoints | set([endpoint]),
+                              timeout=0)
+
+
+def get_report():
+    """
+    Returns each endpoint's totals, with the endpoints leaving the most
+    allocated per request first
+    """
+    endpoints = current_app.cache.get(ENDPOINTS_KEY) or set()
+    report = []
+
+    for endpoint in endpoints:
+        totals = current_app.cache.get(ALLOCATIONS_PREFIX + endpoint)
+        if totals is None:
+            continue
+
+        report.append({
+            'endpoint': endpoint,
+            'requests': totals['requests'],
+            'net_bytes': totals['net_bytes'],
+            'net_blocks': totals['net_blocks'],
+            'bytes_per_request': totals['net_bytes'] // totals['requests'],
+            'traced_bytes': totals['traced_bytes'],
+            'last_seen': totals['last_seen'],
+            'sites': [{'site': site, 'bytes': bytes_, 'requests': requests}
+                      for site, (bytes_, requests) in sorted(
+                          totals['sites'].items(),
+                          key=lambda item: item[1][0], reverse=True)],
+        })
+
+    return sorted(report, key=lambda totals: totals['bytes_per_request'],
+                  reverse=True)
+
+
+def format_report(report, sites=10):
+    """Formats get_report() as text, for manage.py allocations"""
+    if not report:
+        return 'No requests tracked yet'
+
+    lines = ['Includes anything allocated by requests running at the same '
+             'time as a sampled one', '']
+    for totals in report:
+        lines.append(
+            '{endpoint}: {bytes_per_request:+,} bytes per request '
+            '({net_bytes:+,} over {requests} requests)'.format(**totals))
+
+        for site in totals['sites'][:sites]:
+            lines.append('  {bytes:>+12,}  {site} (grew in {requests} '
+                         'requests)'.format(**site))
+        lines.append('')
+
+    return '\n'.join(lines).rstrip()
+
+
+def _signer():
+    return TimestampSigner(current_app.config['SECRET_KEY'],
+                           salt=ALLOCATIONS_SALT)
+
+
+def make_token():
+    """A token which lets a request see /allocations"""
+    return _signer().sign('allocations').decode('utf-8')
+
+
+def valid_token(token):
+    """Checks a token from make_token() (which expires after a while)"""
+    if not token or not current_app.config['SECRET_KEY']:
+        return False
+
+    try:
+        _signer().unsign(
+            token, max_age=current_app.config['ALLOCATION_TOKEN_MAX_AGE'])
+    except BadSignature:
+        return False
+    return True
+
+
+def reset():
+    """Forgets every endpoint's totals"""
+    endpoints = current_app.cache.get(ENDPOINTS_KEY) or set()
+    current_app.cache.delete_many(
+        *[ALLOCATIONS_PREFIX + endpoint for endpoint in endpoints])
+    current_app.cache.delete(ENDPOINTS_KEY)
+
+
+def init_app(app):
+    """Tracks a sample of requests' allocations, if ALLOCATION_TRACKING"""
+    if not app.config['ALLOCATION_TRACKING']:
+        return
+
+    # Tracing slows every allocation down, which is why this is optional
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(app.config['ALLOCATION_FRAMES'])
+
+    tracker = AllocationTracker(app)
+    app.extensions['allocations'] = tracker
+
+    @app.before_request
+    def begin_allocation_tracking():
+        tracker.begin()
+
+    @app.teardown_request
+    def end_allocation_tracking(exc):
+        tracker.end()
@@ -0,0 +1,325 @@
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from queue import Empty, Queue
+from sqlalchemy import and_, select
+from threading import Lock, Thread
+from time import time
+
+import os
+
+from . import db, metrics
+
+
+# The row in AnalyticsCursor which says how far our rollups have got
+ROLLUP_CURSOR = 'rollup'
+
+# Put on an EventRecorder's queue to stop its thread (see close())
+STOP = object()
+
+
+class AnalyticsEvent(db.Model):
+    """
+    One thing that happened, like a call we deflected. Rows are only ever
+    appended - our stats come from the rollup tables below, never from here
+    """
+    __tablename__ = 'analytics_event'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+
+class HourlyCount(db.Model):
+    """How many events of one kind happened in an hour (UTC)"""
+    __tablename__ = 'analytics_hourly'
+    __table_args__ = (db.UniqueConstraint('start', 'kind'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    start = db.Column(db.DateTime, nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyCount(db.Model):
+    """How many events of one kind happened in a day (UTC)"""
+    __tablename__ = 'analytics_daily'
+    __table_args__ = (db.UniqueConstraint('start', 'kind'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    start = db.Column(db.Date, nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AnalyticsCursor(db.Model):
+    """The id of the last event we've added to our rollups"""
+    __tablename__ = 'analytics_cursor'
+
+    name = db.Column(db.String(20), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+
+
+class EventRecorder(object):
+    """
+    Writes analytics events from a background thread, so recording one
+    never holds up a webhook. The thread inserts up to ANALYTICS_BATCH_SIZE
+    events at a time (waiting at most ANALYTICS_FLUSH_INTERVAL seconds to
+    fill a batch), and rolls new events up into our hourly and daily counts
+    every ANALYTICS_ROLLUP_INTERVAL seconds.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.queue = Queue()
+        self.lock = Lock()
+        self.thread = None
+        self.pid = None
+        self.rolled_up_at = time()
+        self.inserted_at = None
+        self.unrolled = False
+
+    def _ensure_started(self):
+        """Starts our thread if it isn't running in this process yet"""
+        with self.lock:
+            # Threads don't survive a fork, so each gunicorn worker needs to
+            # start its own
+            if self.pid != os.getpid() or not self.thread.is_alive():
+                self.thread = Thread(target=self._run, daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+
+    def _next_batch(self):
+        """
+        Waits for the next batch of events. Returns an empty batch if it's
+        time to roll up the events we've already written
+        """
+        config = self.app.config
+
+        try:
+            if self.unrolled:
+                timeout = self.rolled_up_at + \
+                    config['ANALYTICS_ROLLUP_INTERVAL'] - time()
+                batch = [self.queue.get(timeout=max(timeout, 0))]
+            else:
+                batch = [self.queue.get()]
+        except Empty:
+            return []
+
+        deadline = time() + config['ANALYTICS_FLUSH_INTERVAL']
+        while len(batch) < config['ANALYTICS_BATCH_SIZE'] and \
+                batch[-1] is not STOP:
+            timeout = deadline - time()
+            try:
+                if timeout > 0:
+                    batch.append(self.queue.get(timeout=timeout))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = bool(batch) and batch[-1] is STOP
+            events = batch[:-1] if stop else batch
+
+            try:
+                with self.app.app_context():
+                    if events:
+                        insert_events(events)
+                        self.inserted_at = time()
+                        self.unrolled = True
+
+                    if not stop and self.unrolled and \
+                            time() - self.rolled_up_at >= \
+                            self.app.config['ANALYTICS_ROLLUP_INTERVAL']:
+                        self.rolled_up_at = time()
+                        rollup_events()
+
+                        # Events inserted within the lag may have been left
+                        # for the next rollup
+                        self.unrolled = time() - self.inserted_at <= \
+                            self.app.config['ANALYTICS_ROLLUP_LAG']
+            except Exception:
+                self.app.logger.exception('Recording analytics failed')
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+            if stop:
+                return
+
+    def record(self, kind):
+        """Queues an event to be written in the background"""
+        if not self.app.config['ANALYTICS_ENABLED']:
+            return
+
+        self._ensure_started()
+        self.queue.put((kind, datetime.utcnow()))
+
+    def join(self):
+        """Waits until every queued event has been written"""
+        self.queue.join()
+
+    def close(self, timeout=None):
+        """
+        Writes every queued event and stops our thread, like when our worker
+        is about to exit. Recording another event starts it again
+        """
+        with self.lock:
+            if self.pid != os.getpid() or not self.thread.is_alive():
+                return
+            thread = self.thread
+
+        self.queue.put(STOP)
+        thread.join(timeout)
+
+
+def record_event(kind):
+    """Records that something happened, like 'call.deflected'"""
+    current_app.analytics.record(kind)
+
+
+def insert_events(events):
+    """Inserts a batch of (kind, created_at) events in one statement"""
+    db.engine.execute(AnalyticsEvent.__table__.insert(), [
+        {'kind': kind, 'created_at': created_at}
+        for kind, created_at in events])
+    metrics.increment('analytics.events', len(events))
+
+
+def _add_counts(connection, table, counts):
+    """Adds counts (keyed by (start, kind)) to a rollup table"""
+    for (start, kind), count in counts.items():
+        updated = connection.execute(
+            table.update()
+            .where(and_(table.c.start == start, table.c.kind == kind))
+            .values(count=table.c.count + count))
+
+        if updated.rowcount == 0:
+            connection.execute(table.insert(), start=start, kind=kind,
+                               count=count)
+
+
+def _rollup_batch(limit):
+    events = AnalyticsEvent.__table__
+    cursors = AnalyticsCursor.__table__
+
+    # Ids are handed out when a batch is inserted, but the batches commit in
+    # whatever order they finish. So a batch with lower ids than ours could
+    # still be committing - we stop short of any events that recent
+    cutoff = datetime.utcnow() - timedelta(
+        seconds=current_app.config['ANALYTICS_ROLLUP_LAG'])
+
+    with db.engine.begin() as connection:
+        last_event_id = connection.execute(
+            select([cursors.c.last_event_id])
+            .where(cursors.c.name == ROLLUP_CURSOR)).scalar()
+
+        if last_event_id is None:
+            connection.execute(cursors.insert(), name=ROLLUP_CURSOR,
+                               last_event_id=0)
+            last_event_id = 0
+
+        # Only the events since our last rollup, in id order, up to the
+        # first one which is too recent
+        rows = connection.execute(
+            select([events.c.id, events.c.kind, events.c.created_at])
+            .where(events.c.id > last_event_id)
+            .order_by(events.c.id).limit(limit)).fetchall()
+
+        for i, row in enumerate(rows):
+            if row.created_at > cutoff:
+                rows = rows[:i]
+                break
+
+        if not rows:
+            return 0
+
+        # Claim these events by moving the cursor past them. If another
+        # worker got there first, the cursor has moved and we leave it be
+        claimed = connection.execute(
+            cursors.update()
+            .where(and_(cursors.c.name == ROLLUP_CURSOR,
+                        cursors.c.last_event_id == last_event_id))
+            .values(last_event_id=rows[-1].id))
+        if claimed.rowcount != 1:
+            return 0
+
+        hourly, daily = Counter(), Counter()
+        for _, kind, created_at in rows:
+            hour = created_at.replace(minute=0, second=0, microsecond=0)
+            hourly[(hour, kind)] += 1
+            daily[(created_at.date(), kind)] += 1
+
+        _add_counts(connection, HourlyCount.__table__, hourly)
+        _add_counts(connection, DailyCount.__table__, daily)
+
+    return len(rows)
+
+
+def rollup_events():
+    """
+    Adds every event since our last rollup (which is at least
+    ANALYTICS_ROLLUP_LAG seconds old) to the hourly and daily counts,
+    ANALYTICS_ROLLUP_BATCH_SIZE events per transaction. Returns how many
+    events we rolled up
+    """
+    limit = current_app.config['ANALYTICS_ROLLUP_BATCH_SIZE']
+    total = 0
+
+    while True:
+        rolled_up = _rollup_batch(limit)
+        total += rolled_up
+        if rolled_up < limit:
+            break
+
+    metrics.increment('analytics.rolled_up', total)
+    return total
+
+
+def _get_counts(model, since):
+    """Returns an OrderedDict of {kind: count} dicts for each period"""
+    counts = OrderedDict()
+
+    rows = model.query.filter(model.start >= since) \
+        .order_by(model.start, model.kind)
+    for row in rows:
+        counts.setdefault(row.start, {})[row.kind] = row.count
+
+    return counts
+
+
+def get_hourly_counts(hours=24, now=None):
+    """Counts for the last few hours, this one included"""
+    now = now or datetime.utcnow()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    return _get_counts(HourlyCount, hour - timedelta(hours=hours - 1))
+
+
+def get_daily_counts(days=30, now=None):
+    """Counts for the last few days, today included"""
+    now = now or datetime.utcnow()
+    return _get_counts(DailyCount, now.date() - timedelta(days=days - 1))
+
+
+def summarize(counts):
+    """
+    Totals some periods' counts into the numbers our user cares about. A
+    call we asked to press 1 was deflected unless the caller pressed it
+    """
+    totals = Counter()
+    for period_counts in counts.values():
+        totals.update(period_counts)
+
+    return {
+        'calls': totals['call.received'],
+        'deflected': totals['call.deflected'] + max(
+            totals['call.prompted'] - totals['call.pressed_one'], 0),
+        'pressed_one': totals['call.pressed_one'],
+        'contact_info_sent': totals['contact_info.sent'],
+        'voicemails': totals['voicemail.received'],
+    }
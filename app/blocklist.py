@@ -0,0 +1,237 @@
+from flask import current_app
+from threading import Lock
+from time import time
+
+import math
+import mmap
+import numpy
+import os
+import struct
+
+from . import metrics
+
+
+# A blocklist file is a header, then a Bloom filter, then every blocked
+# number as a sorted array of little-endian 64 bit integers (E.164 numbers
+# without their '+'). Workers map it into memory read-only, so they all
+# share the same pages of the OS's page cache, however big the list is.
+BLOCKLIST_MAGIC = b'AVBL'
+BLOCKLIST_VERSION = 1
+
+# Magic, version, hash count, Bloom filter size in bits, numbers count
+HEADER = struct.Struct('<4sHHQQ')
+
+MASK64 = 2 ** 64 - 1
+
+
+def _mix(x):
+    """SplitMix64's finalizer - spreads a number's bits over 64 bits"""
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+def _mix_array(x):
+    """_mix() for a numpy array of uint64s (which wrap around by design)"""
+    u = numpy.uint64
+    with numpy.errstate(over='ignore'):
+        x = x + u(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> u(30))) * u(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> u(27))) * u(0x94D049BB133111EB)
+    return x ^ (x >> u(31))
+
+
+def parse_number(phone_number):
+    """Packs an E.164 number into an integer, or returns None if it isn't"""
+    digits = phone_number.strip()
+    if digits.startswith('+'):
+        digits = digits[1:]
+
+    if not digits.isdigit() or len(digits) > 15:
+        return None
+    return int(digits)
+
+
+def build_blocklist(phone_numbers, path, false_positive_rate=0.01):
+    """
+    Writes a blocklist file from an iterable of E.164 numbers. The new file
+    replaces any old one in a single rename, so workers never see half of
+    it. Returns how many numbers it holds, and how many we skipped.
+    """
+    skipped = 0
+
+    def packed_numbers():
+        nonlocal skipped
+        for phone_number in phone_numbers:
+            number = parse_number(phone_number)
+            if number is None:
+                skipped += 1
+            else:
+                yield number
+
+    numbers = numpy.unique(numpy.fromiter(packed_numbers(), numpy.uint64))
+    count = len(numbers)
+
+    # The classic sizes for a Bloom filter with our false positive rate.
+    # Round it up to whole 8 byte words to keep our numbers aligned
+    bits = -count * math.log(false_positive_rate) / math.log(2) ** 2
+    bits = max(64, int(math.ceil(bits / 64)) * 64)
+    hashes = max(1, int(round(bits / max(count, 1) * math.log(2))))
+
+    bloom = numpy.zeros(bits, dtype=bool)
+    first = _mix_array(numbers)
+    second = _mix_array(first) | numpy.uint64(1)
+    with numpy.errstate(over='ignore'):
+        for i in range(hashes):
+            bloom[(first + numpy.uint64(i) * second) %
+                  numpy.uint64(bits)] = True
+
+    temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(BLOCKLIST_MAGIC, BLOCKLIST_VERSION, hashes, bits,
+                            count))
+        f.write(numpy.packbits(bloom).tobytes())
+        f.write(numbers.astype('<u8').tobytes())
+    os.replace(temp_path, path)
+
+    return count, skipped
+
+
+class Blocklist(object):
+    """A read-only, memory-mapped view of a blocklist file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.version = (stat.st_ino, stat.st_mtime)
+
+            # The mapping keeps the file's pages even after it's replaced
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.hashes, self.bits, self.count = \
+            HEADER.unpack_from(self.map)
+        if magic != BLOCKLIST_MAGIC or version != BLOCKLIST_VERSION:
+            raise ValueError('{0} is not a blocklist file'.format(path))
+
+        self.bloom_offset = HEADER.size
+        self.numbers_offset = self.bloom_offset + self.bits // 8
+
+    def __len__(self):
+        return self.count
+
+    def might_contain(self, number):
+        """Checks the Bloom filter - False means number is definitely absent"""
+        first = _mix(number)
+        second = _mix(first) | 1
+
+        for i in range(self.hashes):
+            bit = ((first + i * second) & MASK64) % self.bits
+            byte = self.map[self.bloom_offset + bit // 8]
+            if not byte & (0x80 >> bit % 8):
+                return False
+        return True
+
+    def _number_at(self, i):
+        return struct.unpack_from('<Q', self.map,
+                                  self.numbers_offset + i * 8)[0]
+
+    def search(self, number):
+        """Binary searches our sorted numbers for number"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._number_at(middle) < number:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low < self.count and self._number_at(low) == number
+
+    def __contains__(self, number):
+        return self.might_contain(number) and self.search(number)
+
+
+class BlocklistFile(object):
+    """
+    Keeps a Blocklist loaded from a path, switching to the new file
+    whenever it's replaced (we check at most every check_interval seconds)
+    """
+
+    def __init__(self, path, check_interval):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = Lock()
+        self.blocklist = None
+        self.checked_at = None
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # No blocklist (yet) - nobody's blocked
+            self.blocklist = None
+            return
+
+        version = (stat.st_ino, stat.st_mtime)
+        if self.blocklist is None or self.blocklist.version != version:
+            # Swapping the reference is atomic, so lookups in other threads
+            # see either the old list or the new one
+            self.blocklist = Blocklist(self.path)
+            metrics.increment('blocklist.reloads')
+
+    def get(self):
+        """Returns the current Blocklist, or None if there's no file"""
+        if self.checked_at is None or \
+                time() - self.checked_at >= self.check_interval:
+            with self.lock:
+                if self.checked_at is None or \
+                        time() - self.checked_at >= self.check_interval:
+                    try:
+                        self._reload()
+                    except (OSError, ValueError, struct.error):
+                        current_app.logger.exception(
+                            'Could not load blocklist %s', self.path)
+                    self.checked_at = time()
+
+        return self.blocklist
+
+
+# Loaded blocklists, shared by every app in this process (and by forked
+# gunicorn workers, when we load them before the fork)
+_files = {}
+_files_lock = Lock()
+
+
+def get_blocklist():
+    """Returns the current Blocklist, or None if we don't have one"""
+    path = current_app.config['BLOCKLIST_FILE']
+    if not path:
+        return None
+
+    blocklist_file = _files.get(path)
+    if blocklist_file is None:
+        with _files_lock:
+            blocklist_file = _files.setdefault(path, BlocklistFile(
+                path, current_app.config['BLOCKLIST_CHECK_INTERVAL']))
+
+    return blocklist_file.get()
+
+
+def is_blocked(phone_number):
+    """Checks if a caller is on our blocklist"""
+    blocklist = get_blocklist()
+    if blocklist is None:
+        return False
+
+    # Almost every caller is missing from the Bloom filter, which only
+    # costs us a few hashes
+    number = parse_number(phone_number)
+    if number is None or not blocklist.might_contain(number):
+        return False
+
+    if blocklist.search(number):
+        return True
+
+    metrics.increment('blocklist.false_positives')
+    return False
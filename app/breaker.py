@@ -0,0 +1,98 @@
+from flask import current_app
+from time import time
+
+from . import metrics
+
+
+class CircuitBreaker(object):
+    """
+    A circuit breaker for a flaky outbound dependency.
+
+    The breaker's state lives in the app cache, so every worker sees it open
+    as soon as one of them trips it. After failure_threshold consecutive
+    failures the breaker opens and calls are skipped for reset_timeout
+    seconds. Then a single trial call is allowed through: if it succeeds the
+    breaker closes again, otherwise it stays open for another reset_timeout.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def _key(self, suffix):
+        return 'breaker:{0}:{1}'.format(self.name, suffix)
+
+    @property
+    def state(self):
+        """The breaker's current state: closed, open or half-open"""
+        opened_at = current_app.cache.get(self._key('opened_at'))
+
+        if opened_at is None:
+            return self.CLOSED
+        elif time() - opened_at < self.reset_timeout:
+            return self.OPEN
+        else:
+            return self.HALF_OPEN
+
+    def allow_request(self):
+        """Returns True if the caller should go ahead with its request"""
+        state = self.state
+
+        if state == self.CLOSED:
+            return True
+        elif state == self.HALF_OPEN:
+            # Only the first worker to get here sends the trial request
+            return current_app.cache.add(self._key('trial'), True,
+                                         timeout=self.reset_timeout)
+
+        metrics.increment('breaker.{0}.short_circuited'.format(self.name))
+        return False
+
+    def release_trial(self):
+        """
+        Gives back a trial request which ended without telling us anything
+        about the dependency, so another caller can send one
+        """
+        current_app.cache.delete(self._key('trial'))
+
+    def record_success(self):
+        """Closes the breaker and resets its failure count"""
+        if current_app.cache.get(self._key('failures')) is None and \
+                self.state == self.CLOSED:
+            # Nothing to reset - skip the cache writes
+            return
+
+        # Delete the keys one by one - some caches' delete_many() gives up
+        # at the first key that doesn't exist
+        for suffix in ('failures', 'opened_at', 'trial'):
+            current_app.cache.delete(self._key(suffix))
+        metrics.set_gauge('breaker.{0}.state'.format(self.name), self.CLOSED)
+
+    def record_failure(self):
+        """Counts a failure, opening the breaker if we've seen too many"""
+        failures = (current_app.cache.get(self._key('failures')) or 0) + 1
+        current_app.cache.set(self._key('failures'), failures, timeout=0)
+        metrics.increment('breaker.{0}.failures'.format(self.name))
+
+        if failures >= self.failure_threshold or \
+                self.state == self.HALF_OPEN:
+            current_app.cache.set(self._key('opened_at'), time(), timeout=0)
+            current_app.cache.delete(self._key('trial'))
+
+            metrics.increment('breaker.{0}.opened'.format(self.name))
+            metrics.set_gauge('breaker.{0}.state'.format(self.name),
+                              self.OPEN)
+
+
+def get_lookups_breaker():
+    """Returns the circuit breaker which guards the Twilio Lookups API"""
+    return CircuitBreaker(
+        'lookups',
+        failure_threshold=current_app.config[
+            'TWILIO_LOOKUPS_FAILURE_THRESHOLD'],
+        reset_timeout=current_app.config['TWILIO_LOOKUPS_RESET_TIMEOUT'])
@@ -0,0 +1,57 @@
+from flask import request
+from threading import Lock
+from time import time
+
+import json
+
+
+class WebhookCapture(object):
+    """
+    Appends each webhook we receive, and how we answered it, to a JSON lines
+    file. We never store request headers, so Twilio's signatures (and any
+    cookies) stay out of the log.
+    """
+
+    def __init__(self, path, paths):
+        self.path = path
+        self.paths = set(paths)
+        self.lock = Lock()
+
+    def record(self, start, response):
+        entry = {
+            'time': start,
+            'method': request.method,
+            'path': request.path,
+            'query': request.args.to_dict(flat=False),
+            'form': request.form.to_dict(flat=False),
+            'status': response.status_code,
+            'elapsed_ms': round((time() - start) * 1000, 3),
+            'response': None if response.direct_passthrough else
+            response.get_data(as_text=True),
+        }
+        line = json.dumps(entry, sort_keys=True) + '\n'
+
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+def init_app(app):
+    """Captures webhooks to an app, if WEBHOOK_CAPTURE_FILE is set"""
+    if not app.config['WEBHOOK_CAPTURE_FILE']:
+        return
+
+    capture = WebhookCapture(app.config['WEBHOOK_CAPTURE_FILE'],
+                             app.config['WEBHOOK_CAPTURE_PATHS'])
+
+    @app.before_request
+    def start_capture():
+        if request.path in capture.paths:
+            request.environ['capture.start'] = time()
+
+    @app.after_request
+    def record_capture(response):
+        start = request.environ.get('capture.start')
+        if start is not None:
+            capture.record(start, response)
+        return response
@@ -0,0 +1,52 @@
+from flask import current_app
+from time import sleep
+
+from . import db, tracing
+from .deliveries import get_status_callback_url
+from .senders import get_sender_pool
+from .templating import render_reply
+from .utils import get_twilio_rest_client, look_up_number
+
+
+def resolve_mailbox_carrier(phone_number):
+    """
+    Looks up the carrier for a new Mailbox and saves it. If it turns out
+    we don't support that carrier, lets our user know and deletes the Mailbox
+    """
+    from .models import Mailbox
+
+    lookup_info = look_up_number(phone_number)
+
+    # The request which created the Mailbox might not have committed it yet
+    for attempt in range(current_app.config['CARRIER_WORKER_ATTEMPTS']):
+        mailbox = Mailbox.query.filter_by(phone_number=phone_number).first()
+        if mailbox is not None:
+            break
+        sleep(current_app.config['CARRIER_WORKER_RETRY_DELAY'])
+    else:
+        return
+
+    if lookup_info is None:
+        # We'll try again when we need the carrier in the setup process
+        return
+
+    mailbox.carrier = lookup_info.carrier['name']
+
+    if mailbox.is_carrier_supported():
+        db.session.add(mailbox)
+    else:
+        db.session.delete(mailbox)
+
+        from_number, _ = get_sender_pool().acquire(phone_number)
+
+        client = get_twilio_rest_client()
+        with tracing.span('twilio.messages.create', from_number=from_number):
+            client.messages.create(
+                body=render_reply('setup/unsupported_carrier.txt',
+                                  carrier=mailbox.carrier),
+                to=phone_number,
+                from_=from_number,
+                status_callback=get_status_callback_url()
+            )
+
+    db.session.commit()
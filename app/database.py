@@ -0,0 +1,201 @@
+from flask import g, has_app_context
+from flask.ext.sqlalchemy import SignallingSession
+from sqlalchemy import event, exc, select
+from time import time
+
+from . import db, metrics, tracing
+from .deadlines import DeadlineExceeded, remaining
+
+
+def _connection_options(dialect_name, statement_timeout):
+    """
+    Returns a listener which applies our per-connection settings whenever the
+    pool opens a new connection
+    """
+    def set_connection_options(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+
+        if dialect_name == 'sqlite':
+            # WAL lets readers carry on while someone else is writing, and
+            # synchronous=NORMAL is safe in WAL mode while skipping most fsyncs
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute('PRAGMA temp_store=MEMORY')
+            cursor.execute('PRAGMA busy_timeout={0}'.format(
+                statement_timeout))
+        elif dialect_name == 'postgresql':
+            cursor.execute('SET statement_timeout = {0}'.format(
+                statement_timeout))
+
+        cursor.close()
+
+        if dialect_name == 'postgresql':
+            # psycopg2 opened a transaction for our SET, and the first
+            # rollback (which ends most read-only requests) would undo it
+            dbapi_connection.commit()
+
+    return set_connection_options
+
+
+def _deadline_timeout(dialect_name, statement_timeout):
+    """
+    Returns a listener which refuses to start a query once our request's
+    deadline has passed, and otherwise limits it to the time we have left
+    """
+    def set_deadline_timeout(conn, cursor, statement, parameters, context,
+                             executemany):
+        timeout = statement_timeout
+
+        left = remaining()
+        if left is not None:
+            if left <= 0:
+                metrics.increment('deadline.exceeded')
+                raise DeadlineExceeded()
+            timeout = max(1, min(statement_timeout, int(left * 1000)))
+
+        # Only spend a round trip when the limit needs to change, which is
+        # just near the end of a request's budget (and the query after)
+        if conn.info.get('statement_timeout', statement_timeout) != timeout:
+            if dialect_name == 'sqlite':
+                cursor.execute('PRAGMA busy_timeout={0}'.format(timeout))
+            elif dialect_name == 'postgresql':
+                # SET LOCAL ends with the transaction, so a lowered limit
+                # can't outlive its request (a plain SET would be undone by
+                # a rollback, leaving conn.info wrong)
+                cursor.execute(
+                    'SET LOCAL statement_timeout = {0}'.format(timeout))
+            conn.info['statement_timeout'] = timeout
+
+    return set_deadline_timeout
+
+
+def _forget_statement_timeout(conn):
+    """
+    Postgres puts the connection's own statement_timeout back at the end of
+    each transaction, undoing our SET LOCAL
+    """
+    conn.info.pop('statement_timeout', None)
+
+
+def _forget_pooled_statement_timeout(dbapi_connection, connection_record):
+    """The same, for the rollback when a connection goes back to the pool"""
+    connection_record.info.pop('statement_timeout', None)
+
+
+def _ping_connection(connection, branch):
+    """
+    Makes sure a pooled connection is still alive before we use it, so a
+    database restart doesn't show up as an error on our next webhook
+    """
+    if branch:
+        # "Branches" share their parent's connection, which we already checked
+        return
+
+    # Don't let the ping close a connection opened for a single statement
+    save_should_close_with_result = connection.should_close_with_result
+    connection.should_close_with_result = False
+
+    # The ping isn't one of the request's queries, so don't count it
+    connection.info['pinging'] = True
+
+    try:
+        connection.scalar(select([1]))
+    except exc.DBAPIError as err:
+        # If the connection was invalidated, try once more - the pool will
+        # hand us a fresh connection
+        if err.connection_invalidated:
+            connection.scalar(select([1]))
+        else:
+            raise
+    finally:
+        connection.should_close_with_result = save_should_close_with_result
+        connection.info.pop('pinging', None)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    """Counts the queries run during each request"""
+    if has_app_context() and not conn.info.get('pinging'):
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context,
+                       executemany):
+    conn.info['query_start'] = time()
+
+
+def _trace_query(conn, cursor, statement, parameters, context, executemany):
+    """Records each query as a span in the current trace"""
+    start = conn.info.pop('query_start', None)
+    if start is not None:
+        tracing.record_span('db.query', start, time(),
+                            statement=statement.split(None, 1)[0])
+
+
+def _mark_writes(session, *args):
+    """Remembers that this session has sent writes to the database"""
+    session.info['has_writes'] = True
+
+
+def _mark_bulk_writes(query_context):
+    """Remembers that this session ran a bulk UPDATE or DELETE"""
+    _mark_writes(query_context.session)
+
+
+def commit_if_needed(response_or_exc):
+    """
+    Commits the session at the end of each request, but only if something
+    was actually written. Read-only requests (like most calls to /call) end
+    with a cheap rollback instead of a write transaction.
+    """
+    query_count = g.get('query_count', 0)
+    if query_count:
+        metrics.increment('db.queries', query_count)
+
+    # Don't create a session just to find out there's nothing in it
+    if not db.session.registry.has():
+        return
+
+    session = db.session()
+    has_writes = session.new or session.dirty or session.deleted or \
+        session.info.get('has_writes')
+
+    if response_or_exc is None and has_writes:
+        session.commit()
+        metrics.increment('db.commits')
+    elif response_or_exc is None and query_count:
+        metrics.increment('db.commits_skipped')
+
+
+def init_app(app):
+    """Tunes our SQLAlchemy engine and session handling for this app"""
+    engine = db.get_engine(app)
+
+    event.listen(engine, 'connect', _connection_options(
+        engine.dialect.name, app.config['DATABASE_STATEMENT_TIMEOUT']))
+    event.listen(engine, 'before_cursor_execute', _count_query)
+
+    if app.config['REQUEST_DEADLINE']:
+        event.listen(engine, 'before_cursor_execute', _deadline_timeout(
+            engine.dialect.name, app.config['DATABASE_STATEMENT_TIMEOUT']))
+
+        if engine.dialect.name == 'postgresql':
+            event.listen(engine, 'commit', _forget_statement_timeout)
+            event.listen(engine, 'rollback', _forget_statement_timeout)
+            event.listen(engine, 'reset', _forget_pooled_statement_timeout)
+
+    if app.config['TRACE_FILE']:
+        event.listen(engine, 'before_cursor_execute', _start_query_timer)
+        event.listen(engine, 'after_cursor_execute', _trace_query)
+
+    if app.config['DATABASE_PRE_PING']:
+        event.listen(engine, 'engine_connect', _ping_connection)
+
+    # Flask-SQLAlchemy removes the session in its own teardown function,
+    # which runs after this one because it was registered first
+    app.teardown_appcontext(commit_if_needed)
+
+
+# Session-level events only need to be registered once per process
+event.listen(SignallingSession, 'after_flush', _mark_writes)
+event.listen(SignallingSession, 'after_bulk_update', _mark_bulk_writes)
+event.listen(SignallingSession, 'after_bulk_delete', _mark_bulk_writes)
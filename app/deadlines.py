@@ -0,0 +1,77 @@
+from flask import current_app, g, has_app_context
+from time import time
+
+from . import metrics
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of starting a call we no longer have time for"""
+
+
+def remaining():
+    """
+    Seconds left before this request's deadline, or None if there isn't one
+    (like in a background thread)
+    """
+    if not has_app_context():
+        return None
+
+    deadline = g.get('deadline')
+    if deadline is None:
+        return None
+    return deadline - time()
+
+
+def has_time(seconds=None):
+    """
+    Checks there's enough of our budget left for an optional step, which
+    takes at least DEADLINE_MIN_STEP seconds unless we say otherwise
+    """
+    if seconds is None:
+        seconds = current_app.config['DEADLINE_MIN_STEP']
+
+    left = remaining()
+    return left is None or left >= seconds
+
+
+def get_timeout(default):
+    """
+    The timeout for an outbound call: default, or whatever's left of our
+    budget if that's less. Raises DeadlineExceeded if there's nothing left
+    """
+    left = remaining()
+    if left is None:
+        return default
+
+    if left <= 0:
+        metrics.increment('deadline.exceeded')
+        raise DeadlineExceeded()
+
+    return left if default is None else min(default, left)
+
+
+def until_deadline(items):
+    """
+    Yields items (like the lines of a download) while there's time left to
+    answer, and raises DeadlineExceeded once there isn't
+    """
+    for item in items:
+        if not has_time():
+            metrics.increment('deadline.exceeded')
+            raise DeadlineExceeded()
+        yield item
+
+
+def init_app(app):
+    """Gives each request to an app REQUEST_DEADLINE seconds to answer"""
+    if not app.config['REQUEST_DEADLINE']:
+        return
+
+    @app.before_request
+    def start_deadline():
+        g.deadline = time() + app.config['REQUEST_DEADLINE']
+
+    @app.teardown_request
+    def end_deadline(exc):
+        # The app context (and g) can outlive the request, like in tests
+        g.deadline = None
@@ -1,7 +1,13 @@
 from flask import abort, current_app, request
 from functools import wraps
+from time import time
+from twilio import twiml
 from twilio.util import RequestValidator
 
+from . import metrics
+from .admission import get_admission_controller, get_queue_time
+from .blocklist import is_blocked
+
 
 def validate_twilio_request(f):
     """Validates that incoming requests genuinely originated from Twilio"""
@@ -26,3 +32,50 @@ def validate_twilio_request(f):
         else:
             return abort(403)
     return decorated_function
+
+
+def reject_blocked_callers(f):
+    """
+    Rejects calls from numbers on our blocklist before we do any other work
+    for them (like looking them up, or loading our Mailbox)
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if is_blocked(request.form.get('From', '')):
+            metrics.increment('blocklist.rejected')
+
+            resp = twiml.Response()
+            resp.reject()
+            return str(resp)
+
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def shed_load(degraded_view):
+    """
+    Answers requests with degraded_view instead when we're overloaded, so
+    they don't queue up behind slow requests until Twilio gives up on them
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_app.config['ADMISSION_CONTROL']:
+                return f(*args, **kwargs)
+
+            controller = get_admission_controller()
+            reason = controller.admit(get_queue_time())
+
+            if reason is not None:
+                metrics.increment('admission.shed')
+                metrics.increment('admission.shed.' + reason)
+                return degraded_view()
+
+            metrics.increment('admission.admitted')
+            start = time()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                controller.release(time() - start)
+        return decorated_function
+    return decorator
@@ -0,0 +1,208 @@
+from datetime import datetime
+from flask import current_app, has_request_context, url_for
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import IntegrityError
+from threading import Event, Lock, Thread
+
+import os
+
+from . import db, metrics
+
+
+# How far along a message is. Twilio's callbacks can arrive out of order, so
+# we never let a status replace one further along (like 'sent' after
+# 'delivered'). Statuses we don't know rank lowest
+STATUS_RANKS = {
+    'accepted': 1,
+    'queued': 2,
+    'sending': 3,
+    'sent': 4,
+    'delivered': 5,
+    'undelivered': 5,
+    'failed': 5,
+    'read': 6,
+}
+
+# SQLite can't take more than 999 parameters in one statement
+WRITE_CHUNK_SIZE = 500
+
+
+def _rank(status):
+    return STATUS_RANKS.get(status, 0)
+
+
+class MessageStatus(db.Model):
+    """The latest delivery status Twilio gave us for one of our messages"""
+    __tablename__ = 'message_status'
+
+    sid = db.Column(db.String(34), primary_key=True)
+    status = db.Column(db.String(20), nullable=False)
+    error_code = db.Column(db.Integer)
+    to = db.Column(db.String(20))
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+
+class StatusBuffer(object):
+    """
+    Collects Twilio's message status callbacks in memory, keeping only the
+    furthest-along status for each message. A background thread writes
+    them to the database STATUS_BATCH_SIZE at a time, or every
+    STATUS_FLUSH_INTERVAL seconds - one transaction for a whole batch.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = Lock()
+        self.pending = {}
+        self.wakeup = Event()
+        self.thread = None
+        self.pid = None
+
+    def _ensure_started(self):
+        """Starts our thread if it isn't running in this process yet"""
+        with self.lock:
+            # Threads don't survive a fork, so each gunicorn worker needs to
+            # start its own (and forget its parent's pending statuses)
+            if self.pid != os.getpid():
+                self.pending = {}
+                self.pid = os.getpid()
+                self.thread = None
+
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def _merge(self, sid, update):
+        """Keeps update for sid, unless we already have a later status"""
+        current = self.pending.get(sid)
+
+        if current is None or _rank(update[0]) >= _rank(current[0]):
+            self.pending[sid] = update
+        return current is not None
+
+    def add(self, sid, status, error_code=None, to=None):
+        """Buffers a status callback, to be written in the next batch"""
+        self._ensure_started()
+
+        with self.lock:
+            coalesced = self._merge(
+                sid, (status, error_code, to, datetime.utcnow()))
+            full = len(self.pending) >= \
+                self.app.config['STATUS_BATCH_SIZE']
+
+        metrics.increment('statuses.received')
+        if coalesced:
+            metrics.increment('statuses.coalesced')
+
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """Writes every buffered status. Returns how many we wrote"""
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+
+        if not pending:
+            return 0
+
+        try:
+            try:
+                write_statuses(pending)
+            except IntegrityError:
+                # Another worker inserted one of our messages first - now
+                # it's there, we'll update it instead
+                write_statuses(pending)
+        except Exception:
+            # Keep them for our next flush, unless newer statuses came in
+            with self.lock:
+                for sid, update in pending.items():
+                    if sid not in self.pending:
+                        self.pending[sid] = update
+                    else:
+                        self._merge(sid, update)
+            raise
+
+        return len(pending)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.app.config['STATUS_FLUSH_INTERVAL'])
+            self.wakeup.clear()
+
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                self.app.logger.exception('Writing message statuses failed')
+
+
+def _write_chunk(connection, chunk):
+    table = MessageStatus.__table__
+
+    existing = dict(connection.execute(
+        select([table.c.sid, table.c.status])
+        .where(table.c.sid.in_(list(chunk)))).fetchall())
+
+    inserts, updates = [], []
+    for sid, (status, error_code, to, updated_at) in chunk.items():
+        row = {'status': status, 'error_code': error_code, 'to': to,
+               'updated_at': updated_at}
+
+        if sid not in existing:
+            row['sid'] = sid
+            inserts.append(row)
+        elif _rank(status) >= _rank(existing[sid]):
+            row['message_sid'] = sid
+            updates.append(row)
+
+    if inserts:
+        connection.execute(table.insert(), inserts)
+    if updates:
+        connection.execute(
+            table.update()
+            .where(table.c.sid == bindparam('message_sid'))
+            .values(status=bindparam('status'),
+                    error_code=bindparam('error_code'),
+                    to=bindparam('to'),
+                    updated_at=bindparam('updated_at')),
+            updates)
+
+    return len(inserts) + len(updates)
+
+
+def write_statuses(pending):
+    """
+    Writes a dict of {sid: (status, error_code, to, updated_at)} in one
+    transaction, with a few bulk statements rather than one per message
+    """
+    sids = list(pending)
+    written = 0
+
+    with db.engine.begin() as connection:
+        for i in range(0, len(sids), WRITE_CHUNK_SIZE):
+            chunk = dict((sid, pending[sid])
+                         for sid in sids[i:i + WRITE_CHUNK_SIZE])
+            written += _write_chunk(connection, chunk)
+
+    metrics.increment('statuses.written', written)
+    for status, _, _, _ in pending.values():
+        if _rank(status) == STATUS_RANKS['delivered']:
+            metrics.increment('statuses.' + status)
+
+
+def get_status_callback_url():
+    """
+    Where Twilio should send the statuses of messages we send. Background
+    threads have no request to build it from, so they use the URL from the
+    last request which did
+    """
+    if not current_app.config['MESSAGE_STATUS_CALLBACKS']:
+        return None
+
+    if has_request_context() or current_app.config['SERVER_NAME']:
+        url = url_for('setup.message_status', _external=True)
+        current_app.extensions['status_callback_url'] = url
+        return url
+
+    return current_app.extensions.get('status_callback_url')
@@ -0,0 +1,87 @@
+from collections import deque, namedtuple
+from threading import Lock
+
+import itertools
+
+
+# A stand-in for Twilio's REST and Lookups APIs, used when
+# TWILIO_FAKE_BACKEND is set (like when replaying captured webhooks). It
+# answers instantly and deterministically, and never touches the network.
+
+FakeMessage = namedtuple('FakeMessage', ['sid', 'body', 'to', 'from_',
+                                         'media_url'])
+FakeNumberInfo = namedtuple('FakeNumberInfo', ['phone_number', 'carrier'])
+
+
+class FakeMessages(object):
+    def __init__(self):
+        self.lock = Lock()
+        self.sent = deque(maxlen=1000)
+        self.counter = itertools.count(1)
+
+    def create(self, body=None, to=None, from_=None, media_url=None,
+               **kwargs):
+        with self.lock:
+            message = FakeMessage('SM{0:032d}'.format(next(self.counter)),
+                                  body, to, from_, media_url)
+            self.sent.append(message)
+        return message
+
+
+class FakePhoneNumber(object):
+    def __init__(self, phone_number):
+        self.phone_number = phone_number
+        self.voice_url = self.sms_url = None
+        self.voice_fallback_url = self.sms_fallback_url = None
+
+    def update(self, **kwargs):
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+class FakePhoneNumbers(object):
+    def __init__(self):
+        self.numbers = {}
+
+    def list(self, phone_number=None):
+        # Any number we're asked about is one of ours
+        if phone_number is None:
+            return list(self.numbers.values())
+        return [self.numbers.setdefault(phone_number,
+                                        FakePhoneNumber(phone_number))]
+
+
+class FakeTwilioRestClient(object):
+    """Just enough of TwilioRestClient for our views and models"""
+
+    def __init__(self):
+        self.messages = FakeMessages()
+        self.phone_numbers = FakePhoneNumbers()
+
+
+class FakeLookups(object):
+    def get(self, phone_number, include_carrier_info=False):
+        # Numbers ending in an even digit are mobiles, the rest landlines
+        if int(phone_number[-1]) % 2 == 0:
+            carrier = {'type': 'mobile', 'name': 'Fake Wireless',
+                       'mobile_country_code': None,
+                       'mobile_network_code': None, 'error_code': None}
+        else:
+            carrier = {'type': 'landline', 'name': 'Fake Telephone',
+                       'mobile_country_code': None,
+                       'mobile_network_code': None, 'error_code': None}
+
+        return FakeNumberInfo(phone_number, carrier)
+
+
+class FakeLookupsClient(object):
+    """Just enough of TwilioLookupsClient for look_up_number()"""
+
+    def __init__(self):
+        self.phone_numbers = FakeLookups()
+
+
+# The fake backend keeps its state (like the messages we've "sent") for the
+# life of the process, just like the real one would
+rest_client = FakeTwilioRestClient()
+lookups_client = FakeLookupsClient()
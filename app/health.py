@@ -0,0 +1,111 @@
+from flask import current_app
+from threading import Lock
+from time import time
+
+import os
+
+from . import db
+
+
+class DatabaseProbe(object):
+    """
+    Checks we can reach the database, at most once every interval seconds.
+
+    Health checks in between (and any which arrive while another thread is
+    probing) get the last result, so a busy load balancer can't turn into a
+    busy database.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = Lock()
+        self.ok = None
+        self.error = None
+        self.checked_at = None
+
+    def _probe(self):
+        try:
+            db.engine.execute('SELECT 1').close()
+        except Exception as e:
+            self.ok, self.error = False, repr(e)
+        else:
+            self.ok, self.error = True, None
+        self.checked_at = time()
+
+    def check(self):
+        """Returns whether the database was reachable when we last checked"""
+        if self.checked_at is not None and \
+                time() - self.checked_at < self.interval:
+            return self.ok
+
+        # Only one thread probes - the rest answer with the last result
+        if self.lock.acquire(blocking=self.checked_at is None):
+            try:
+                self._probe()
+            finally:
+                self.lock.release()
+
+        return self.ok
+
+    def to_dict(self):
+        return {
+            'ok': self.ok,
+            'error': self.error,
+            'age': None if self.checked_at is None else
+            round(time() - self.checked_at, 3),
+        }
+
+
+def get_database_probe():
+    """Returns this process's DatabaseProbe"""
+    probe = current_app.extensions.get('health')
+
+    if probe is None:
+        probe = current_app.extensions.setdefault(
+            'health', DatabaseProbe(
+                current_app.config['HEALTH_DB_PROBE_INTERVAL']))
+
+    return probe
+
+
+def _threads_running(pid, threads):
+    return pid == os.getpid() and any(t.is_alive() for t in threads)
+
+
+def get_outbox_state():
+    """
+    How much background work (jobs, emails and delivery statuses) this
+    process has queued
+    """
+    worker = current_app.worker
+    mailer = current_app.mailer
+    deliveries = current_app.deliveries
+
+    return {
+        'jobs': {
+            'queued': worker.queue.qsize(),
+            'running': _threads_running(
+                worker.pid, [worker.thread] if worker.thread else []),
+        },
+        'emails': {
+            'queued': mailer.queue.qsize(),
+            'running': _threads_running(mailer.pid, mailer.threads),
+        },
+        'statuses': {
+            'queued': len(deliveries.pending),
+            'running': _threads_running(
+                deliveries.pid,
+                [deliveries.thread] if deliveries.thread else []),
+        },
+    }
+
+
+def get_cache_state():
+    """Whether our app cache answers, without writing to it"""
+    try:
+        current_app.cache.get('health:ping')
+    except Exception as e:
+        return {'backend': type(current_app.cache).__name__, 'ok': False,
+                'error': repr(e)}
+
+    return {'backend': type(current_app.cache).__name__, 'ok': True}
@@ -0,0 +1,130 @@
+from array import array
+from bisect import bisect_left
+from flask import current_app
+from phonenumbers import PhoneNumberType
+from phonenumbers.carrierdata import CARRIER_DATA, CARRIER_LONGEST_PREFIX
+from threading import Lock
+
+import phonenumbers
+
+from . import metrics
+from .utils import CachedLookup
+
+
+# How the number types phonenumbers knows about map onto Twilio Lookups'
+# carrier types. Anything not in here (most importantly NANP's
+# FIXED_LINE_OR_MOBILE) is ambiguous, and needs a real lookup
+LINE_TYPES = {
+    PhoneNumberType.MOBILE: 'mobile',
+    PhoneNumberType.FIXED_LINE: 'landline',
+    PhoneNumberType.VOIP: 'voip',
+}
+
+
+class CarrierPrefixIndex(object):
+    """
+    Maps phone number prefixes to the carrier they were allocated to.
+
+    phonenumbers keeps its carrier data as a dict of dicts with one entry
+    per prefix. We pack the prefixes into a sorted array of integers with a
+    parallel array of indexes into a de-duplicated list of names, which
+    takes a fraction of the memory and is searched with bisect.
+    """
+
+    def __init__(self, carrier_data, longest_prefix, lang='en'):
+        self.longest_prefix = longest_prefix
+
+        names = {}
+        entries = []
+        for prefix, descriptions in carrier_data.items():
+            name = descriptions.get(lang) or \
+                next(iter(descriptions.values()), '')
+            if name:
+                entries.append((int(prefix), names.setdefault(
+                    name, len(names))))
+
+        entries.sort()
+
+        self.prefixes = array('Q', (prefix for prefix, _ in entries))
+        self.name_ids = array('H', (name_id for _, name_id in entries))
+        self.names = sorted(names, key=names.get)
+
+    def __len__(self):
+        return len(self.prefixes)
+
+    def _find(self, prefix):
+        i = bisect_left(self.prefixes, prefix)
+        if i < len(self.prefixes) and self.prefixes[i] == prefix:
+            return self.names[self.name_ids[i]]
+
+    def carrier_for(self, e164_number):
+        """Returns the carrier for the longest matching prefix, or None"""
+        digits = e164_number.lstrip('+')
+
+        for length in range(min(self.longest_prefix, len(digits)), 0, -1):
+            name = self._find(int(digits[:length]))
+            if name is not None:
+                return name
+
+
+_index = None
+_index_lock = Lock()
+
+
+def get_carrier_index():
+    """Returns our CarrierPrefixIndex, building it the first time"""
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CarrierPrefixIndex(CARRIER_DATA,
+                                            CARRIER_LONGEST_PREFIX)
+
+    return _index
+
+
+def classify_number(phone_number):
+    """
+    Works out a phone number's line type and carrier without any API calls,
+    returning a CachedLookup shaped like look_up_number's results.
+
+    Returns None if the number's type is ambiguous - callers should fall
+    back to look_up_number() then.
+    """
+    if not current_app.config['OFFLINE_LINE_TYPES']:
+        return None
+
+    try:
+        number = phonenumbers.parse(phone_number)
+    except phonenumbers.NumberParseException:
+        number = None
+
+    line_type = None
+    if number is not None and phonenumbers.is_valid_number(number):
+        line_type = LINE_TYPES.get(phonenumbers.number_type(number))
+
+    carrier_name = None
+    if line_type is not None:
+        carrier_name = get_carrier_index().carrier_for(phone_number)
+
+    # We only trust a mobile classification if we also know the carrier,
+    # since that's what incoming_call needs
+    if line_type is None or (line_type == 'mobile' and not carrier_name):
+        metrics.increment('linetype.ambiguous')
+        return None
+
+    metrics.increment('linetype.offline')
+    return CachedLookup(phone_number,
+                        {'type': line_type, 'name': carrier_name})
+
+
+def get_hit_ratio(counters):
+    """The share of numbers we classified without calling Lookups"""
+    offline = counters.get('linetype.offline') or 0
+    ambiguous = counters.get('linetype.ambiguous') or 0
+
+    if offline + ambiguous == 0:
+        return None
+
+    return offline / (offline + ambiguous)
@@ -0,0 +1,187 @@
+from contextlib import contextmanager
+from email.mime.text import MIMEText
+from queue import Empty, LifoQueue, Queue
+from threading import Lock, Thread
+from time import time
+
+import os
+import smtplib
+
+from . import metrics, tracing
+
+
+class SMTPPool(object):
+    """
+    Keeps SMTP sessions open between emails, so we only pay for the TCP,
+    TLS and AUTH handshakes when we need a new session.
+    """
+
+    def __init__(self, host, port, username=None, password=None,
+                 use_tls=False, size=2, timeout=10, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+
+        # Each idle session is stored with the time it was last used. A LIFO
+        # queue hands out the most recently used (and most likely to still
+        # be open) session first
+        self.idle = LifoQueue(maxsize=size)
+
+    def _connect(self):
+        session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        if self.use_tls:
+            session.starttls()
+        if self.username:
+            session.login(self.username, self.password)
+
+        metrics.increment('mail.connections')
+        return session
+
+    def _close(self, session):
+        try:
+            session.quit()
+        except (smtplib.SMTPException, OSError):
+            session.close()
+
+    def _checkout(self):
+        while True:
+            try:
+                session, last_used = self.idle.get_nowait()
+            except Empty:
+                return self._connect()
+
+            # Servers drop idle sessions, so don't bother with stale ones
+            if time() - last_used < self.idle_timeout:
+                return session
+
+            self._close(session)
+
+    @contextmanager
+    def session(self):
+        """
+        Lends out an SMTP session. Sessions which raise an error are thrown
+        away instead of going back in the pool
+        """
+        session = self._checkout()
+
+        try:
+            yield session
+        except Exception:
+            session.close()
+            raise
+
+        try:
+            self.idle.put_nowait((session, time()))
+        except Exception:
+            self._close(session)
+
+    def close(self):
+        """Closes every idle session"""
+        while True:
+            try:
+                session, _ = self.idle.get_nowait()
+            except Empty:
+                return
+            self._close(session)
+
+
+class Mailer(object):
+    """
+    Sends emails from background threads over an SMTPPool. Each thread
+    takes up to MAIL_BATCH_SIZE queued emails at a time and sends them back
+    to back over a single session.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.queue = Queue()
+        self.lock = Lock()
+        self.threads = []
+        self.pool = None
+        self.pid = None
+
+    def _ensure_started(self):
+        """Starts our threads if they aren't running in this process yet"""
+        config = self.app.config
+
+        with self.lock:
+            # Threads (and SMTP sessions) don't survive a fork, so each
+            # gunicorn worker needs its own
+            if self.pid != os.getpid():
+                self.pool = SMTPPool(
+                    config['MAIL_SERVER'], config['MAIL_PORT'],
+                    username=config['MAIL_USERNAME'],
+                    password=config['MAIL_PASSWORD'],
+                    use_tls=config['MAIL_USE_TLS'],
+                    size=config['MAIL_POOL_SIZE'],
+                    timeout=config['MAIL_TIMEOUT'],
+                    idle_timeout=config['MAIL_IDLE_TIMEOUT'])
+                self.threads = []
+                self.pid = os.getpid()
+
+            self.threads = [t for t in self.threads if t.is_alive()]
+            while len(self.threads) < config['MAIL_POOL_SIZE']:
+                thread = Thread(target=self._run, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+
+        while len(batch) < self.app.config['MAIL_BATCH_SIZE']:
+            try:
+                batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+
+        return batch
+
+    def _send_batch(self, pending):
+        """Sends emails over one session, removing each one once it's sent"""
+        with self.pool.session() as session:
+            while pending:
+                message, trace_context = pending[0]
+                with tracing.continue_trace(trace_context, 'mail.send'):
+                    session.send_message(message)
+                pending.pop(0)
+                metrics.increment('mail.sent')
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            pending = list(batch)
+
+            try:
+                with self.app.app_context():
+                    try:
+                        self._send_batch(pending)
+                    except smtplib.SMTPServerDisconnected:
+                        # Our pooled session went away under us - send
+                        # whatever's left on a fresh one
+                        self._send_batch(pending)
+            except Exception:
+                with self.app.app_context():
+                    metrics.increment('mail.failed', len(pending))
+                self.app.logger.exception('Sending email failed')
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def send(self, to, subject, body):
+        """Queues a plain text email to be sent in the background"""
+        message = MIMEText(body)
+        message['Subject'] = subject
+        message['From'] = self.app.config['MAIL_DEFAULT_SENDER']
+        message['To'] = to
+
+        self._ensure_started()
+        self.queue.put((message, tracing.current_context()))
+
+    def join(self):
+        """Waits until every queued email has been sent (or failed)"""
+        self.queue.join()
@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from flask import current_app
+from threading import Lock
+from time import time
+
+
+# All metrics live in the app cache so every worker reports the same numbers
+METRICS_PREFIX = 'metrics:'
+METRIC_NAMES_KEY = 'metrics:names'
+
+
+class MetricsBuffer(object):
+    """
+    Collects counter increments in this process so we only write them to
+    the app cache every METRICS_FLUSH_INTERVAL seconds, rather than on
+    every increment
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.pending = {}
+        self.last_flush = time()
+
+
+def _get_buffer():
+    return current_app.extensions.setdefault('metrics', MetricsBuffer())
+
+
+def _register(names):
+    """Remembers metric names so get_metrics() can find them later"""
+    known_names = current_app.cache.get(METRIC_NAMES_KEY) or set()
+
+    if not known_names.issuperset(names):
+        current_app.cache.set(METRIC_NAMES_KEY, known_names | set(names),
+                              timeout=0)
+
+
+def flush():
+    """Adds this process's pending increments to the shared counters"""
+    buffer = _get_buffer()
+
+    with buffer.lock:
+        pending = buffer.pending
+        buffer.pending = {}
+        buffer.last_flush = time()
+
+    for name, delta in pending.items():
+        key = METRICS_PREFIX + name
+        value = (current_app.cache.get(key) or 0) + delta
+
+        # A timeout of 0 keeps the counter around until the cache is cleared
+        current_app.cache.set(key, value, timeout=0)
+
+    if pending:
+        _register(pending)
+
+
+def increment(name, delta=1):
+    """Increments a counter, creating it if it doesn't exist yet"""
+    buffer = _get_buffer()
+
+    with buffer.lock:
+        buffer.pending[name] = buffer.pending.get(name, 0) + delta
+
+    if time() - buffer.last_flush >= \
+            current_app.config['METRICS_FLUSH_INTERVAL']:
+        flush()
+
+
+def record_time(name, seconds):
+    """Adds one timed event to the name.count and name.ms counters"""
+    increment(name + '.count')
+    increment(name + '.ms', seconds * 1000)
+
+
+@contextmanager
+def timer(name):
+    """Times the code inside a with block - see record_time()"""
+    start = time()
+    yield
+    record_time(name, time() - start)
+
+
+def set_gauge(name, value):
+    """Records a value which goes up and down, like a circuit breaker state"""
+    current_app.cache.set(METRICS_PREFIX + name, value, timeout=0)
+    _register([name])
+
+
+def get_metrics():
+    """Returns a dict of every metric recorded so far"""
+    flush()
+
+    names = sorted(current_app.cache.get(METRIC_NAMES_KEY) or set())
+    values = current_app.cache.get_many(
+        *[METRICS_PREFIX + name for name in names])
+
+    return dict(zip(names, values))
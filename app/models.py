@@ -1,13 +1,27 @@
+from datetime import datetime
 from flask import current_app, render_template, url_for
+from sqlalchemy import event
+from sqlalchemy.orm import validates
 from threading import Thread
 
 import json
 import phonenumbers
-import qrcode
 import requests
 
-from . import db
-from .utils import get_twilio_rest_client, look_up_number, send_async_message
+from . import db, tracing
+from .analytics import record_event
+from .deadlines import get_timeout
+from .deliveries import get_status_callback_url
+from .payload import PAYLOAD_PREFIX, decode_mailbox, encode_mailbox
+from .qrimage import render_qr_code
+from .recordings import archive_recording, get_recording_url
+from .schedules import compile_schedule, get_action, get_timezone
+from .senders import get_sender_pool
+from .templating import render_reply, render_truncated_reply
+from .utils import get_cached_carrier, get_twilio_rest_client, \
+    look_up_number, send_async_message
+from .whitelist import compile_rules, is_rule, match_rules, \
+    normalize_numbers, parse_rule
 
 
 # Star codes (used in initial setup)
@@ -32,6 +46,14 @@ STAR_CODES = {
 }
 
 
+def _whitelist_version(whitelist):
+    return hash(frozenset(whitelist or ()))
+
+
+def _schedule_version(schedule):
+    return hash(tuple(schedule or ()))
+
+
 class Mailbox(db.Model):
     """Primary model. Stores information about a voicemail box"""
 
@@ -45,14 +67,24 @@ class Mailbox(db.Model):
                                              name='qr_code_enum'))
     whitelist = db.Column(db.PickleType())
 
+    # The whitelist's prefix and range rules, compiled (see app/whitelist.py)
+    whitelist_trie = db.Column(db.PickleType())
+
+    # When to handle calls differently, and those rules compiled into a
+    # weekly interval index (see app/schedules.py)
+    schedule = db.Column(db.PickleType())
+    schedule_index = db.Column(db.PickleType())
+
     def __init__(self, phone_number, id=None, carrier=None, name=None,
                  email=None, call_forwarding_set=None,
-                 feelings_on_qr_codes=None, whitelist=None):
-        # Get the carrier if none was provided
+                 feelings_on_qr_codes=None, whitelist=None, schedule=None):
+        # Use the carrier we've seen for this number before, if none was
+        # provided. Otherwise the carrier stays None until someone calls
+        # resolve_carrier() - usually our CarrierWorker, in the background
         if carrier is None:
-            # Look up the carrier
-            lookup_info = look_up_number(phone_number)
-            carrier = lookup_info.carrier['name']
+            cached_carrier = get_cached_carrier(phone_number)
+            if cached_carrier is not None:
+                carrier = cached_carrier['name']
 
         self.id = id
         self.phone_number = phone_number
@@ -68,9 +100,59 @@ class Mailbox(db.Model):
         else:
             self.whitelist = set(whitelist)
 
+        self.schedule = list(schedule or [])
+
     def __repr__(self):
         return '<Mailbox %r>' % self.phone_number
 
+    @validates('whitelist')
+    def compile_whitelist(self, key, whitelist):
+        """Compiles the whitelist's rules whenever it changes"""
+        self.whitelist_trie = compile_rules(whitelist or ())
+        self.whitelist_version = _whitelist_version(whitelist)
+        return whitelist
+
+    @validates('schedule')
+    def index_schedule(self, key, schedule):
+        """Compiles the schedule's rules whenever they change"""
+        if schedule:
+            self.schedule_index = compile_schedule(schedule, get_timezone(
+                self.phone_number, self.get_region_code()))
+        else:
+            self.schedule_index = None
+        self.schedule_version = _schedule_version(schedule)
+        return schedule
+
+    def get_scheduled_action(self):
+        """What our schedule says to do with calls right now"""
+        return get_action(self.schedule_index)
+
+    def is_whitelisted(self, phone_number):
+        """Checks if a caller is on our whitelist, or matches its rules"""
+        return phone_number in self.whitelist or \
+            match_rules(self.whitelist_trie, phone_number)
+
+    @property
+    def version(self):
+        """
+        A value which changes whenever this Mailbox's data does. Used to
+        memoize text messages rendered from this Mailbox
+        """
+        return hash((self.phone_number, self.carrier, self.name, self.email,
+                     self.call_forwarding_set, self.feelings_on_qr_codes,
+                     self.whitelist_version, self.schedule_version))
+
+    def resolve_carrier(self):
+        """Looks up this Mailbox's carrier (if we don't know it already)"""
+        if self.carrier is None:
+            lookup_info = look_up_number(self.phone_number)
+
+            if lookup_info is not None:
+                self.carrier = lookup_info.carrier['name']
+                db.session.add(self)
+
+        return self.carrier
+
     def is_carrier_supported(self):
         """
         Checks that the Mailbox's carrier is in our list of supported carriers.
@@ -99,22 +181,68 @@ class Mailbox(db.Model):
         return phonenumbers.region_code_for_country_code(
             parsed_number.country_code)
 
+    def import_whitelist(self, candidates):
+        """
+        Adds many phone numbers (and rules) to this Mailbox's whitelist in a
+        single write.
+
+        Returns how many new numbers were added and how many of the candidates
+        weren't valid phone numbers.
+        """
+        region_code = self.get_region_code()
+        rules = []
+
+        # One pass over candidates (which can be a streamed file), setting
+        # rules aside as we go
+        def numbers_only():
+            for candidate in candidates:
+                if is_rule(candidate):
+                    rules.append(candidate)
+                else:
+                    yield candidate
+
+        numbers, invalid = normalize_numbers(numbers_only(), region_code)
+
+        for candidate in rules:
+            rule = parse_rule(candidate, region_code)
+            if rule is None:
+                invalid += 1
+            else:
+                numbers.add(rule)
+
+        new_numbers = numbers - self.whitelist
+
+        if new_numbers:
+            # We need to make a new whitelist object to ensure the
+            # PickleType field detects a change
+            self.whitelist = self.whitelist.union(new_numbers)
+            db.session.add(self)
+
+        return len(new_numbers), invalid
+
     def send_contact_info(self, caller_number):
         """Sends a caller some text and email information for this mailbox"""
         # Set an extra variable if the caller is our user
         from_user = caller_number == self.phone_number
 
         # Send contact info for our user to our caller
-        contact_info = render_template(
+        contact_info = render_reply(
             'voice/contact_info.txt', mailbox=self, from_user=from_user,
             voicemail_number=current_app.config['TWILIO_PHONE_NUMBER'])
 
+        # Twilio queues messages past a number's rate limit, so we don't
+        # hold up the call waiting on ours
+        from_number, _ = get_sender_pool().acquire(caller_number)
+
         client = get_twilio_rest_client()
-        client.messages.create(
-            body=contact_info,
-            to=caller_number,
-            from_=current_app.config['TWILIO_PHONE_NUMBER']
-        )
+        with tracing.span('twilio.messages.create', from_number=from_number):
+            client.messages.create(
+                body=contact_info,
+                to=caller_number,
+                from_=from_number,
+                status_callback=get_status_callback_url()
+            )
+        record_event('contact_info.sent')
 
         # If this call is the user trying Anti-voicemail for the first time,
         # update the call_forwarding_set property and ask them about QR codes
@@ -125,36 +253,32 @@ class Mailbox(db.Model):
             # Now ask them the big question
             # (unless we know it already from a previous restore)
             if not self.feelings_on_qr_codes:
-                body = render_template('setup/qr_codes/ask.txt')
+                body = render_reply('setup/qr_codes/ask.txt')
             else:
-                body = render_template('setup/complete.txt')
+                body = render_reply('setup/complete.txt')
 
             app = current_app._get_current_object()
 
             thread = Thread(
-                target=send_async_message, args=[
+                target=tracing.propagate(send_async_message), args=[
                     app, body, caller_number])
             thread.start()
 
     def generate_config_image(self):
         """Generate a QR code which represents this Mailbox"""
-        # Serialize this Mailbox
-        mailbox_dict = self.__dict__.copy()
-        mailbox_dict['call_forwarding_set'] = False
-        mailbox_dict['whitelist'] = list(self.whitelist)
-        del mailbox_dict['_sa_instance_state']
+        # Serialize this Mailbox in our compact format, which keeps the QR
+        # code small (and readable from a photo) even with a long whitelist
+        payload = encode_mailbox(self)
 
-        mailbox_json = json.dumps(mailbox_dict)
-
-        # Make a QR code out of it
-        return qrcode.make(mailbox_json)
+        # Make a QR code out of it, as PNG bytes
+        return render_qr_code(payload)
 
     def send_config_image(self):
         """
         Sends a QR code image to our user which contains the configuration for
         this Mailbox
         """
-        body = render_template('setup/complete.txt')
+        body = render_reply('setup/complete.txt')
         media_url = url_for('setup.config_image', _external=True)
 
         # Send the config image asynchronously to make sure it doesn't arrive
@@ -162,7 +286,7 @@ class Mailbox(db.Model):
         app = current_app._get_current_object()
 
         thread = Thread(
-            target=send_async_message, args=[
+            target=tracing.propagate(send_async_message), args=[
                 app, body, self.phone_number, media_url, 10])
         thread.start()
 
@@ -176,11 +300,17 @@ class Mailbox(db.Model):
             # Read the QR code using api.qrserver.com
             response = requests.get(
                 'https://api.qrserver.com/v1/read-qr-code/',
-                params={'fileurl': config_image_url})
+                params={'fileurl': config_image_url},
+                timeout=get_timeout(current_app.config['MEDIA_TIMEOUT']))
 
             # Get the QR data and convert it to bytes
             serialized = response.json()[0]['symbol'][0]['data']
-            mailbox_dict = json.loads(serialized)
+
+            # Config images made before our compact format hold JSON
+            if serialized.startswith(PAYLOAD_PREFIX):
+                mailbox_dict = decode_mailbox(serialized)
+            else:
+                mailbox_dict = json.loads(serialized)
 
             # Load the serialized data
             mailbox = cls(**mailbox_dict)
@@ -192,20 +322,38 @@ class Mailbox(db.Model):
             db.session.add(mailbox)
 
             # It worked! Let our user know they're good to go
-            return render_template('setup/restore_config.txt', mailbox=mailbox)
+            return render_reply('setup/restore_config.txt', mailbox=mailbox)
 
         except Exception:
             # Something went wrong - this isn't going to work
             return "Ooops! I couldn't read that file after all. Sorry! D:"
 
 
+def _version_loaded_rules(mailbox, context, attrs=None):
+    """
+    Validators don't run when rows are loaded, so version the whitelist and
+    schedule whenever they're loaded (or loaded again after a commit)
+    """
+    loaded = mailbox.__dict__
+    if 'whitelist' in loaded:
+        mailbox.whitelist_version = _whitelist_version(loaded['whitelist'])
+    if 'schedule' in loaded:
+        mailbox.schedule_version = _schedule_version(loaded['schedule'])
+
+
+event.listen(Mailbox, 'load', _version_loaded_rules)
+event.listen(Mailbox, 'refresh', _version_loaded_rules)
+
+
 class Voicemail(object):
     """A simple class to represent a voicemail. Doesn't use a database"""
 
-    def __init__(self, from_number, transcription, recording_sid):
+    def __init__(self, from_number, transcription, recording_sid,
+                 recording_url=None):
         self.from_number = from_number
         self.transcription = transcription
         self.recording_sid = recording_sid
+        self.recording_url = recording_url or get_recording_url(recording_sid)
 
         # Set a mailbox property also, for convenience
         self.mailbox = Mailbox.query.one()
@@ -213,12 +361,44 @@ class Voicemail(object):
     def send_notification(self):
         """Send a SMS about a new voicemail"""
 
-        body = render_template('voice/new_voicemail.txt', voicemail=self)
+        # Long transcriptions get cut short - our user can follow the link to
+        # the recording to hear the rest
+        body = render_truncated_reply(
+            'voice/new_voicemail.txt', 'transcription', self.transcription,
+            current_app.config['SMS_TRANSCRIPTION_SEGMENTS'], voicemail=self)
+
+        # Send the text message from the number our user talks to us on -
+        # our main number, unless they've texted another of ours lately
+        from_number, _ = get_sender_pool().acquire(
+            self.mailbox.phone_number,
+            default=current_app.config['TWILIO_PHONE_NUMBER'])
 
-        # Send the text message
         client = get_twilio_rest_client()
-        client.messages.create(
-            body=body,
-            to=self.mailbox.phone_number,
-            from_=current_app.config['TWILIO_PHONE_NUMBER']
-        )
+        with tracing.span('twilio.messages.create', from_number=from_number):
+            client.messages.create(
+                body=body,
+                to=self.mailbox.phone_number,
+                from_=from_number,
+                status_callback=get_status_callback_url()
+            )
+        record_event('voicemail.received')
+
+        # Email it to our user too, if we can send email
+        if current_app.config['MAIL_SERVER'] and self.mailbox.email:
+            current_app.mailer.send(
+                self.mailbox.email,
+                render_template('voice/new_voicemail_email_subject.txt',
+                                voicemail=self).strip(),
+                render_template('voice/new_voicemail_email.txt',
+                                voicemail=self))
+
+        # Keep our own copy of the recording, so listening to it later
+        # doesn't depend on Twilio
+        if current_app.config['ARCHIVE_RECORDINGS']:
+            metadata = {
+                'from_number': self.from_number,
+                'transcription': self.transcription,
+                'date_created': datetime.utcnow().isoformat()
+            }
+            current_app.worker.submit(archive_recording, self.recording_sid,
+                                      self.recording_url, metadata)
@@ -0,0 +1,273 @@
+import re
+import zlib
+
+from .schedules import format_rule, parse_rule
+
+
+# The compact config image format. A payload is PAYLOAD_PREFIX followed by
+# base45 text, which QR codes can store in their dense alphanumeric mode.
+# Underneath the base45 is a header byte (the format version, plus a flag
+# saying whether the rest is zlib compressed) and a list of fields, each
+# stored as a varint tag, a varint length and then the value
+PAYLOAD_PREFIX = 'AV1:'
+PAYLOAD_VERSION = 1
+COMPRESSED_FLAG = 0x80
+
+BASE45_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:'
+BASE45_VALUES = {char: value for value, char in enumerate(BASE45_ALPHABET)}
+
+E164_PATTERN = re.compile(r'^\+[1-9]\d{1,14}$')
+
+# Field tags. Never reuse a tag - old config images are out there
+TAG_ID = 1
+TAG_PHONE_NUMBER = 2
+TAG_CARRIER = 3
+TAG_NAME = 4
+TAG_EMAIL = 5
+TAG_FEELINGS_ON_QR_CODES = 6
+TAG_WHITELIST = 7
+TAG_WHITELIST_OTHER = 8
+TAG_SCHEDULE = 9
+
+STRING_TAGS = {
+    TAG_CARRIER: 'carrier',
+    TAG_NAME: 'name',
+    TAG_EMAIL: 'email',
+}
+FEELINGS = ['love', 'hate']
+
+
+def b45encode(data):
+    """Encodes bytes as base45 text (RFC 9285)"""
+    chars = []
+
+    for i in range(0, len(data), 2):
+        pair = data[i:i + 2]
+        if len(pair) == 2:
+            value, digits = pair[0] * 256 + pair[1], 3
+        else:
+            value, digits = pair[0], 2
+
+        for _ in range(digits):
+            value, remainder = divmod(value, 45)
+            chars.append(BASE45_ALPHABET[remainder])
+
+    return ''.join(chars)
+
+
+def b45decode(text):
+    """Decodes base45 text (RFC 9285) back into bytes"""
+    try:
+        values = [BASE45_VALUES[char] for char in text]
+    except KeyError:
+        raise ValueError('Invalid base45 character')
+
+    data = bytearray()
+    for i in range(0, len(values), 3):
+        chunk = values[i:i + 3]
+        value = sum(v * 45 ** power for power, v in enumerate(chunk))
+
+        if len(chunk) == 3 and value <= 0xffff:
+            data.extend(divmod(value, 256))
+        elif len(chunk) == 2 and value <= 0xff:
+            data.append(value)
+        else:
+            raise ValueError('Invalid base45 data')
+
+    return bytes(data)
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, position):
+    value = shift = 0
+
+    while True:
+        if position >= len(data):
+            raise ValueError('Truncated varint')
+
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            return value, position
+
+
+def _write_field(out, tag, value):
+    _write_varint(out, tag)
+    _write_varint(out, len(value))
+    out.extend(value)
+
+
+def _pack_numbers(numbers):
+    """
+    Packs E.164 numbers as the varint differences between them in sorted
+    order, which keeps a whitelist to a few bytes per number
+    """
+    out = bytearray()
+    _write_varint(out, len(numbers))
+
+    previous = 0
+    for number in sorted(numbers):
+        _write_varint(out, number - previous)
+        previous = number
+
+    return out
+
+
+def _unpack_numbers(data):
+    count, position = _read_varint(data, 0)
+
+    numbers = []
+    previous = 0
+    for _ in range(count):
+        delta, position = _read_varint(data, position)
+        previous += delta
+        numbers.append(previous)
+
+    return numbers
+
+
+def _pack_strings(strings):
+    out = bytearray()
+    for string in sorted(strings):
+        _write_field(out, 0, string.encode('utf-8'))
+    return out
+
+
+def _unpack_strings(data):
+    strings = []
+    for _, value in _read_fields(data):
+        strings.append(value.decode('utf-8'))
+    return strings
+
+
+def _read_fields(data):
+    position = 0
+
+    while position < len(data):
+        tag, position = _read_varint(data, position)
+        length, position = _read_varint(data, position)
+
+        if position + length > len(data):
+            raise ValueError('Truncated field')
+
+        yield tag, data[position:position + length]
+        position += length
+
+
+def _e164_to_int(phone_number):
+    return int(phone_number[1:])
+
+
+def encode_mailbox(mailbox):
+    """Encodes a Mailbox's configuration as a compact payload string"""
+    fields = bytearray()
+
+    if mailbox.id is not None:
+        id_bytes = bytearray()
+        _write_varint(id_bytes, mailbox.id)
+        _write_field(fields, TAG_ID, id_bytes)
+
+    if E164_PATTERN.match(mailbox.phone_number):
+        number_bytes = bytearray()
+        _write_varint(number_bytes, _e164_to_int(mailbox.phone_number))
+        _write_field(fields, TAG_PHONE_NUMBER, number_bytes)
+    else:
+        raise ValueError('Mailbox phone number is not in E.164 format')
+
+    for tag, attribute in sorted(STRING_TAGS.items()):
+        value = getattr(mailbox, attribute)
+        if value is not None:
+            _write_field(fields, tag, value.encode('utf-8'))
+
+    if mailbox.feelings_on_qr_codes in FEELINGS:
+        _write_field(fields, TAG_FEELINGS_ON_QR_CODES,
+                     [FEELINGS.index(mailbox.feelings_on_qr_codes)])
+
+    # Whitelists are normally all E.164, but keep anything else as text
+    # rather than losing it
+    numbers = [_e164_to_int(number) for number in mailbox.whitelist
+               if E164_PATTERN.match(number)]
+    others = [number for number in mailbox.whitelist
+              if not E164_PATTERN.match(number)]
+
+    if numbers:
+        _write_field(fields, TAG_WHITELIST, _pack_numbers(numbers))
+    if others:
+        _write_field(fields, TAG_WHITELIST_OTHER, _pack_strings(others))
+
+    # Schedule rules as text, in order - later rules win
+    if mailbox.schedule:
+        rules = bytearray()
+        for rule in mailbox.schedule:
+            _write_field(rules, 0, format_rule(rule).encode('utf-8'))
+        _write_field(fields, TAG_SCHEDULE, rules)
+
+    # Only compress if it actually helps - it doesn't for short payloads
+    header = PAYLOAD_VERSION
+    body = bytes(fields)
+
+    compressed = zlib.compress(body, 9)
+    if len(compressed) < len(body):
+        header |= COMPRESSED_FLAG
+        body = compressed
+
+    return PAYLOAD_PREFIX + b45encode(bytes([header]) + body)
+
+
+def decode_mailbox(payload):
+    """
+    Decodes a payload from encode_mailbox() into a dict of Mailbox
+    keyword arguments. Raises ValueError if the payload is invalid
+    """
+    if not payload.startswith(PAYLOAD_PREFIX):
+        raise ValueError('Not a config image payload')
+
+    data = b45decode(payload[len(PAYLOAD_PREFIX):])
+    if not data:
+        raise ValueError('Empty config image payload')
+
+    header, body = data[0], data[1:]
+    if header & ~COMPRESSED_FLAG != PAYLOAD_VERSION:
+        raise ValueError('Unsupported config image version')
+
+    if header & COMPRESSED_FLAG:
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            raise ValueError('Invalid config image payload')
+
+    mailbox_dict = {'call_forwarding_set': False, 'whitelist': []}
+
+    # Skip tags we don't know about, so newer images still (mostly) load
+    for tag, value in _read_fields(body):
+        if tag == TAG_ID:
+            mailbox_dict['id'] = _read_varint(value, 0)[0]
+        elif tag == TAG_PHONE_NUMBER:
+            mailbox_dict['phone_number'] = '+{0}'.format(
+                _read_varint(value, 0)[0])
+        elif tag in STRING_TAGS:
+            mailbox_dict[STRING_TAGS[tag]] = value.decode('utf-8')
+        elif tag == TAG_FEELINGS_ON_QR_CODES:
+            mailbox_dict['feelings_on_qr_codes'] = FEELINGS[value[0]]
+        elif tag == TAG_WHITELIST:
+            mailbox_dict['whitelist'].extend(
+                '+{0}'.format(number) for number in _unpack_numbers(value))
+        elif tag == TAG_WHITELIST_OTHER:
+            mailbox_dict['whitelist'].extend(_unpack_strings(value))
+        elif tag == TAG_SCHEDULE:
+            mailbox_dict['schedule'] = [
+                parse_rule(rule) for rule in _unpack_strings(value)]
+
+    if 'phone_number' not in mailbox_dict:
+        raise ValueError('Config image payload has no phone number')
+
+    return mailbox_dict
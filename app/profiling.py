@@ -0,0 +1,253 @@
+from datetime import datetime
+from flask import current_app, request
+from functools import wraps
+from itsdangerous import BadSignature, TimestampSigner
+from random import random
+from sqlalchemy import and_, exc, select
+from time import time
+
+import cProfile
+import os
+import pstats
+
+from . import db
+
+
+# Send a token from 'manage.py profiles token' in this header to profile
+# one request
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SALT = 'profile'
+
+# The row in ProfilingToggle which says whether we're sampling requests
+TOGGLE_NAME = 'sampling'
+
+# Our load balancer's probes and status pages. Sampling would have them
+# check the toggle in the database, so they're only profiled with a token
+UNSAMPLED_BLUEPRINTS = ('status',)
+
+
+class Profile(db.Model):
+    """The hottest functions from one profiled request"""
+    __tablename__ = 'profile'
+
+    id = db.Column(db.Integer, primary_key=True)
+    endpoint = db.Column(db.String(100), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    data = db.Column(db.PickleType, nullable=False)
+
+
+class ProfilingToggle(db.Model):
+    """Our switch for sampling requests (see enable())"""
+    __tablename__ = 'profiling_toggle'
+
+    name = db.Column(db.String(20), primary_key=True)
+    rate = db.Column(db.Float, nullable=False)
+    until = db.Column(db.Float, nullable=False)
+
+
+class Profiler(object):
+    """
+    Decides which requests to profile, and keeps the hottest functions from
+    each profile. Whether sampling is on is checked (in the database, so
+    manage.py can switch it from any dyno or container) at most every
+    PROFILING_CHECK_INTERVAL seconds
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.sample_rate = 0
+        self.checked_at = None
+
+    def _signer(self):
+        return TimestampSigner(self.app.config['SECRET_KEY'],
+                               salt=PROFILE_SALT)
+
+    def make_token(self):
+        """A token which lets one request (or many) ask to be profiled"""
+        return self._signer().sign('profile').decode('utf-8')
+
+    def _valid_token(self, token):
+        if not self.app.config['SECRET_KEY']:
+            return False
+
+        try:
+            self._signer().unsign(
+                token, max_age=self.app.config['PROFILING_TOKEN_MAX_AGE'])
+        except BadSignature:
+            return False
+        return True
+
+    def _refresh(self):
+        now = time()
+        if self.checked_at is not None and now - self.checked_at < \
+                self.app.config['PROFILING_CHECK_INTERVAL']:
+            return
+
+        self.checked_at = now
+        table = ProfilingToggle.__table__
+
+        # Our own connection, so checking doesn't touch the request's session
+        try:
+            with db.engine.connect() as connection:
+                toggle = connection.execute(
+                    select([table.c.rate, table.c.until])
+                    .where(table.c.name == TOGGLE_NAME)).first()
+        except exc.SQLAlchemyError:
+            # Don't let profiling break a request - we'll check again later
+            self.app.logger.exception('Checking the profiling toggle failed')
+            return
+
+        if toggle is None or toggle.until < now:
+            self.sample_rate = 0
+        else:
+            self.sample_rate = toggle.rate
+
+    def wants(self, sampled=True):
+        """
+        Returns why we should profile this request, or None. Unless sampled
+        is set, only a token will do
+        """
+        token = request.headers.get(PROFILE_HEADER)
+        if token is not None:
+            return 'header' if self._valid_token(token) else None
+
+        if not sampled:
+            return None
+
+        self._refresh()
+        if self.sample_rate and random() < self.sample_rate:
+            return 'sampled'
+
+    def run(self, endpoint, reason, view, args, kwargs):
+        """Calls a view under cProfile, and saves what it found"""
+        profile = cProfile.Profile()
+        start = time()
+
+        try:
+            return profile.runcall(view, *args, **kwargs)
+        finally:
+            elapsed = time() - start
+
+            # Saving it doesn't need to hold up the response
+            current_app.worker.submit(save_profile, endpoint, {
+                'time': start,
+                'method': request.method,
+                'path': request.path,
+                'reason': reason,
+                'pid': os.getpid(),
+                'elapsed_ms': round(elapsed * 1000, 3),
+                'functions': top_functions(
+                    profile, self.app.config['PROFILING_TOP_N']),
+            })
+
+
+def _function_name(key):
+    filename, line, name = key
+
+    # Built-ins don't have a file
+    if filename == '~':
+        return name
+
+    parts = filename.split(os.sep)
+    return '{0}:{1}({2})'.format(os.sep.join(parts[-2:]), line, name)
+
+
+def top_functions(profile, count):
+    """The count functions a profile spent the most time in (cumulatively)"""
+    stats = pstats.Stats(profile).stats
+
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return [{
+        'function': _function_name(key),
+        'calls': calls,
+        'own_ms': round(own_time * 1000, 3),
+        'total_ms': round(total_time * 1000, 3),
+    } for key, (_, calls, own_time, total_time, _) in rows[:count]]
+
+
+def save_profile(endpoint, profile):
+    """
+    Adds a profile to the newest PROFILING_KEEP we keep for an endpoint.
+    Every worker can save at once: each inserts its own row, and then
+    deletes whatever isn't among the newest
+    """
+    table = Profile.__table__
+
+    with db.engine.begin() as connection:
+        connection.execute(table.insert(), endpoint=endpoint,
+                           created_at=datetime.utcnow(), data=profile)
+
+        newest = select([table.c.id]).where(table.c.endpoint == endpoint) \
+            .order_by(table.c.id.desc()) \
+            .limit(current_app.config['PROFILING_KEEP'])
+        connection.execute(table.delete().where(and_(
+            table.c.endpoint == endpoint,
+            table.c.id.notin_(select([newest.alias().c.id])))))
+
+
+def get_profiles(endpoint=None):
+    """Returns {endpoint: [profiles, newest first]}"""
+    query = Profile.query.order_by(Profile.endpoint, Profile.id.desc())
+    if endpoint is not None:
+        query = query.filter_by(endpoint=endpoint)
+
+    profiles = {}
+    for row in query:
+        profiles.setdefault(row.endpoint, []).append(row.data)
+    return profiles
+
+
+def format_profile(endpoint, profile):
+    """Formats a profile as a table, for manage.py profiles"""
+    lines = ['{0} {1} {2} ({3}, {4} ms, pid {5})'.format(
+        endpoint, profile['method'], profile['path'], profile['reason'],
+        profile['elapsed_ms'], profile['pid']),
+        '{0:>10} {1:>10} {2:>8}  {3}'.format(
+            'total ms', 'own ms', 'calls', 'function')]
+
+    for function in profile['functions']:
+        lines.append('{0:>10.3f} {1:>10.3f} {2:>8}  {3}'.format(
+            function['total_ms'], function['own_ms'], function['calls'],
+            function['function']))
+
+    return '\n'.join(lines)
+
+
+def enable(rate, seconds):
+    """Profiles rate of all requests, for the next few seconds"""
+    db.session.merge(ProfilingToggle(
+        name=TOGGLE_NAME, rate=rate, until=time() + seconds))
+    db.session.commit()
+
+
+def disable():
+    """Stops sampling requests (requests with a token are still profiled)"""
+    ProfilingToggle.query.filter_by(name=TOGGLE_NAME).delete()
+    db.session.commit()
+
+
+def _profiled(profiler, endpoint, view):
+    sampled = endpoint.split('.')[0] not in UNSAMPLED_BLUEPRINTS
+
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        reason = profiler.wants(sampled)
+        if reason is None:
+            return view(*args, **kwargs)
+        return profiler.run(endpoint, reason, view, args, kwargs)
+    return decorated_function
+
+
+def init_app(app):
+    """
+    Lets us profile requests to an app's views, if PROFILING_ENABLED is set.
+    Call this after registering every blueprint
+    """
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    profiler = Profiler(app)
+    app.extensions['profiler'] = profiler
+
+    for endpoint, view in list(app.view_functions.items()):
+        app.view_functions[endpoint] = _profiled(profiler, endpoint, view)
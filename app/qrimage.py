@@ -0,0 +1,59 @@
+import numpy
+import qrcode
+import struct
+import zlib
+
+
+# The same sizes qrcode.make() uses, so config images look the same as
+# they always have
+BOX_SIZE = 10
+BORDER = 4
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _png_chunk(chunk_type, data):
+    return (struct.pack('>I', len(data)) + chunk_type + data +
+            struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+
+def render_png(matrix, box_size=BOX_SIZE):
+    """
+    Renders a QR code's module matrix (rows of booleans, True for dark
+    modules) as a black and white, 1-bit PNG.
+
+    Rather than drawing each module with PIL like qrcode's image factories,
+    we scale the whole matrix up with NumPy and pack it straight into PNG
+    scanlines.
+    """
+    modules = numpy.array(matrix, dtype=bool)
+
+    # In a 1-bit greyscale PNG 0 is black and 1 is white. Scale each module
+    # across, pack each row into bits, and then repeat each packed row
+    # downwards - which is cheaper than scaling the whole image first
+    pixels = numpy.repeat(~modules, box_size, axis=1)
+    packed = numpy.packbits(pixels, axis=1)
+
+    # Every PNG scanline starts with a filter type byte. 0 means 'none'
+    scanlines = numpy.hstack([
+        numpy.zeros((packed.shape[0], 1), dtype=numpy.uint8), packed])
+    scanlines = numpy.repeat(scanlines, box_size, axis=0)
+
+    height, width = modules.shape[0] * box_size, modules.shape[1] * box_size
+    header = struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)
+
+    return b''.join([
+        PNG_SIGNATURE,
+        _png_chunk(b'IHDR', header),
+        _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes())),
+        _png_chunk(b'IEND', b''),
+    ])
+
+
+def render_qr_code(data, box_size=BOX_SIZE, border=BORDER):
+    """Makes a QR code for some data and returns it as PNG bytes"""
+    qr = qrcode.QRCode(box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    return render_png(qr.get_matrix(), box_size)
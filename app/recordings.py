@@ -0,0 +1,155 @@
+from flask import current_app
+
+import json
+import os
+import re
+import requests
+import time
+
+from .deadlines import get_timeout
+
+
+# Recording SIDs end up in file paths, so only allow letters and numbers
+RECORDING_SID_PATTERN = re.compile(r'^[A-Za-z0-9]+$')
+
+TWILIO_RECORDING_URL = \
+    'https://api.twilio.com/2010-04-01/Accounts/{0}/Recordings/{1}'
+
+
+class RecordingArchive(object):
+    """
+    Keeps copies of voicemail recordings on local disk, so listening to a
+    voicemail doesn't depend on (or pay for) a trip to Twilio's media servers.
+
+    The archive deletes its oldest recordings once it grows past max_bytes,
+    and any partial download older than partial_max_age seconds.
+    """
+
+    def __init__(self, directory, max_bytes, chunk_size=64 * 1024,
+                 partial_max_age=60 * 60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.partial_max_age = partial_max_age
+
+    def _path(self, recording_sid, extension):
+        if not RECORDING_SID_PATTERN.match(recording_sid):
+            raise ValueError('Invalid recording SID')
+
+        return os.path.join(self.directory, recording_sid + extension)
+
+    def audio_path(self, recording_sid):
+        """The path to a recording's audio file"""
+        return self._path(recording_sid, '.mp3')
+
+    def has_recording(self, recording_sid):
+        """Returns True if we have a copy of this recording"""
+        return os.path.exists(self.audio_path(recording_sid))
+
+    def get_metadata(self, recording_sid):
+        """Returns what we know about a recording, or None"""
+        try:
+            with open(self._path(recording_sid, '.json')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def archive(self, recording_sid, recording_url, metadata, auth=None,
+                timeout=None):
+        """
+        Downloads a recording's audio and saves it with its metadata. timeout
+        limits each read of the download
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        audio_path = self.audio_path(recording_sid)
+        partial_path = audio_path + '.part'
+
+        # Stream the audio to disk in chunks, and only move it into place
+        # once it's complete, so we never serve half a recording
+        response = requests.get(recording_url + '.mp3', auth=auth,
+                                stream=True, timeout=timeout)
+        response.raise_for_status()
+
+        try:
+            with open(partial_path, 'wb') as f:
+                for chunk in response.iter_content(
+                        chunk_size=self.chunk_size):
+                    f.write(chunk)
+        except Exception:
+            # Don't leave half a recording taking up space in the archive
+            try:
+                os.remove(partial_path)
+            except OSError:
+                pass
+            raise
+
+        with open(self._path(recording_sid, '.json'), 'w') as f:
+            json.dump(metadata, f)
+
+        os.replace(partial_path, audio_path)
+
+        self.prune()
+
+    def prune(self):
+        """
+        Deletes stale partial downloads, then our oldest recordings until
+        we're under max_bytes
+        """
+        recordings = []
+        partial_bytes = 0
+        now = time.time()
+
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+
+            if file_name.endswith('.mp3.part'):
+                # A download which failed without cleaning up (like when its
+                # process was killed) - recent ones may still be running
+                stat = os.stat(path)
+                if now - stat.st_mtime > self.partial_max_age:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                else:
+                    partial_bytes += stat.st_size
+            elif file_name.endswith('.mp3'):
+                stat = os.stat(path)
+                recordings.append((stat.st_mtime, stat.st_size, file_name))
+
+        total_bytes = partial_bytes + sum(size for _, size, _ in recordings)
+
+        for _, size, file_name in sorted(recordings):
+            if total_bytes <= self.max_bytes:
+                break
+
+            recording_sid = file_name[:-len('.mp3')]
+            for extension in ('.mp3', '.json'):
+                try:
+                    os.remove(self._path(recording_sid, extension))
+                except OSError:
+                    pass
+
+            total_bytes -= size
+
+
+def get_recording_archive():
+    """Returns the RecordingArchive for our app"""
+    return RecordingArchive(current_app.config['RECORDINGS_DIR'],
+                            current_app.config['RECORDINGS_MAX_BYTES'])
+
+
+def get_recording_url(recording_sid):
+    """The Twilio URL for a recording (without a format extension)"""
+    return TWILIO_RECORDING_URL.format(
+        current_app.config['TWILIO_ACCOUNT_SID'], recording_sid)
+
+
+def archive_recording(recording_sid, recording_url, metadata):
+    """Background job which copies a new recording to our archive"""
+    get_recording_archive().archive(
+        recording_sid, recording_url, metadata,
+        auth=(current_app.config['TWILIO_ACCOUNT_SID'],
+              current_app.config['TWILIO_AUTH_TOKEN']),
+        timeout=get_timeout(current_app.config['MEDIA_TIMEOUT']))
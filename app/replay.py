@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from time import sleep, time
+from werkzeug.datastructures import MultiDict
+
+import difflib
+import json
+import math
+
+
+def load_webhooks(lines):
+    """Reads webhooks captured by app.capture from a JSON lines file"""
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def percentile(values, percent):
+    """The nearest-rank percentile of a sorted list of values"""
+    if not values:
+        return None
+
+    rank = int(math.ceil(percent / 100 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def _diff(webhook, status, body):
+    """Describes how a replayed response differs from the captured one"""
+    lines = []
+
+    if status != webhook['status']:
+        lines.append('status {0} != {1}'.format(webhook['status'], status))
+
+    if webhook.get('response') is not None and body != webhook['response']:
+        lines.extend(difflib.unified_diff(
+            webhook['response'].splitlines(), body.splitlines(),
+            'captured', 'replayed', lineterm=''))
+
+    return lines
+
+
+def replay_webhooks(app, webhooks, speed=1.0):
+    """
+    Sends captured webhooks to an app in their original order. With a speed
+    they keep their original spacing (divided by speed), and with a speed of
+    None they're sent as fast as the app can answer them.
+
+    Returns a dict with the replayed and captured latencies for each path,
+    a list of differing responses, and how far behind schedule we fell.
+    """
+    client = app.test_client()
+
+    latencies = OrderedDict()
+    diffs = []
+    max_lag = 0
+
+    if not webhooks:
+        return {'latencies': latencies, 'diffs': diffs, 'max_lag': max_lag}
+
+    first_time = webhooks[0]['time']
+    replay_start = time()
+
+    for number, webhook in enumerate(webhooks):
+        if speed is not None:
+            due = replay_start + (webhook['time'] - first_time) / speed
+            wait = due - time()
+            if wait > 0:
+                sleep(wait)
+            else:
+                max_lag = max(max_lag, -wait)
+
+        start = time()
+        response = client.open(
+            webhook['path'], method=webhook['method'],
+            query_string=MultiDict(webhook['query']),
+            data=MultiDict(webhook['form']))
+        elapsed_ms = (time() - start) * 1000
+
+        path_latencies = latencies.setdefault(
+            webhook['path'], {'replayed': [], 'captured': []})
+        path_latencies['replayed'].append(elapsed_ms)
+        path_latencies['captured'].append(webhook['elapsed_ms'])
+
+        diff = _diff(webhook, response.status_code,
+                     response.get_data(as_text=True))
+        if diff:
+            diffs.append((number, webhook['path'], diff))
+
+    return {'latencies': latencies, 'diffs': diffs, 'max_lag': max_lag}
+
+
+def format_report(report, max_diffs=10):
+    """Formats replay_webhooks()'s results as a table, then any diffs"""
+    lines = ['{0:<20} {1:>6} {2:>9} {3:>9} {4:>9} {5:>9} {6:>12}'.format(
+        'path', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+        'captured p50')]
+
+    for path, path_latencies in report['latencies'].items():
+        replayed = sorted(path_latencies['replayed'])
+        captured = sorted(path_latencies['captured'])
+
+        lines.append(
+            '{0:<20} {1:>6} {2:>9.1f} {3:>9.1f} {4:>9.1f} {5:>9.1f} '
+            '{6:>12.1f}'.format(
+                path, len(replayed), percentile(replayed, 50),
+                percentile(replayed, 90), percentile(replayed, 99),
+                replayed[-1], percentile(captured, 50)))
+
+    if report['max_lag']:
+        lines.append('Fell up to {0:.1f} ms behind schedule'.format(
+            report['max_lag'] * 1000))
+
+    lines.append('{0} responses differed from the capture'.format(
+        len(report['diffs'])))
+
+    for number, path, diff in report['diffs'][:max_diffs]:
+        lines.append('')
+        lines.append('#{0} {1}'.format(number, path))
+        lines.extend(diff)
+
+    return '\n'.join(lines)
@@ -0,0 +1,214 @@
+from bisect import bisect_right
+from datetime import datetime
+from phonenumbers import timezone as number_timezones
+
+import phonenumbers
+import pytz
+import re
+
+
+# What incoming_call does with callers who aren't on the whitelist:
+#   normal - offer to take a voicemail if they press 1
+#   record - always take a voicemail (like at night)
+#   strict - never take a voicemail (like during work hours)
+ACTIONS = ('normal', 'record', 'strict')
+ACTION_ALIASES = {'voicemail': 'record', 'allow': 'record', 'block': 'strict'}
+
+DAY_NAMES = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+DAY_GROUPS = {
+    'daily': tuple(range(7)),
+    'weekdays': tuple(range(5)),
+    'weekends': (5, 6),
+}
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# Schedule rules are tuples, so they pickle without depending on our code:
+#   ('weekly', (0, 1, 2, 3, 4), 540, 1020, 'strict')   weekdays 9:00-17:00
+#   ('date', '2026-12-25', 'record')                   all of Christmas Day
+WEEKLY_RULE = re.compile(
+    r'^(?P<days>[a-z,-]+)\s+(?P<start>\d{1,2}(:\d\d)?)\s*-\s*'
+    r'(?P<end>\d{1,2}(:\d\d)?)\s+(?P<action>[a-z]+)$')
+DATE_RULE = re.compile(r'^(?P<date>\d{4}-\d\d-\d\d)\s+(?P<action>[a-z]+)$')
+
+
+def _parse_action(text):
+    action = ACTION_ALIASES.get(text, text)
+    if action not in ACTIONS:
+        raise ValueError('Unknown action {0!r}'.format(text))
+    return action
+
+
+def _parse_days(text):
+    days = set()
+
+    for part in text.split(','):
+        if part in DAY_GROUPS:
+            days.update(DAY_GROUPS[part])
+        elif '-' in part:
+            first, last = (DAY_NAMES.index(day[:3])
+                           for day in part.split('-', 1))
+            day = first
+            while True:
+                days.add(day)
+                if day == last:
+                    break
+                day = (day + 1) % 7
+        else:
+            days.add(DAY_NAMES.index(part[:3]))
+
+    return tuple(sorted(days))
+
+
+def _parse_time(text):
+    hours, _, minutes = text.partition(':')
+    hours, minutes = int(hours), int(minutes or 0)
+
+    if hours > 24 or minutes > 59 or (hours == 24 and minutes):
+        raise ValueError('Invalid time {0!r}'.format(text))
+    return hours * 60 + minutes
+
+
+def parse_rule(text):
+    """
+    Parses a schedule rule, like 'weekdays 9:00-17:00 strict',
+    'fri-sun 22:00-7:00 record' or '2026-12-25 record'. Raises ValueError
+    if it isn't one
+    """
+    text = ' '.join(text.lower().split())
+
+    match = DATE_RULE.match(text)
+    if match:
+        date = datetime.strptime(match.group('date'), '%Y-%m-%d').date()
+        return ('date', date.isoformat(), _parse_action(match.group('action')))
+
+    match = WEEKLY_RULE.match(text)
+    if match is None:
+        raise ValueError('Not a schedule rule: {0!r}'.format(text))
+
+    try:
+        days = _parse_days(match.group('days'))
+    except ValueError:
+        raise ValueError('Unknown days {0!r}'.format(match.group('days')))
+
+    start = _parse_time(match.group('start'))
+    end = _parse_time(match.group('end'))
+    if start == end:
+        raise ValueError('Empty time range')
+
+    return ('weekly', days, start, end, _parse_action(match.group('action')))
+
+
+def format_rule(rule):
+    """Turns a rule back into the text parse_rule() understands"""
+    if rule[0] == 'date':
+        return '{0} {1}'.format(rule[1], rule[2])
+
+    _, days, start, end, action = rule
+    return '{0} {1}:{2:02d}-{3}:{4:02d} {5}'.format(
+        ','.join(DAY_NAMES[day] for day in days), start // 60, start % 60,
+        end // 60, end % 60, action)
+
+
+def _weekly_intervals(rule):
+    """The minutes of the week a weekly rule covers, as (start, end) pairs"""
+    _, days, start, end, _ = rule
+
+    for day in days:
+        day_start = day * MINUTES_PER_DAY
+        # Ranges like 22:00-7:00 run past midnight, into the next day
+        if end < start:
+            end_minute = day_start + MINUTES_PER_DAY + end
+        else:
+            end_minute = day_start + end
+
+        begin = day_start + start
+        if end_minute <= MINUTES_PER_WEEK:
+            yield begin, end_minute
+        else:
+            # Sunday night runs into Monday morning
+            yield begin, MINUTES_PER_WEEK
+            yield 0, end_minute - MINUTES_PER_WEEK
+
+
+def get_timezone(phone_number, region_code):
+    """
+    Picks the timezone for a mailbox: one of its region's timezones, using
+    the number's area code to choose between them where there are several
+    """
+    region_zones = pytz.country_timezones.get(region_code, [])
+
+    try:
+        number_zones = number_timezones.time_zones_for_number(
+            phonenumbers.parse(phone_number))
+    except phonenumbers.NumberParseException:
+        number_zones = ()
+
+    for zone in number_zones:
+        if zone in region_zones:
+            return zone
+
+    return region_zones[0] if region_zones else 'UTC'
+
+
+def compile_schedule(rules, timezone_name):
+    """
+    Compiles schedule rules into a weekly interval index: sorted start
+    minutes (from Monday 00:00) with the action from each until the next.
+    Later rules win where rules overlap. Returns None if there are no rules
+    """
+    if not rules:
+        return None
+
+    weekly = [rule for rule in rules if rule[0] == 'weekly']
+
+    # Every point where some rule starts or stops
+    boundaries = {0, MINUTES_PER_WEEK}
+    covered = []
+    for rule in weekly:
+        for start, end in _weekly_intervals(rule):
+            boundaries.update((start, end))
+            covered.append((start, end, rule[-1]))
+    boundaries = sorted(boundaries)
+
+    starts, actions = [], []
+    for start in boundaries[:-1]:
+        action = 'normal'
+        for rule_start, rule_end, rule_action in covered:
+            if rule_start <= start < rule_end:
+                action = rule_action
+
+        # Merge neighbours with the same action
+        if not actions or actions[-1] != action:
+            starts.append(start)
+            actions.append(action)
+
+    return {
+        'timezone': timezone_name,
+        'starts': starts,
+        'actions': actions,
+        'dates': dict((rule[1], rule[2]) for rule in rules
+                      if rule[0] == 'date'),
+    }
+
+
+def get_action(index, now=None):
+    """
+    Returns what a compiled schedule says to do with a call right now. This
+    is on the hot path, so it's only a dict lookup and a bisect
+    """
+    if index is None:
+        return 'normal'
+
+    if now is None:
+        now = datetime.now(pytz.utc)
+    local = now.astimezone(pytz.timezone(index['timezone']))
+
+    action = index['dates'].get(local.date().isoformat())
+    if action is not None:
+        return action
+
+    minute = local.weekday() * MINUTES_PER_DAY + local.hour * 60 + \
+        local.minute
+    return index['actions'][bisect_right(index['starts'], minute) - 1]
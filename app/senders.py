@@ -0,0 +1,115 @@
+from flask import current_app
+from threading import Lock
+from time import time
+
+
+class TokenBucket(object):
+    """
+    Tracks how busy one sender number is. Each message takes a token, and
+    tokens come back at rate per second up to burst. We let the bucket go
+    into debt, so its balance says how far behind a number is.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time()
+
+    def refill(self, now):
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Takes a token, returning how long to wait before sending"""
+        self.refill(now)
+        self.tokens -= 1
+        return max(-self.tokens / self.rate, 0)
+
+
+class SenderPool(object):
+    """
+    Spreads our outbound text messages over several Twilio numbers, so we
+    aren't capped by a single number's messages-per-second limit.
+
+    Each recipient sticks to the number they first heard from (remembered in
+    the app cache, so every worker agrees), which keeps their conversation
+    in one thread on their phone. New recipients get whichever number is
+    least loaded in this process.
+    """
+
+    def __init__(self, numbers, rate, burst):
+        self.numbers = list(numbers)
+        self.lock = Lock()
+        self.buckets = dict(
+            (number, TokenBucket(rate, burst)) for number in self.numbers)
+
+    def _least_loaded(self, now):
+        for bucket in self.buckets.values():
+            bucket.refill(now)
+
+        # Ties go to the first number in our list, our main number
+        return max(self.numbers, key=lambda n: self.buckets[n].tokens)
+
+    def acquire(self, to_number, default=None):
+        """
+        Picks the number to send a message to to_number from. Returns it
+        along with how long to wait (in seconds) to stay within its limit.
+
+        Recipients we haven't texted recently get default, if it's one of
+        our numbers, or else our least loaded number.
+        """
+        key = 'sender:' + to_number
+        sender = current_app.cache.get(key)
+        now = time()
+
+        with self.lock:
+            if sender not in self.buckets:
+                if default in self.buckets:
+                    sender = default
+                else:
+                    sender = self._least_loaded(now)
+            wait = self.buckets[sender].take(now)
+
+        # Refresh the assignment, so active conversations never expire
+        current_app.cache.set(
+            key, sender, timeout=current_app.config['SENDER_STICKY_TIMEOUT'])
+
+        return sender, wait
+
+    def pin(self, to_number, sender=None):
+        """
+        Sticks to_number to sender (or our main number), like when they've
+        texted us there and our TwiML reply came from it
+        """
+        if sender not in self.buckets:
+            sender = self.numbers[0]
+
+        current_app.cache.set(
+            'sender:' + to_number, sender,
+            timeout=current_app.config['SENDER_STICKY_TIMEOUT'])
+
+
+def get_sender_numbers():
+    """Our main Twilio number, followed by any extra TWILIO_SENDER_NUMBERS"""
+    numbers = [current_app.config['TWILIO_PHONE_NUMBER']]
+
+    for number in current_app.config['TWILIO_SENDER_NUMBERS']:
+        if number not in numbers:
+            numbers.append(number)
+
+    return numbers
+
+
+def get_sender_pool():
+    """Returns this process's SenderPool"""
+    pool = current_app.extensions.get('senders')
+
+    if pool is None:
+        pool = current_app.extensions.setdefault(
+            'senders', SenderPool(get_sender_numbers(),
+                                  current_app.config['SENDER_RATE'],
+                                  current_app.config['SENDER_BURST']))
+
+    return pool
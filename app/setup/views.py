@@ -1,14 +1,29 @@
 from flask import abort, current_app, render_template, request, send_file
 from io import BytesIO
+from qrcode.exceptions import DataOverflowError
 from twilio import twiml
 
+import requests
+
 from . import setup
 from .forms import EmailForm, PhoneNumberForm
 from ..voice.views import incoming_call
-from .. import db
+from .. import db, schedules
+from ..analytics import get_daily_counts, summarize
+from ..carriers import resolve_mailbox_carrier
+from ..deadlines import DeadlineExceeded, get_timeout, until_deadline
 from ..decorators import validate_twilio_request
 from ..models import Mailbox
+from ..senders import get_sender_pool
+from ..templating import render_reply
 from ..utils import set_twilio_number_urls
+from ..whitelist import is_rule, numbers_from_file, numbers_from_text, \
+    parse_rule
+
+
+# Attachments with these content types are whitelists, not config images
+WHITELIST_CONTENT_TYPES = ('text/vcard', 'text/x-vcard', 'text/directory',
+                           'text/csv', 'text/comma-separated-values')
 
 
 @setup.route('/')
@@ -22,15 +37,42 @@ def index():
                            'TWILIO_PHONE_NUMBER'])
 
 
+@setup.errorhandler(DeadlineExceeded)
+def deadline_exceeded(e):
+    """
+    Answers a webhook which ran out of time, before Twilio gives up on us.
+    Texts get a reply asking our user to try again
+    """
+    if request.endpoint == 'setup.incoming_message':
+        resp = twiml.Response()
+        resp.message(render_reply('setup/try_again.txt'))
+        return str(resp)
+
+    return ('', 503)
+
+
 @setup.route('/message', methods=['POST'])
 @validate_twilio_request
 def incoming_message():
     """Receives an SMS message from a number"""
     resp = twiml.Response()
 
-    # If this message has an image attached, attempt to import it
+    # Our TwiML replies come from the number they texted, so the messages we
+    # send them later (like voicemail notifications) should too
+    get_sender_pool().pin(request.form['From'], request.form.get('To'))
+
+    # If this message has a contact card or CSV file attached, add its
+    # numbers to the whitelist. If it's an image, attempt to import it
     if 'MediaUrl0' in request.form:
-        reply = _import_config(request.form['From'], request.form['MediaUrl0'])
+        content_type = request.form.get('MediaContentType0', '').lower()
+
+        if content_type in WHITELIST_CONTENT_TYPES:
+            reply = _import_whitelist(request.form['From'],
+                                      request.form['MediaUrl0'])
+        else:
+            reply = _import_config(request.form['From'],
+                                   request.form['MediaUrl0'])
+
         resp.message(reply)
         return str(resp)
 
@@ -48,21 +90,33 @@ def incoming_message():
         # Make a mailbox for this number
         new_mailbox = Mailbox(from_number)
 
-        # Check that our new user's carrier is supported by Anti-Voicemail
-        if new_mailbox.is_carrier_supported():
+        # Check that our new user's carrier is supported by Anti-Voicemail.
+        # If we don't know their carrier yet, look it up in the background
+        # and carry on - we'll text them later if it's unsupported
+        if new_mailbox.carrier is None:
             db.session.add(new_mailbox)
+            current_app.worker.submit(resolve_mailbox_carrier,
+                                      from_number)
 
             # Ask the user for their name
-            reply = render_template('setup/ask_name.txt')
+            reply = render_reply('setup/ask_name.txt')
+        elif new_mailbox.is_carrier_supported():
+            db.session.add(new_mailbox)
+
+            # Ask the user for their name
+            reply = render_reply('setup/ask_name.txt')
         else:
             # Their carrier is unsupported. Bummer!
-            reply = render_template('setup/unsupported_carrier.txt')
+            reply = render_reply('setup/unsupported_carrier.txt',
+                                 carrier=new_mailbox.carrier)
 
         resp.message(reply)
 
     else:
         # Check if this answer is one of our special commands
-        body = request.form['Body'].split()
+        # Keep the rest of the message as it is, so lists of numbers can be
+        # one per line
+        body = request.form['Body'].strip().split(None, 1)
         command = body[0].lower()
 
         if command in current_app.config['ANTI_VOICEMAIL_COMMANDS']:
@@ -77,6 +131,23 @@ def incoming_message():
     return str(resp)
 
 
+@setup.route('/message-status', methods=['POST'])
+@validate_twilio_request
+def message_status():
+    """
+    Receives a status update for one of the messages we sent. These come
+    in bursts, so we only buffer them here and write them in batches
+    """
+    error_code = request.form.get('ErrorCode')
+
+    current_app.deliveries.add(
+        request.form['MessageSid'], request.form['MessageStatus'],
+        error_code=int(error_code) if error_code else None,
+        to=request.form.get('To'))
+
+    return ('', 204)
+
+
 def _import_config(from_number, image_url):
     """Processes a config image that the user has sent us"""
     # First see if we have an existing mailbox
@@ -93,31 +164,86 @@ def _import_config(from_number, image_url):
     return result
 
 
+def _import_whitelist(from_number, file_url):
+    """Adds the numbers in a vCard or CSV file to our user's whitelist"""
+    # Only our user can change their whitelist
+    mailbox = Mailbox.query.filter_by(phone_number=from_number).first()
+    if mailbox is None:
+        abort(403)
+
+    try:
+        # Stream the file so we never hold more than a line of it in memory
+        response = requests.get(
+            file_url, stream=True,
+            timeout=get_timeout(current_app.config['MEDIA_TIMEOUT']))
+        response.raise_for_status()
+
+        # The timeout only covers each read, so a slow sender could keep
+        # us going long past our deadline
+        lines = until_deadline(response.iter_lines(decode_unicode=True))
+        added, invalid = mailbox.import_whitelist(numbers_from_file(lines))
+    except DeadlineExceeded:
+        raise
+    except Exception:
+        return render_reply('setup/whitelist/retry.txt')
+
+    return render_reply('setup/whitelist/imported.txt', added=added,
+                        invalid=invalid, whitelist=mailbox.whitelist)
+
+
 def _process_command(command, body, mailbox, from_number):
-    """A helper function to process commands sent from the user"""
+    """
+    A helper function to process commands sent from the user. body is the
+    command word and (if there is one) the rest of the message
+    """
+    text = body[1] if len(body) > 1 else ''
+
     if command == 'disable':
         # Send the instructions to disable Anti-Voicemail
-        reply = render_template('setup/disable.txt', mailbox=mailbox)
+        reply = render_reply('setup/disable.txt', mailbox=mailbox)
     elif command == 'whitelist':
-        # Make sure the phone number is valid
-        phone_number = ' '.join(body[1:])
-        form = PhoneNumberForm(phone_number=phone_number,
-                               default_region_code=mailbox.get_region_code())
-
-        if form.validate():
-            whitelisted_number = form.phone_number.data
-
-            # We need to make a new whitelist object to ensure the
-            # PickleType field detects a change
-            mailbox.whitelist = mailbox.whitelist.union(
-                set([whitelisted_number]))
-            db.session.add(mailbox)
-
-            reply = render_template('setup/whitelist/success.txt',
-                                    new_number=whitelisted_number,
-                                    whitelist=list(mailbox.whitelist))
+        phone_numbers = numbers_from_text(text)
+
+        if len(phone_numbers) > 1:
+            # Our user sent us a list of numbers - add them all at once
+            added, invalid = mailbox.import_whitelist(phone_numbers)
+
+            reply = render_reply('setup/whitelist/imported.txt',
+                                 added=added, invalid=invalid,
+                                 whitelist=mailbox.whitelist)
+        elif is_rule(phone_numbers[0]):
+            # A prefix or range rule, to let a whole block of numbers through
+            rule = parse_rule(phone_numbers[0], mailbox.get_region_code())
+
+            if rule is not None:
+                mailbox.whitelist = mailbox.whitelist.union(set([rule]))
+                db.session.add(mailbox)
+
+                reply = render_reply('setup/whitelist/success.txt',
+                                     new_number=rule,
+                                     whitelist=list(mailbox.whitelist))
+            else:
+                reply = render_reply('setup/whitelist/retry.txt')
         else:
-            reply = render_template('setup/whitelist/retry.txt')
+            # Make sure the phone number is valid
+            form = PhoneNumberForm(
+                phone_number=phone_numbers[0],
+                default_region_code=mailbox.get_region_code())
+
+            if form.validate():
+                whitelisted_number = form.phone_number.data
+
+                # We need to make a new whitelist object to ensure the
+                # PickleType field detects a change
+                mailbox.whitelist = mailbox.whitelist.union(
+                    set([whitelisted_number]))
+                db.session.add(mailbox)
+
+                reply = render_reply('setup/whitelist/success.txt',
+                                     new_number=whitelisted_number,
+                                     whitelist=list(mailbox.whitelist))
+            else:
+                reply = render_reply('setup/whitelist/retry.txt')
     elif command == 'reset':
         # Delete the existing Mailbox and begin the setup process again
         Mailbox.query.delete()
@@ -125,7 +251,19 @@ def _process_command(command, body, mailbox, from_number):
         new_mailbox = Mailbox(from_number)
         db.session.add(new_mailbox)
 
-        reply = render_template('setup/ask_name.txt', reset=True)
+        if new_mailbox.carrier is None:
+            current_app.worker.submit(resolve_mailbox_carrier,
+                                      from_number)
+
+        reply = render_reply('setup/ask_name.txt', reset=True)
+    elif command == 'schedule':
+        reply = _process_schedule(text, mailbox)
+    elif command == 'stats':
+        # Straight from our rollups, so this never scans the raw events
+        reply = render_reply(
+            'setup/stats.txt',
+            today=summarize(get_daily_counts(days=1)),
+            week=summarize(get_daily_counts(days=7)))
     else:
         # The only way this happens is if there's a mismatch between
         # the ANTI_VOICEMAIL_COMMANDS config setting and this method
@@ -136,6 +274,28 @@ def _process_command(command, body, mailbox, from_number):
     return reply
 
 
+def _process_schedule(text, mailbox):
+    """Adds a rule to our user's schedule, clears it, or shows it"""
+    if text.lower() == 'clear':
+        mailbox.schedule = []
+        db.session.add(mailbox)
+    elif text:
+        try:
+            rule = schedules.parse_rule(text)
+        except ValueError:
+            return render_reply('setup/schedule/retry.txt')
+
+        # We need to make a new list to ensure the PickleType field detects
+        # a change
+        mailbox.schedule = (mailbox.schedule or []) + [rule]
+        db.session.add(mailbox)
+
+    return render_reply(
+        'setup/schedule/show.txt',
+        rules=[schedules.format_rule(rule)
+               for rule in mailbox.schedule or []])
+
+
 def _process_answer(answer, mailbox):
     """A helper function to process answers to the setup questions"""
     reply = None
@@ -147,7 +307,7 @@ def _process_answer(answer, mailbox):
         db.session.add(mailbox)
 
         # Ask the user for their email address
-        reply = render_template('setup/email/ask.txt', mailbox=mailbox)
+        reply = render_reply('setup/email/ask.txt', mailbox=mailbox)
 
     elif not mailbox.email:
         # If we have a name but not an email adddress, assume this message
@@ -155,19 +315,33 @@ def _process_answer(answer, mailbox):
         form = EmailForm(email=answer, csrf_enabled=False)
 
         if form.validate():
-            mailbox.email = answer
-            db.session.add(mailbox)
+            # We need the carrier for the call forwarding instructions, so
+            # look it up now if our background lookup hasn't finished
+            mailbox.resolve_carrier()
+
+            if mailbox.carrier is None:
+                # The lookup failed (or we didn't have time for it), so ask
+                # for the email address again and try once more then
+                reply = render_reply('setup/email/carrier_retry.txt')
+            elif not mailbox.is_carrier_supported():
+                # Their carrier is unsupported. Bummer!
+                db.session.delete(mailbox)
+                reply = render_reply('setup/unsupported_carrier.txt',
+                                     carrier=mailbox.carrier)
+            else:
+                mailbox.email = answer
+                db.session.add(mailbox)
 
-            # Tell the user how to set up conditional call forwarding
-            reply = render_template(
-                'setup/call_forwarding/instructions.txt',
-                mailbox=mailbox)
+                # Tell the user how to set up conditional call forwarding
+                reply = render_reply(
+                    'setup/call_forwarding/instructions.txt',
+                    mailbox=mailbox)
         else:
-            reply = render_template('setup/email/retry.txt')
+            reply = render_reply('setup/email/retry.txt')
 
     elif not mailbox.call_forwarding_set:
         # Remind the user how to set up call forwarding
-        reply = render_template(
+        reply = render_reply(
             'setup/call_forwarding/retry.txt',
             mailbox=mailbox)
 
@@ -179,21 +353,21 @@ def _process_answer(answer, mailbox):
         if answer == 'y':
             mailbox.feelings_on_qr_codes = 'love'
             db.session.add(mailbox)
-            reply = render_template('setup/qr_codes/loves.txt')
+            reply = render_reply('setup/qr_codes/loves.txt')
 
             # Our user likes QR codes, so we'll send them the config image
             mailbox.send_config_image()
         elif answer == 'n':
             mailbox.feelings_on_qr_codes = 'hate'
             db.session.add(mailbox)
-            reply = render_template('setup/qr_codes/hates.txt')
+            reply = render_reply('setup/qr_codes/hates.txt')
         else:
-            reply = render_template('setup/qr_codes/retry.txt')
+            reply = render_reply('setup/qr_codes/retry.txt')
 
     else:
         # We have no idea why the user is texting us and would prefer it if
         # they left us alone
-        reply = render_template('setup/no_idea.txt')
+        reply = render_reply('setup/no_idea.txt')
 
     return reply
 
@@ -203,14 +377,16 @@ def config_image():
     """Returns the QR Code for the mailbox"""
     # Get our mailbox and its config image
     mailbox = Mailbox.query.first_or_404()
-    mailbox_data = mailbox.generate_config_image()
 
-    # Set up a stream
-    img_io = BytesIO()
-    mailbox_data.save(img_io)
-    img_io.seek(0)
+    try:
+        config_image = mailbox.generate_config_image()
+    except DataOverflowError:
+        # Even our compact format can't fit a big enough whitelist into the
+        # largest QR code
+        return ('This configuration is too large to fit in a QR code',
+                413, {'Content-Type': 'text/plain'})
 
-    return send_file(img_io, mimetype='image/png')
+    return send_file(BytesIO(config_image), mimetype='image/png')
 
 
 @setup.route('/error', methods=['POST'])
@@ -245,6 +421,6 @@ def handle_error():
     if voice_error:
         resp.say(render_template('voice/error.txt'), voice='alice')
     else:
-        resp.message(render_template('setup/error.txt'))
+        resp.message(render_reply('setup/error.txt'))
 
     return str(resp)
@@ -0,0 +1,107 @@
+import math
+import unicodedata
+
+
+# The GSM 03.38 alphabet. A message using only these characters is sent in
+# 7 bits per character (160 characters per segment) - any other character
+# switches the whole message to UCS-2 (just 70 per segment)
+GSM7_BASIC = set(
+    '@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !"#¤%&\'()*+,-./0123456789:;<=>?'
+    '¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà')
+
+# These take an escape character too, so they count twice
+GSM7_EXTENDED = set('^{}\\[~]|€\f')
+
+# Lookalikes we can swap for GSM characters without changing the meaning
+TRANSLITERATIONS = {
+    '‘': "'", '’': "'", '‚': "'", '‛': "'",
+    '′': "'", '“': '"', '”': '"', '„': '"',
+    '‟': '"', '″': '"', '–': '-', '—': '-',
+    '―': '-', '−': '-', '…': '...', '•': '-',
+    # Unusual spaces, and invisible ones
+    '\u00a0': ' ', '\u2002': ' ', '\u2003': ' ', '\u2009': ' ',
+    '\u202f': ' ', '\u200b': '', '\ufeff': '', '\t': ' ',
+}
+
+SEGMENT_LIMITS = {
+    # (characters in a single message, characters per segment of a longer
+    # one - the rest of each segment holds the header which joins them up)
+    'gsm7': (160, 153),
+    'ucs2': (70, 67),
+}
+
+ELLIPSIS = '...'
+
+
+def _is_gsm7(text):
+    return all(c in GSM7_BASIC or c in GSM7_EXTENDED for c in text)
+
+
+def _transliterate_char(c):
+    if c in GSM7_BASIC or c in GSM7_EXTENDED:
+        return c
+    if c in TRANSLITERATIONS:
+        return TRANSLITERATIONS[c]
+
+    # Drop accents GSM doesn't have, like the one in 'á'
+    stripped = ''.join(part for part in unicodedata.normalize('NFKD', c)
+                       if not unicodedata.combining(part))
+    return stripped if stripped and _is_gsm7(stripped) else c
+
+
+def transliterate(text):
+    """
+    Swaps characters outside the GSM alphabet for lookalikes, but only if
+    that makes the whole message GSM - if something like an emoji forces
+    UCS-2 anyway, we keep the original characters
+    """
+    if _is_gsm7(text):
+        return text
+
+    swapped = ''.join(_transliterate_char(c) for c in text)
+    return swapped if _is_gsm7(swapped) else text
+
+
+def count_segments(text):
+    """Returns the encoding ('gsm7' or 'ucs2') and segments a message needs"""
+    if _is_gsm7(text):
+        encoding = 'gsm7'
+        length = sum(2 if c in GSM7_EXTENDED else 1 for c in text)
+    else:
+        # Characters outside the Basic Multilingual Plane (like most emoji)
+        # take two UCS-2 code units
+        encoding = 'ucs2'
+        length = len(text.encode('utf-16-le')) // 2
+
+    single, multipart = SEGMENT_LIMITS[encoding]
+    if length <= single:
+        return encoding, 1 if length else 0
+    return encoding, int(math.ceil(length / multipart))
+
+
+def fit_to_segments(message, placeholder, text, max_segments):
+    """
+    Puts text in place of placeholder in a message, cutting text short (at
+    a word, with an ellipsis) so the whole message fits in max_segments
+    """
+    def fill(part):
+        return transliterate(message.replace(placeholder, part))
+
+    full = fill(text)
+    if count_segments(full)[1] <= max_segments:
+        return full
+
+    # Find the longest prefix of text which fits
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_segments(fill(text[:middle] + ELLIPSIS))[1] <= max_segments:
+            low = middle
+        else:
+            high = middle - 1
+
+    prefix = text[:low]
+    if ' ' in prefix and not text[low:low + 1].isspace():
+        prefix = prefix.rsplit(' ', 1)[0]
+
+    return fill(prefix.rstrip() + ELLIPSIS)
@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+status = Blueprint('status', __name__)
+
+from . import views # flake8: noqa
@@ -0,0 +1,91 @@
+from flask import abort, current_app, jsonify, request
+
+from . import status
+from ..allocations import ALLOCATIONS_HEADER, get_report, valid_token
+from ..analytics import get_daily_counts, get_hourly_counts, summarize
+from ..breaker import get_lookups_breaker
+from ..health import get_cache_state, get_database_probe, get_outbox_state
+from ..linetype import get_hit_ratio
+from ..metrics import get_metrics
+
+
+@status.route('/metrics')
+def show_metrics():
+    """Reports our counters and the state of our circuit breakers"""
+    counters = get_metrics()
+
+    return jsonify(
+        metrics=counters,
+        breakers={'lookups': get_lookups_breaker().state},
+        ratios={'linetype.offline': get_hit_ratio(counters)})
+
+
+def _format_counts(counts):
+    return [dict(start=start.isoformat(), counts=period_counts)
+            for start, period_counts in counts.items()]
+
+
+@status.route('/stats')
+def show_stats():
+    """
+    Reports our call and voicemail analytics. These come from our hourly
+    and daily rollups, so they can be up to ANALYTICS_ROLLUP_INTERVAL
+    seconds behind. They're our user's calls, so this needs the same token
+    as /allocations
+    """
+    if not valid_token(request.headers.get(ALLOCATIONS_HEADER)):
+        abort(403)
+
+    hourly = get_hourly_counts()
+    daily = get_daily_counts()
+
+    return jsonify(
+        last_24_hours=summarize(hourly),
+        last_30_days=summarize(daily),
+        hourly=_format_counts(hourly),
+        daily=_format_counts(daily))
+
+
+@status.route('/allocations')
+def show_allocations():
+    """
+    Reports what each endpoint's sampled requests left allocated, when
+    ALLOCATION_TRACKING is on. It shows our source paths, so it needs a
+    token from 'manage.py allocations --token'
+    """
+    if not valid_token(request.headers.get(ALLOCATIONS_HEADER)):
+        abort(403)
+
+    return jsonify(tracking=current_app.config['ALLOCATION_TRACKING'],
+                   endpoints=get_report())
+
+
+@status.route('/healthz')
+def liveness():
+    """Tells our load balancer this process is up and answering requests"""
+    return jsonify(status='ok')
+
+
+@status.route('/readyz')
+def readiness():
+    """
+    Tells our load balancer whether we can handle webhooks. Unlike index(),
+    this never calls Twilio - the only I/O is a rate-limited database probe
+    """
+    probe = get_database_probe()
+    ready = probe.check()
+
+    cache = get_cache_state()
+    breakers = {'lookups': get_lookups_breaker().state} if cache['ok'] \
+        else {}
+
+    response = jsonify(
+        status='ok' if ready else 'unavailable',
+        database=probe.to_dict(),
+        outbox=get_outbox_state(),
+        cache=cache,
+        breakers=breakers)
+
+    # An open breaker doesn't make us unready - we have fallbacks for it
+    response.status_code = 200 if ready else 503
+    return response
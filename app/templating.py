@@ -0,0 +1,121 @@
+from flask import current_app, render_template
+from jinja2 import FileSystemBytecodeCache
+
+from . import metrics
+from .sms import count_segments, fit_to_segments, transliterate
+
+
+# Values we can safely use in a memoized reply's cache key. Anything else
+# (like a Voicemail) is rendered every time
+MEMOIZABLE_TYPES = (str, int, float, bool, type(None))
+
+
+def _context_key(context):
+    """
+    Makes a hashable key out of a template's context, or returns None if
+    the context can't be memoized
+    """
+    items = []
+
+    for name, value in sorted(context.items()):
+        # Mailboxes change as our user answers setup questions, so we key
+        # their renders on the Mailbox's version instead of its identity
+        version = getattr(value, 'version', None)
+
+        if version is not None:
+            items.append((name, type(value).__name__, version))
+        elif isinstance(value, MEMOIZABLE_TYPES):
+            items.append((name, value))
+        elif isinstance(value, (set, frozenset)):
+            items.append((name, frozenset(value)))
+        elif isinstance(value, (list, tuple)):
+            items.append((name, tuple(value)))
+        else:
+            return None
+
+    return tuple(items)
+
+
+def _render(template_name, context, count=True):
+    """
+    Renders a text message, with any characters which would force it into
+    UCS-2 swapped for GSM lookalikes (see app/sms.py). Returns the reply and
+    (if count is set) its encoding and number of segments.
+
+    Most of our replies are either static or only depend on our Mailbox, so
+    we remember each reply (and its segments) and only render it again when
+    its context changes.
+    """
+    key = None
+    if current_app.config['MEMOIZE_REPLIES']:
+        context_key = _context_key(context)
+        if context_key is not None:
+            key = (template_name, context_key)
+
+    replies = current_app.extensions['replies']
+    if key is not None:
+        # One lookup, since another thread can clear replies at any time
+        memoized = replies.get(key)
+        if memoized is not None and (memoized[1] is not None or not count):
+            metrics.increment('templates.memoized')
+            return memoized
+
+    with metrics.timer('templates.render'):
+        reply = transliterate(render_template(template_name, **context))
+    segments = count_segments(reply) if count else None
+
+    if key is not None:
+        # Don't let the memo grow forever - old Mailbox versions never come
+        # back, so it's fine to start over
+        if len(replies) >= current_app.config['MEMOIZE_REPLIES_SIZE']:
+            replies.clear()
+        replies[key] = (reply, segments)
+
+    return reply, segments
+
+
+def _record_segments(encoding, segments):
+    """Records the segments (what Twilio bills us for) in a reply"""
+    metrics.increment('sms.messages')
+    metrics.increment('sms.segments', segments)
+    metrics.increment('sms.segments.' + encoding, segments)
+
+
+def render_reply(template_name, **context):
+    """Renders a text message reply"""
+    reply, (encoding, segments) = _render(template_name, context)
+    _record_segments(encoding, segments)
+    return reply
+
+
+def render_truncated_reply(template_name, name, text, max_segments,
+                           **context):
+    """
+    Renders a text message reply with text as the variable name, cutting
+    text short if the whole reply wouldn't fit in max_segments
+    """
+    # Render around a placeholder, so we only render the template once
+    placeholder = '\x00{0}\x00'.format(name)
+    context[name] = placeholder
+
+    reply, _ = _render(template_name, context, count=False)
+    reply = fit_to_segments(reply, placeholder, text, max_segments)
+    _record_segments(*count_segments(reply))
+    return reply
+
+
+def init_app(app):
+    """Sets up template caching for an app"""
+    app.extensions['replies'] = {}
+
+    # Keep compiled templates on disk so new workers don't have to compile
+    # them again
+    if app.config['JINJA_BYTECODE_CACHE']:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+            app.config['JINJA_BYTECODE_CACHE_DIR'])
+
+    # Load every template now, so our first replies don't pay to compile them
+    if app.config['PRELOAD_TEMPLATES']:
+        for template_name in app.jinja_env.list_templates(
+                extensions=['html', 'txt']):
+            app.jinja_env.get_template(template_name)
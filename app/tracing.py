@@ -0,0 +1,224 @@
+from contextlib import contextmanager
+from flask import request
+from functools import wraps
+from threading import Lock, local
+from time import time
+
+import json
+import os
+import uuid
+import zlib
+
+
+# Each thread keeps the spans of the trace it's working on. Spans are only
+# recorded while a sampled trace is active, so unsampled requests (and code
+# running outside a request) pay for little more than a list lookup
+_local = local()
+
+
+class Span(object):
+    """One timed operation within a trace"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start', 'end',
+                 'attributes')
+
+    def __init__(self, trace_id, parent_id, name, attributes, start=None):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time() if start is None else start
+        self.end = None
+        self.attributes = attributes
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration_ms': round((self.end - self.start) * 1000, 3),
+            'attributes': self.attributes,
+        }
+
+
+class Tracer(object):
+    """
+    Decides which traces to sample, and appends their spans to a JSON lines
+    file - one span per line, which a collector can tail
+    """
+
+    def __init__(self, path, sample_rate):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.lock = Lock()
+
+    def is_sampled(self, trace_id):
+        # Hash the trace ID rather than rolling a die, so every webhook for
+        # the same call makes the same decision
+        bucket = zlib.crc32(trace_id.encode('utf-8')) % 10000
+        return bucket < self.sample_rate * 10000
+
+    def export(self, spans):
+        lines = ''.join(json.dumps(span.to_dict()) + '\n' for span in spans)
+
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(lines)
+
+
+def _state():
+    if not hasattr(_local, 'stack'):
+        _local.tracer = None
+        _local.stack = []
+        _local.finished = []
+    return _local
+
+
+def begin_trace(tracer, name, trace_id, parent_id=None, **attributes):
+    """Starts a trace in this thread, if the trace is sampled"""
+    state = _state()
+    state.stack = []
+    state.finished = []
+    state.tracer = None
+
+    if tracer is None or not tracer.is_sampled(trace_id):
+        return None
+
+    state.tracer = tracer
+    root = Span(trace_id, parent_id, name, attributes)
+    state.stack.append(root)
+    return root
+
+
+def end_trace(**attributes):
+    """Finishes this thread's trace and exports its spans"""
+    state = _state()
+    if not state.stack:
+        return
+
+    root = state.stack[0]
+    root.attributes.update(attributes)
+    root.end = time()
+
+    spans = state.finished + [root]
+    tracer = state.tracer
+
+    state.stack = []
+    state.finished = []
+    state.tracer = None
+
+    tracer.export(spans)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times the code inside a with block as a child of the current span"""
+    stack = _state().stack
+    if not stack:
+        yield None
+        return
+
+    child = Span(stack[-1].trace_id, stack[-1].span_id, name, attributes)
+    stack.append(child)
+
+    try:
+        yield child
+    finally:
+        stack.pop()
+        child.end = time()
+        _local.finished.append(child)
+
+
+def record_span(name, start, end, **attributes):
+    """Records a span which has already finished, like a database query"""
+    stack = _state().stack
+    if not stack:
+        return
+
+    finished = Span(stack[-1].trace_id, stack[-1].span_id, name, attributes,
+                    start=start)
+    finished.end = end
+    _local.finished.append(finished)
+
+
+def current_context():
+    """
+    Returns what another thread needs to continue our trace, or None if we
+    aren't tracing
+    """
+    state = _state()
+    if not state.stack:
+        return None
+
+    return state.tracer, state.stack[-1].trace_id, state.stack[-1].span_id
+
+
+@contextmanager
+def continue_trace(context, name, **attributes):
+    """Continues a trace from current_context() in this thread"""
+    if context is None:
+        yield
+        return
+
+    tracer, trace_id, parent_id = context
+    begin_trace(tracer, name, trace_id, parent_id, **attributes)
+
+    try:
+        yield
+    finally:
+        end_trace()
+
+
+def propagate(func):
+    """
+    Wraps a function which will run in another thread, so the spans it
+    records belong to the trace we're in now
+    """
+    context = current_context()
+    if context is None:
+        return func
+
+    name = getattr(func, '__name__', 'background')
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with continue_trace(context, name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def init_app(app):
+    """Traces each request to an app, if TRACE_FILE is set"""
+    if not app.config['TRACE_FILE']:
+        return
+
+    tracer = Tracer(app.config['TRACE_FILE'],
+                    app.config['TRACE_SAMPLE_RATE'])
+    app.extensions['tracer'] = tracer
+
+    @app.before_request
+    def begin_request_trace():
+        # Twilio's SIDs tie every webhook (and background send) for the same
+        # call or message together
+        trace_id = request.values.get('CallSid') or \
+            request.values.get('MessageSid') or uuid.uuid4().hex
+
+        begin_trace(tracer, '{0} {1}'.format(request.method, request.path),
+                    trace_id, endpoint=request.endpoint, pid=os.getpid())
+
+    @app.after_request
+    def record_status(response):
+        state = _state()
+        if state.stack:
+            state.stack[0].attributes['status'] = response.status_code
+        return response
+
+    @app.teardown_request
+    def end_request_trace(exc):
+        if exc is not None:
+            end_trace(error=repr(exc))
+        else:
+            end_trace()
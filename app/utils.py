@@ -1,47 +1,139 @@
-from flask import current_app, url_for
-from time import sleep
+from collections import namedtuple
+from flask import current_app, request, url_for
+from time import sleep, time
 from twilio.rest import TwilioRestClient
 from twilio.rest.exceptions import TwilioRestException
 from twilio.rest.lookups import TwilioLookupsClient
+from werkzeug.wsgi import wrap_file
 
+import httplib2
+import os
 import phonenumbers
+import socket
+
+from . import fake_twilio, metrics, tracing
+from .breaker import get_lookups_breaker
+from .deadlines import get_timeout, has_time
+from .senders import get_sender_numbers, get_sender_pool
+
+
+# Stands in for a Lookups API result when we answer from our carrier cache
+CachedLookup = namedtuple('CachedLookup', ['phone_number', 'carrier'])
 
 
 def get_twilio_rest_client():
-    """Instantiates a Twilio REST Client"""
-    client = TwilioRestClient(current_app.config['TWILIO_ACCOUNT_SID'],
-                              current_app.config['TWILIO_AUTH_TOKEN'])
+    """
+    Instantiates a Twilio REST Client, which gives up once our request's
+    deadline passes (or after TWILIO_REST_TIMEOUT seconds)
+    """
+    if current_app.config['TWILIO_FAKE_BACKEND']:
+        return fake_twilio.rest_client
+
+    client = TwilioRestClient(
+        current_app.config['TWILIO_ACCOUNT_SID'],
+        current_app.config['TWILIO_AUTH_TOKEN'],
+        timeout=get_timeout(current_app.config['TWILIO_REST_TIMEOUT']))
     return client
 
 
 def send_async_message(app, body, to_number, media_url=None, delay=30):
     """Used to send text messages asynchronously in a Thread"""
-    # Sleep (if specified)
-    sleep(delay)
+    from .deliveries import get_status_callback_url
+
+    # Sleep (if specified). Nothing's really being delivered with our fake
+    # Twilio backend, so there's no need to wait for anything then
+    if not app.config['TWILIO_FAKE_BACKEND']:
+        sleep(delay)
 
     if media_url:
         media_url = [media_url]
 
     with app.app_context():
+        from_number, wait = get_sender_pool().acquire(to_number)
+
+        # We're in a background thread, so we can afford to wait for our
+        # sender number to be within its rate limit
+        if wait and not app.config['TWILIO_FAKE_BACKEND']:
+            sleep(wait)
+
         client = get_twilio_rest_client()
-        client.messages.create(
-            body=body,
-            to=to_number,
-            from_=current_app.config['TWILIO_PHONE_NUMBER'],
-            media_url=media_url
-        )
+        with tracing.span('twilio.messages.create', delay=delay,
+                          from_number=from_number):
+            client.messages.create(
+                body=body,
+                to=to_number,
+                from_=from_number,
+                media_url=media_url,
+                status_callback=get_status_callback_url()
+            )
+
+
+def get_cached_carrier(phone_number):
+    """Returns the carrier info we last saw for a phone number, if any"""
+    return current_app.cache.get('carrier:' + phone_number)
 
 
 def look_up_number(phone_number):
     """Looks up a phone number to determine if it can receive a SMS message"""
-    client = TwilioLookupsClient(current_app.config['TWILIO_ACCOUNT_SID'],
-                                 current_app.config['TWILIO_AUTH_TOKEN'])
+    # Phone numbers rarely change carriers, so use the carrier info we saw
+    # last time if we have it
+    carrier = get_cached_carrier(phone_number)
+    if carrier is not None:
+        metrics.increment('lookups.cache_hits')
+        return CachedLookup(phone_number, carrier)
+
+    # Without enough time left, answering sooner beats knowing the carrier.
+    # (Check before the breaker, so we don't take a trial we won't send)
+    if not has_time():
+        metrics.increment('lookups.skipped')
+        return None
+
+    # If the Lookups API has been failing, don't make our caller wait on it
+    breaker = get_lookups_breaker()
+    if not breaker.allow_request():
+        metrics.increment('lookups.degraded')
+        return None
 
+    budget = current_app.config['TWILIO_LOOKUPS_TIMEOUT']
+    timeout = get_timeout(budget)
+    if current_app.config['TWILIO_FAKE_BACKEND']:
+        client = fake_twilio.lookups_client
+    else:
+        client = TwilioLookupsClient(current_app.config['TWILIO_ACCOUNT_SID'],
+                                     current_app.config['TWILIO_AUTH_TOKEN'],
+                                     timeout=timeout)
+
+    start = time()
     try:
-        number_info = client.phone_numbers.get(phone_number,
-                                               include_carrier_info=True)
-    except TwilioRestException:
-        number_info = None
+        with tracing.span('twilio.lookups'):
+            number_info = client.phone_numbers.get(phone_number,
+                                                   include_carrier_info=True)
+    except TwilioRestException as e:
+        # A 4xx error just means Twilio doesn't know this number, which is
+        # a perfectly healthy answer
+        if e.status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return None
+    except (socket.error, httplib2.HttpLib2Error):
+        # Timeouts and connection errors - unless we cut the timeout short
+        # to meet our own deadline, which isn't the API's fault
+        if timeout >= budget:
+            breaker.record_failure()
+        else:
+            breaker.release_trial()
+        return None
+
+    # Answers which blew our latency budget count against the API too
+    if time() - start > budget:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+    metrics.increment('lookups.requests')
+    current_app.cache.set('carrier:' + phone_number, number_info.carrier,
+                          timeout=current_app.config['CARRIER_CACHE_TIMEOUT'])
 
     return number_info
 
@@ -59,33 +151,21 @@ def convert_to_national_format(phone_number):
     return value
 
 
-def set_twilio_number_urls():
-    """
-    Sets the voice_url and sms_url on our Twilio phone number to point to this
-    application
-    """
-    client = get_twilio_rest_client()
-
-    # Get our Twilio phone number
-    numbers = client.phone_numbers.list(
-        phone_number=current_app.config['TWILIO_PHONE_NUMBER'])
-    twilio_number = numbers[0]
-
+def _get_url_updates(twilio_number, urls):
+    """The URL properties a Twilio number needs updated to point to us"""
+    voice_url, sms_url, error_url = urls
     update_kwargs = {}
 
     # Set the URLs only if they're blank (don't override any existing config)
     if (not twilio_number.voice_url or
             'demo.twilio.com' in twilio_number.voice_url):
-        update_kwargs['voice_url'] = url_for(
-            'voice.incoming_call', _external=True)
+        update_kwargs['voice_url'] = voice_url
         update_kwargs['voice_method'] = 'POST'
     if not twilio_number.sms_url or 'demo.twilio.com' in twilio_number.sms_url:
-        update_kwargs['sms_url'] = url_for(
-            'setup.incoming_message', _external=True)
+        update_kwargs['sms_url'] = sms_url
         update_kwargs['sms_method'] = 'POST'
 
     # Also set the fallback urls
-    error_url = url_for('setup.handle_error', _external=True)
     if not twilio_number.voice_fallback_url:
         update_kwargs['voice_fallback_url'] = error_url
         update_kwargs['voice_fallback_method'] = 'POST'
@@ -93,9 +173,106 @@ def set_twilio_number_urls():
         update_kwargs['sms_fallback_url'] = error_url
         update_kwargs['sms_fallback_method'] = 'POST'
 
-    # If we added any kwargs to our dict, update those properties on the number
-    if update_kwargs:
-        twilio_number.update(**update_kwargs)
+    return update_kwargs
+
+
+def set_twilio_number_urls():
+    """
+    Sets the voice_url and sms_url on our Twilio phone numbers (our main
+    number and any sender numbers) to point to this application
+    """
+    client = get_twilio_rest_client()
+    sender_numbers = get_sender_numbers()
+
+    urls = (url_for('voice.incoming_call', _external=True),
+            url_for('setup.incoming_message', _external=True),
+            url_for('setup.handle_error', _external=True))
+
+    # Get our Twilio phone numbers - all in one request if we have several
+    if len(sender_numbers) == 1:
+        twilio_numbers = client.phone_numbers.list(
+            phone_number=sender_numbers[0])[:1]
+    else:
+        twilio_numbers = [
+            number for number in client.phone_numbers.list()
+            if number.phone_number in sender_numbers]
+
+        # Any numbers which weren't on the first page need a request each
+        found = set(number.phone_number for number in twilio_numbers)
+        for phone_number in sender_numbers:
+            if phone_number not in found:
+                twilio_numbers.extend(
+                    client.phone_numbers.list(phone_number=phone_number)[:1])
+
+    for twilio_number in twilio_numbers:
+        update_kwargs = _get_url_updates(twilio_number, urls)
+
+        # If we added any kwargs to our dict, update those properties on the
+        # number
+        if update_kwargs:
+            twilio_number.update(**update_kwargs)
+
+
+def _read_range(f, length, chunk_size=64 * 1024):
+    """Yields the next length bytes of a file in chunks, then closes it"""
+    try:
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def send_range_file(path, mimetype, cache_timeout):
+    """
+    Sends a file which never changes, with support for HTTP Range requests
+    (which browsers use to seek through audio) and long-lived cache headers.
+
+    Whenever the response runs to the end of the file we hand the file to
+    the WSGI server's file_wrapper, which lets gunicorn send it with a
+    zero-copy sendfile() call.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+
+    response = current_app.response_class(mimetype=mimetype,
+                                          direct_passthrough=True)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.cache_control.public = True
+    response.cache_control.max_age = cache_timeout
+    response.set_etag('{0}-{1}'.format(int(stat.st_mtime), size))
+    response.last_modified = int(stat.st_mtime)
+
+    if response.get_etag()[0] in request.if_none_match:
+        response.status_code = 304
+        return response
+
+    start, stop = 0, size
+    if request.range is not None:
+        byte_range = request.range.range_for_length(size)
+
+        if byte_range is None:
+            response.status_code = 416
+            response.headers['Content-Range'] = 'bytes */{0}'.format(size)
+            return response
+
+        start, stop = byte_range
+        response.status_code = 206
+        response.content_range = request.range.make_content_range(size)
+
+    f = open(path, 'rb')
+    f.seek(start)
+
+    if stop == size:
+        response.response = wrap_file(request.environ, f)
+    else:
+        response.response = _read_range(f, stop - start)
+    response.content_length = stop - start
+
+    return response
 
 
 def gruber_quote():  # pragma: no cover
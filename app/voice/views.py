@@ -1,10 +1,16 @@
-from flask import current_app, redirect, render_template, request, url_for
+from flask import abort, current_app, redirect, render_template, request, \
+    url_for
 from twilio import twiml
 
 from . import voice
-from ..decorators import validate_twilio_request
+from ..analytics import record_event
+from ..deadlines import DeadlineExceeded, has_time
+from ..decorators import reject_blocked_callers, shed_load, \
+    validate_twilio_request
+from ..linetype import classify_number
 from ..models import Mailbox, Voicemail
-from ..utils import get_twilio_rest_client, look_up_number
+from ..recordings import get_recording_archive, get_recording_url
+from ..utils import get_twilio_rest_client, look_up_number, send_range_file
 
 
 MISCONFIGURED = """This phone number cannot receive voicemails right now.
@@ -17,10 +23,63 @@ TEXT_EMAIL = """{0} will receive text messages you send to this number.
                 You can email them at {1}"""
 GATHER_CONFIRM = """If you would still like to leave {0} a voicemail,
                  press 1"""
+GOODBYE = 'Thank you for calling. Goodbye.'
+
+# Where we keep the last gather prompt we sent, for degraded_call()
+GATHER_PROMPT_KEY = 'twiml:gather_prompt'
+
+
+def _remember_gather_prompt(twiml_response):
+    """Saves a gather prompt for degraded_call(), if it's changed"""
+    # Mailboxes rarely change, so only write to our cache when ours did
+    if current_app.extensions.get('gather_prompt') != twiml_response:
+        current_app.cache.set(GATHER_PROMPT_KEY, twiml_response, timeout=0)
+        current_app.extensions['gather_prompt'] = twiml_response
+
+
+def degraded_call():
+    """
+    Answers /call when we're overloaded, without touching the database or
+    any APIs: recent callers go straight to the record view, and everyone
+    else gets the last gather prompt we sent (or also goes to record)
+    """
+    caller = request.form.get('From')
+    if caller and current_app.cache.get(caller):
+        return redirect(url_for('voice.record'))
+
+    if current_app.config['ADMISSION_SHED_RESPONSE'] == 'gather':
+        gather_prompt = current_app.cache.get(GATHER_PROMPT_KEY)
+        if gather_prompt is not None:
+            return gather_prompt
+
+    return record()
+
+
+@voice.errorhandler(DeadlineExceeded)
+def deadline_exceeded(e):
+    """
+    Answers a webhook which ran out of time, before Twilio gives up on us.
+    Calls get the same answer as when we're overloaded, and callers who
+    pressed 1 can still leave their message
+    """
+    if request.endpoint == 'voice.incoming_call':
+        return degraded_call()
+    if request.endpoint == 'voice.record':
+        return _leave_message(twiml.Response())
+
+    # Our recording pages are for browsers, not Twilio
+    if request.endpoint in ('voice.view_recording', 'voice.recording_audio'):
+        return ('', 503)
+
+    # Anything else would make Twilio say "an application error has
+    # occurred", so just carry on with the call
+    return str(twiml.Response())
 
 
 @voice.route('/call', methods=['POST'])
 @validate_twilio_request
+@reject_blocked_callers
+@shed_load(degraded_call)
 def incoming_call(retry=False):
     """
     Receives incoming calls to our Twilio number, including calls that our
@@ -43,22 +102,35 @@ def incoming_call(retry=False):
         resp.say(MISCONFIGURED, voice='alice')
         return str(resp)
 
-    elif caller in mailbox.whitelist:
-        # If the caller is on our whitelist, send them to the record view
+    record_event('call.received')
+
+    if mailbox.is_whitelisted(caller):
+        # If the caller is on our whitelist (or matches one of its rules),
+        # send them to the record view
+        record_event('call.whitelisted')
+        return redirect(url_for('voice.record'))
+
+    # Our user's schedule can say to always (or never) take voicemails now
+    scheduled_action = mailbox.get_scheduled_action()
+    if scheduled_action == 'record':
+        record_event('call.scheduled')
         return redirect(url_for('voice.record'))
 
     resp.say(UNABLE_TO_ANSWER.format(mailbox.name), voice='alice')
 
-    # Look up what type of phone the caller is using
-    caller_info = look_up_number(caller)
+    # Work out what type of phone the caller is using - offline if we can,
+    # and with Twilio Lookups if we can't
+    caller_info = classify_number(caller) or look_up_number(caller)
 
     # If we think the caller is on a mobile phone, send them a text message
-    # with our user's contact info
+    # with our user's contact info (if we've still got time to)
     if caller_info and caller_info.carrier[
-            'type'] == 'mobile' and caller_info.carrier['name']:
+            'type'] == 'mobile' and caller_info.carrier['name'] and \
+            (retry or has_time()):
         resp.say(SENDING_MESSAGE.format(mailbox.name), voice='alice')
         if not retry:
             mailbox.send_contact_info(caller)
+        record_event('call.deflected')
 
         # Add this phone number to our cache of recent callers
         current_app.cache.set(caller, True, timeout=30 * 60)
@@ -66,15 +138,25 @@ def incoming_call(retry=False):
 
     resp.say(TEXT_EMAIL.format(mailbox.name, mailbox.email), voice='alice')
 
+    if scheduled_action == 'strict':
+        # No voicemails right now
+        resp.say(GOODBYE, voice='alice')
+        record_event('call.deflected')
+        return str(resp)
+
     # Ask the caller if they *really* need to leave a voicemail
     resp.pause(length=1)
     with resp.gather(numDigits=1, action=url_for('voice.record')) as g:
         g.say(GATHER_CONFIRM.format(mailbox.name), voice='alice')
 
     # Hang up if they don't enter any digits
-    resp.say('Thank you for calling. Goodbye.', voice='alice')
+    resp.say(GOODBYE, voice='alice')
+    record_event('call.prompted')
 
-    return str(resp)
+    twiml_response = str(resp)
+    _remember_gather_prompt(twiml_response)
+
+    return twiml_response
 
 
 @voice.route('/record', methods=['GET', 'POST'])
@@ -83,13 +165,22 @@ def record():
     resp = twiml.Response()
 
     # If a Digits attribute is present, make sure it's a value of 1
-    if 'Digits' in request.form and request.form['Digits'] != '1':
-        resp.say(
-            'Thank you for not leaving a voicemail. Goodbye.',
-            voice='alice')
-        return str(resp)
+    if 'Digits' in request.form:
+        if request.form['Digits'] != '1':
+            record_event('call.declined')
+            resp.say(
+                'Thank you for not leaving a voicemail. Goodbye.',
+                voice='alice')
+            return str(resp)
+
+        record_event('call.pressed_one')
 
     # Otherwise, begrudgingly let them leave a voicemail
+    return _leave_message(resp)
+
+
+def _leave_message(resp):
+    """Asks a caller to leave their message, and records it"""
     resp.say('You may now leave a message after the beep.', voice='alice')
 
     # Record and transcribe their message
@@ -119,7 +210,8 @@ def send_notification():
     voicemail = Voicemail(
         request.form['From'], request.form.get(
             'TranscriptionText', '(transcription failed)'),
-        request.form['RecordingSid'])
+        request.form['RecordingSid'],
+        recording_url=request.form.get('RecordingUrl'))
 
     voicemail.send_notification()
 
@@ -130,12 +222,52 @@ def send_notification():
 @voice.route('/recording/<recording_sid>')
 def view_recording(recording_sid):
     """A small web page for listening to a recording"""
-    # Retrieve the recording and transcription from Twilio
+    archive = get_recording_archive()
+
+    try:
+        metadata = archive.get_metadata(recording_sid)
+    except ValueError:
+        abort(404)
+
+    # If we've archived this recording, we don't need to ask Twilio anything
+    if metadata is not None and archive.has_recording(recording_sid):
+        return render_template(
+            'voice/recording.html', from_number=metadata['from_number'],
+            transcription=metadata['transcription'],
+            date_created=metadata['date_created'],
+            audio_url=url_for('voice.recording_audio',
+                              recording_sid=recording_sid))
+
+    # Otherwise retrieve the recording and transcription from Twilio
     client = get_twilio_rest_client()
 
     recording = client.recordings.get(recording_sid)
     transcription = recording.transcriptions.list()[0].transcription_text
     call = client.calls.get(recording.call_sid)
 
-    return render_template('voice/recording.html', recording=recording,
-                           transcription=transcription, call=call)
+    return render_template(
+        'voice/recording.html', from_number=call.from_,
+        transcription=transcription,
+        date_created=recording.date_created.isoformat(),
+        audio_url=recording.formats['mp3'])
+
+
+@voice.route('/recording/<recording_sid>/audio.mp3')
+def recording_audio(recording_sid):
+    """Serves a recording's audio from our archive"""
+    archive = get_recording_archive()
+
+    try:
+        has_recording = archive.has_recording(recording_sid)
+    except ValueError:
+        abort(404)
+
+    # If we haven't archived this recording (yet), send the browser to
+    # Twilio's copy
+    if not has_recording:
+        return redirect(get_recording_url(recording_sid) + '.mp3')
+
+    # Recordings never change, so browsers can cache them for as long as
+    # they like
+    return send_range_file(archive.audio_path(recording_sid), 'audio/mpeg',
+                           current_app.config['RECORDINGS_CACHE_TIMEOUT'])
@@ -0,0 +1,56 @@
+from time import time
+
+import phonenumbers
+
+from . import db
+from .blocklist import get_blocklist
+from .linetype import get_carrier_index
+from .utils import get_twilio_rest_client
+
+
+def warm_up_shared(app):
+    """
+    Loads data every worker needs before gunicorn forks them (with
+    preload_app), so the workers share one copy-on-write copy of it
+    """
+    start = time()
+
+    with app.app_context():
+        # phonenumbers loads each region's metadata the first time it sees
+        # a number from that region
+        phonenumbers.parse(app.config['TWILIO_PHONE_NUMBER'] or
+                           '+15555555555')
+
+        if app.config['OFFLINE_LINE_TYPES']:
+            get_carrier_index()
+
+        # Map our blocklist in the master, so workers inherit the mapping
+        get_blocklist()
+
+    return time() - start
+
+
+def warm_up_worker(app):
+    """
+    Gets a freshly forked worker ready for its first webhook: opens its own
+    database connection and loads our Mailbox
+    """
+    from .models import Mailbox
+
+    start = time()
+
+    with app.app_context():
+        # Connections made before the fork are shared with the master
+        # process, so never reuse them
+        db.get_engine(app).dispose()
+
+        # Our first query opens a pooled connection (and runs its setup)
+        Mailbox.query.first()
+        db.session.remove()
+
+        # twilio's 5.x client opens a new HTTP connection for each request,
+        # so there's no connection pool to fill - but we can get its first
+        # import-time and setup costs out of the way
+        get_twilio_rest_client()
+
+    return time() - start
@@ -0,0 +1,276 @@
+from itertools import chain
+
+import csv
+import phonenumbers
+import re
+
+from .utils import convert_to_national_format
+
+
+# Numbers in a whitelist text message can be separated by commas or
+# semicolons (but not spaces - "415 555 5555" is one number)
+SEPARATORS = re.compile(r'[,;\n]+')
+
+
+def numbers_from_text(text):
+    """Splits the body of a whitelist text message into candidate numbers"""
+    return SEPARATORS.split(text)
+
+
+def numbers_from_vcard(lines):
+    """Yields the value of every TEL property in a vCard file"""
+    for line in lines:
+        name, _, value = line.partition(':')
+
+        # Property names can have parameters ("TEL;TYPE=CELL") and a group
+        # prefix ("item1.TEL")
+        if name.split(';')[0].split('.')[-1].upper() == 'TEL':
+            yield value
+
+
+def numbers_from_csv(lines):
+    """Yields every cell in a CSV file"""
+    for row in csv.reader(lines):
+        for cell in row:
+            yield cell
+
+
+def numbers_from_file(lines):
+    """
+    Yields candidate numbers from the lines of a vCard or CSV file, working
+    out which kind of file it is from the first line
+    """
+    lines = iter(lines)
+    first_line = next(lines, '')
+    lines = chain([first_line], lines)
+
+    if first_line.strip().upper().startswith('BEGIN:VCARD'):
+        return numbers_from_vcard(lines)
+    return numbers_from_csv(lines)
+
+
+def normalize_numbers(candidates, region_code):
+    """
+    Parses candidate phone numbers in a single pass.
+
+    Returns a set of the valid numbers in E.164 format and a count of the
+    candidates which weren't valid phone numbers. Candidates without any
+    digits (like CSV headers and names) are skipped without being counted.
+    """
+    numbers = set()
+    seen = set()
+    invalid = 0
+
+    for candidate in candidates:
+        candidate = candidate.strip()
+
+        # Don't parse the same string twice
+        if candidate in seen or not any(c.isdigit() for c in candidate):
+            continue
+        seen.add(candidate)
+
+        try:
+            parsed_number = phonenumbers.parse(candidate, region_code)
+        except phonenumbers.phonenumberutil.NumberParseException:
+            invalid += 1
+            continue
+
+        if not phonenumbers.is_valid_number(parsed_number):
+            invalid += 1
+            continue
+
+        numbers.add(phonenumbers.format_number(
+            parsed_number, phonenumbers.PhoneNumberFormat.E164))
+
+    return numbers, invalid
+
+
+# Whitelist rules let a whole block of numbers through. They're kept in the
+# whitelist alongside exact numbers, in one of these canonical forms:
+#   '+1415555*'                   every number starting with +1 415 555
+#   '+14155550100..+14155550199'  every number from the first to the last
+RANGE_SEPARATOR = re.compile(r'\s*(?:\.\.|\bto\b)\s*', re.IGNORECASE)
+
+# So nobody whitelists a whole country by accident ('+1*')
+MIN_PREFIX_DIGITS = 4
+
+# Marks a trie node where a rule matches. Its value is the set of number
+# lengths (in digits) the rule matches, with 0 meaning any length
+RULE_END = '*'
+
+
+# What's left of a rule once its '*' or range separator is taken out
+RULE_CHARACTERS = re.compile(r'^[\d\s+().-]+$')
+
+
+def is_rule(candidate):
+    """
+    Checks if a candidate looks like a prefix or range rule. A name (like a
+    CSV cell 'Tom to Jerry') which ends in '*' or has 'to' in it isn't one
+    """
+    candidate = candidate.strip()
+
+    if candidate.endswith('*'):
+        rest = candidate[:-1]
+    elif RANGE_SEPARATOR.search(candidate) is not None:
+        rest = RANGE_SEPARATOR.sub(' ', candidate)
+    else:
+        return False
+
+    return RULE_CHARACTERS.match(rest) is not None and \
+        any(c.isdigit() for c in rest)
+
+
+def _prefix_digits(text, region_code):
+    """The digits of a partial phone number, with its country code"""
+    digits = ''.join(c for c in text if c.isdigit())
+    if not digits or text.strip().startswith('+'):
+        return digits
+
+    # A national number, like '415 555' - swap any national prefix (like
+    # the UK's 0) for our user's country code
+    metadata = phonenumbers.PhoneMetadata.metadata_for_region(region_code)
+    national_prefix = metadata.national_prefix if metadata else None
+    if national_prefix and digits.startswith(national_prefix):
+        digits = digits[len(national_prefix):]
+
+    return str(phonenumbers.country_code_for_region(region_code)) + digits
+
+
+def parse_rule(candidate, region_code):
+    """
+    Parses a prefix rule ('+1 415 555*') or a range rule ('415 555 0100 to
+    0199', where the end of the range can be a full number or just its last
+    digits). Returns the rule in its canonical form, or None if it's invalid
+    """
+    candidate = candidate.strip()
+
+    if candidate.endswith('*'):
+        digits = _prefix_digits(candidate[:-1], region_code)
+        if len(digits) < MIN_PREFIX_DIGITS or len(digits) > 15:
+            return None
+        return '+{0}*'.format(digits)
+
+    parts = RANGE_SEPARATOR.split(candidate)
+    if len(parts) != 2:
+        return None
+
+    low_numbers, _ = normalize_numbers(parts[:1], region_code)
+    high_numbers, _ = normalize_numbers(parts[1:], region_code)
+    if not low_numbers:
+        return None
+    low = low_numbers.pop()
+
+    high_digits = ''.join(c for c in parts[1] if c.isdigit())
+    if high_numbers:
+        high = high_numbers.pop()
+    elif high_digits and len(high_digits) < len(low) - 1:
+        high = low[:len(low) - len(high_digits)] + high_digits
+    else:
+        return None
+
+    if len(high) != len(low) or high < low:
+        return None
+    return '{0}..{1}'.format(low, high)
+
+
+def range_to_prefixes(low, high):
+    """
+    Splits a range of numbers with the same number of digits into the
+    fewest prefixes which cover it exactly, like '0100'-'0199' into '01'
+    """
+    common = 0
+    while common < len(low) and low[common] == high[common]:
+        common += 1
+    if common == len(low):
+        return [low]
+
+    prefix = low[:common]
+    rest = len(low) - common
+    if common and low[common:] == '0' * rest and high[common:] == '9' * rest:
+        return [prefix]
+
+    first, last = int(low[common]), int(high[common])
+    low_rest, high_rest = low[common + 1:], high[common + 1:]
+    low_full = low_rest == '0' * len(low_rest)
+    high_full = high_rest == '9' * len(high_rest)
+
+    prefixes = []
+
+    # The part of the range under the first digit, unless it's all of it
+    if low_full:
+        prefixes.append(prefix + str(first))
+    else:
+        prefixes.extend(range_to_prefixes(
+            low, prefix + str(first) + '9' * len(low_rest)))
+
+    # Every digit in between is covered completely
+    prefixes.extend(prefix + str(digit) for digit in range(first + 1, last))
+
+    # And the part under the last digit
+    if high_full:
+        prefixes.append(prefix + str(last))
+    else:
+        prefixes.extend(range_to_prefixes(
+            prefix + str(last) + '0' * len(high_rest), high))
+
+    return prefixes
+
+
+def _add_to_trie(trie, digits, length):
+    node = trie
+    for digit in digits:
+        node = node.setdefault(digit, {})
+    node.setdefault(RULE_END, set()).add(length)
+
+
+def compile_rules(whitelist):
+    """
+    Compiles the rules in a whitelist into a trie of digits (nested dicts),
+    or returns None if it doesn't have any rules
+    """
+    trie = {}
+
+    for entry in whitelist:
+        if entry.endswith('*'):
+            _add_to_trie(trie, entry[1:-1], 0)
+        elif '..' in entry:
+            low, high = entry.split('..')
+            for prefix in range_to_prefixes(low[1:], high[1:]):
+                _add_to_trie(trie, prefix, len(low) - 1)
+
+    return trie or None
+
+
+def format_entry(entry):
+    """Describes a whitelist entry (a number or a rule) for a text message"""
+    if entry.endswith('*'):
+        return 'any number starting with {0}'.format(entry[:-1])
+    elif '..' in entry:
+        low, high = entry.split('..')
+        return '{0} to {1}'.format(convert_to_national_format(low),
+                                   convert_to_national_format(high))
+    return convert_to_national_format(entry)
+
+
+def match_rules(trie, phone_number):
+    """
+    Checks if an E.164 number matches any rule in a compiled trie. This
+    only walks the number's digits, however many rules there are
+    """
+    if not trie:
+        return False
+
+    digits = phone_number.lstrip('+')
+    node = trie
+
+    for digit in digits:
+        node = node.get(digit)
+        if node is None:
+            return False
+
+        lengths = node.get(RULE_END)
+        if lengths and (0 in lengths or len(digits) in lengths):
+            return True
+
+    return False
@@ -0,0 +1,51 @@
+from queue import Queue
+from threading import Lock, Thread
+
+import os
+
+from . import tracing
+
+
+class BackgroundWorker(object):
+    """
+    Runs jobs (like carrier lookups) in a background thread, so our webhooks
+    can reply without waiting on them
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.queue = Queue()
+        self.lock = Lock()
+        self.thread = None
+        self.pid = None
+
+    def _ensure_started(self):
+        """Starts our thread if it isn't running in this process yet"""
+        with self.lock:
+            # Threads don't survive a fork, so each gunicorn worker needs to
+            # start its own
+            if self.pid != os.getpid() or not self.thread.is_alive():
+                self.thread = Thread(target=self._run, daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+
+    def _run(self):
+        while True:
+            job, args = self.queue.get()
+
+            try:
+                with self.app.app_context():
+                    job(*args)
+            except Exception:
+                self.app.logger.exception('Background job failed')
+            finally:
+                self.queue.task_done()
+
+    def submit(self, job, *args):
+        """Runs job(*args) in the background, inside an app context"""
+        self._ensure_started()
+        self.queue.put((tracing.propagate(job), args))
+
+    def join(self):
+        """Waits until every submitted job has finished"""
+        self.queue.join()
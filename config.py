@@ -7,17 +7,205 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
 
     # Anti-Voicemail
-    ANTI_VOICEMAIL_COMMANDS = ('disable', 'whitelist', 'reset')
+    ANTI_VOICEMAIL_COMMANDS = ('disable', 'whitelist', 'reset', 'schedule',
+                               'stats')
 
     # Twilio credentials
     TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
     TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
 
+    # Extra Twilio numbers to send text messages from (comma separated).
+    # Each recipient sticks to one number for SENDER_STICKY_TIMEOUT seconds
+    # after their last message, and each number sends at most SENDER_RATE
+    # messages per second per worker (with bursts of up to SENDER_BURST)
+    TWILIO_SENDER_NUMBERS = [
+        number.strip() for number in
+        os.environ.get('TWILIO_SENDER_NUMBERS', '').split(',')
+        if number.strip()]
+    SENDER_STICKY_TIMEOUT = 60 * 60 * 24 * 30
+    SENDER_RATE = float(os.environ.get('SENDER_RATE', 1))
+    SENDER_BURST = int(os.environ.get('SENDER_BURST', 5))
+
+    # Twilio Lookups API - give up on a lookup after TWILIO_LOOKUPS_TIMEOUT
+    # seconds, and stop trying for TWILIO_LOOKUPS_RESET_TIMEOUT seconds after
+    # TWILIO_LOOKUPS_FAILURE_THRESHOLD failures in a row
+    TWILIO_LOOKUPS_TIMEOUT = float(
+        os.environ.get('TWILIO_LOOKUPS_TIMEOUT', 2))
+    TWILIO_LOOKUPS_FAILURE_THRESHOLD = 5
+    TWILIO_LOOKUPS_RESET_TIMEOUT = 30
+
+    # Deadlines - Twilio only waits 15 seconds for a webhook's answer. Each
+    # request has REQUEST_DEADLINE seconds, and every call it makes (to
+    # Twilio, the QR code reader or the database) gets what's left as its
+    # timeout. Optional steps, like carrier lookups, are skipped if less than
+    # DEADLINE_MIN_STEP seconds are left. Outside requests, Twilio calls get
+    # TWILIO_REST_TIMEOUT, and downloads (of texted files and recordings)
+    # MEDIA_TIMEOUT
+    REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', 10))
+    DEADLINE_MIN_STEP = 0.5
+    TWILIO_REST_TIMEOUT = 10
+    MEDIA_TIMEOUT = 10
+
+    # How long we remember a phone number's carrier info (in seconds)
+    CARRIER_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+    # How long the background worker waits for a new Mailbox to be saved
+    CARRIER_WORKER_ATTEMPTS = 5
+    CARRIER_WORKER_RETRY_DELAY = 0.5
+
+    # Classify callers' line types with phonenumbers' offline data where we
+    # can, only calling Twilio Lookups for ambiguous numbers
+    OFFLINE_LINE_TYPES = True
+
+    # Recordings - keep copies of new recordings in RECORDINGS_DIR, deleting
+    # the oldest once they take up more than RECORDINGS_MAX_BYTES
+    ARCHIVE_RECORDINGS = True
+    RECORDINGS_DIR = os.environ.get('RECORDINGS_DIR') or \
+        os.path.join(basedir, 'recordings')
+    RECORDINGS_MAX_BYTES = int(
+        os.environ.get('RECORDINGS_MAX_BYTES', 500 * 1024 * 1024))
+    RECORDINGS_CACHE_TIMEOUT = 365 * 24 * 60 * 60
+
+    # Email - voicemails are emailed to our user (as well as texted) when
+    # MAIL_SERVER is set. MAIL_POOL_SIZE background threads each keep an SMTP
+    # session open for up to MAIL_IDLE_TIMEOUT seconds, and send up to
+    # MAIL_BATCH_SIZE queued emails at a time
+    MAIL_SERVER = os.environ.get('MAIL_SERVER')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or \
+        'voicemail@anti-voicemail.local'
+    MAIL_POOL_SIZE = 2
+    MAIL_BATCH_SIZE = 20
+    MAIL_TIMEOUT = 10
+    MAIL_IDLE_TIMEOUT = 60
+
+    # Tracing - when TRACE_FILE is set, TRACE_SAMPLE_RATE of calls and
+    # messages have their spans (keyed by CallSid / MessageSid) appended to it
+    TRACE_FILE = os.environ.get('TRACE_FILE')
+    TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.1))
+
+    # Profiling - a request is run under cProfile if it has a signed
+    # X-Profile header (from 'manage.py profiles token'), or is sampled while
+    # 'manage.py profiles enable' is on. We keep the PROFILING_TOP_N hottest
+    # functions from the last PROFILING_KEEP profiles of each endpoint
+    PROFILING_ENABLED = True
+    PROFILING_TOP_N = 25
+    PROFILING_KEEP = 20
+    PROFILING_TOKEN_MAX_AGE = 60 * 60
+    PROFILING_CHECK_INTERVAL = 5
+
+    # Allocation tracking - when ALLOCATION_TRACKING is 'true', we trace memory
+    # allocations (with ALLOCATION_FRAMES frames each) and work out what
+    # ALLOCATION_SAMPLE_RATE of requests leave allocated, keeping the
+    # ALLOCATION_TOP_SITES biggest growing sites for each endpoint
+    ALLOCATION_TRACKING = os.environ.get('ALLOCATION_TRACKING',
+                                         'false').lower() == 'true'
+    ALLOCATION_SAMPLE_RATE = float(
+        os.environ.get('ALLOCATION_SAMPLE_RATE', 0.01))
+    ALLOCATION_FRAMES = 10
+    ALLOCATION_TOP_SITES = 50
+    ALLOCATION_TOKEN_MAX_AGE = 60 * 60
+
+    # Webhook capture - append the webhooks below (minus their headers) and
+    # our responses to WEBHOOK_CAPTURE_FILE, for `manage.py replay`
+    WEBHOOK_CAPTURE_FILE = os.environ.get('WEBHOOK_CAPTURE_FILE')
+    WEBHOOK_CAPTURE_PATHS = ('/call', '/message', '/send-notification',
+                             '/error')
+
+    # Answer Twilio API calls with app/fake_twilio.py instead of the network
+    TWILIO_FAKE_BACKEND = False
+
+    # Reject calls from numbers in BLOCKLIST_FILE (built with
+    # `manage.py blocklist-build`). Workers notice a new file within
+    # BLOCKLIST_CHECK_INTERVAL seconds
+    BLOCKLIST_FILE = os.environ.get('BLOCKLIST_FILE')
+    BLOCKLIST_CHECK_INTERVAL = 30
+
+    # Load shedding for /call - answer with a cheap, precomputed response
+    # when this process already has ADMISSION_MAX_IN_FLIGHT calls in flight,
+    # or calls are taking (or queueing for) longer than
+    # ADMISSION_LATENCY_BUDGET seconds. ADMISSION_SHED_RESPONSE is 'gather'
+    # (ask the caller to press 1 to record) or 'record'
+    ADMISSION_CONTROL = True
+    ADMISSION_MAX_IN_FLIGHT = int(
+        os.environ.get('ADMISSION_MAX_IN_FLIGHT', 6))
+    ADMISSION_LATENCY_BUDGET = float(
+        os.environ.get('ADMISSION_LATENCY_BUDGET', 5))
+    ADMISSION_SHED_RESPONSE = os.environ.get('ADMISSION_SHED_RESPONSE',
+                                             'gather')
+
+    # Gunicorn (see gunicorn_config.py). Each worker handles
+    # GUNICORN_THREADS webhooks at once - keep that above
+    # ADMISSION_MAX_IN_FLIGHT, or admission control can't see a backlog
+    GUNICORN_WORKER_CLASS = os.environ.get('GUNICORN_WORKER_CLASS',
+                                           'gthread')
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 8))
+    GUNICORN_PRELOAD = os.environ.get('GUNICORN_PRELOAD',
+                                      'false').lower() == 'true'
+    GUNICORN_MAX_REQUESTS = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+    GUNICORN_MAX_REQUESTS_JITTER = int(
+        os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+    # How often /readyz may check the database (seconds) - checks in
+    # between report the last result
+    HEALTH_DB_PROBE_INTERVAL = float(
+        os.environ.get('HEALTH_DB_PROBE_INTERVAL', 5))
+
+    # How many items our production cache can hold before it starts pruning
+    CACHE_THRESHOLD = 10000
+
     # SQLAlchemy
-    SQLALCHEMY_COMMIT_ON_TEARDOWN = True
+    # We commit at the end of each request ourselves, but only if the request
+    # wrote something (see app/database.py)
+    SQLALCHEMY_COMMIT_ON_TEARDOWN = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Check pooled connections are alive before using them, and cancel any
+    # query (or wait on a SQLite lock) which takes longer than this many ms
+    DATABASE_PRE_PING = True
+    DATABASE_STATEMENT_TIMEOUT = int(
+        os.environ.get('DATABASE_STATEMENT_TIMEOUT', 5000))
+
+    # Templates - compile them all at startup, cache their bytecode on disk
+    # and remember rendered text message replies (see app/templating.py)
+    PRELOAD_TEMPLATES = True
+    JINJA_BYTECODE_CACHE = True
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+    MEMOIZE_REPLIES = True
+    MEMOIZE_REPLIES_SIZE = 500
+
+    # How many SMS segments a new voicemail text can use before we cut its
+    # transcription short
+    SMS_TRANSCRIPTION_SEGMENTS = int(
+        os.environ.get('SMS_TRANSCRIPTION_SEGMENTS', 3))
+
+    # How often each worker adds its metrics to the shared counts (seconds)
+    METRICS_FLUSH_INTERVAL = 5
+
+    # Analytics - events (like deflected calls) are inserted in batches of
+    # up to ANALYTICS_BATCH_SIZE, waiting at most ANALYTICS_FLUSH_INTERVAL
+    # seconds to fill one, and rolled up into hourly and daily counts every
+    # ANALYTICS_ROLLUP_INTERVAL seconds. Rollups leave events younger than
+    # ANALYTICS_ROLLUP_LAG seconds, whose inserts might not have committed
+    ANALYTICS_ENABLED = True
+    ANALYTICS_BATCH_SIZE = 100
+    ANALYTICS_FLUSH_INTERVAL = 5
+    ANALYTICS_ROLLUP_INTERVAL = int(
+        os.environ.get('ANALYTICS_ROLLUP_INTERVAL', 60))
+    ANALYTICS_ROLLUP_BATCH_SIZE = 5000
+    ANALYTICS_ROLLUP_LAG = 60
+
+    # Delivery statuses - Twilio tells us what happened to each message we
+    # send. We keep the latest status per message in memory, writing them
+    # STATUS_BATCH_SIZE at a time or every STATUS_FLUSH_INTERVAL seconds
+    MESSAGE_STATUS_CALLBACKS = True
+    STATUS_BATCH_SIZE = int(os.environ.get('STATUS_BATCH_SIZE', 500))
+    STATUS_FLUSH_INTERVAL = float(os.environ.get('STATUS_FLUSH_INTERVAL', 2))
+
     @staticmethod
     def init_app(app):
         pass
@@ -25,6 +213,10 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
+
+    # Pick up template changes without restarting the server
+    PRELOAD_TEMPLATES = False
+    MEMOIZE_REPLIES = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-dev.sqlite')
 
@@ -34,16 +226,56 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-test.sqlite')
     WTF_CSRF_ENABLED = False
+    METRICS_FLUSH_INTERVAL = 0
+    ARCHIVE_RECORDINGS = False
+    MAIL_SERVER = None
+    TRACE_FILE = None
+    WEBHOOK_CAPTURE_FILE = None
+    PROFILING_CHECK_INTERVAL = 0
+    RECORDINGS_DIR = os.path.join(basedir, 'recordings-test')
+
+    # Tests which want analytics turn them on, and get every event written
+    # and rolled up straight away
+    ANALYTICS_ENABLED = False
+    ANALYTICS_FLUSH_INTERVAL = 0
+    ANALYTICS_ROLLUP_INTERVAL = 0
+    ANALYTICS_ROLLUP_LAG = 0
+
+
+class ReplayConfig(TestingConfig):
+    # Replays skip signature validation (like tests), but report errors as
+    # 500s rather than raising them
+    PROPAGATE_EXCEPTIONS = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('REPLAY_DATABASE_URL') or \
+        'sqlite:///' + os.path.join(basedir, 'data-replay.sqlite')
+    TWILIO_FAKE_BACKEND = True
+    WEBHOOK_CAPTURE_FILE = None
 
 
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data.sqlite')
 
+    # Connection pool for server databases like Postgres
+    SQLALCHEMY_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 5))
+    SQLALCHEMY_POOL_TIMEOUT = 10
+    SQLALCHEMY_POOL_RECYCLE = 300
+
+    @staticmethod
+    def init_app(app):
+        # SQLite doesn't pool file connections, and SQLAlchemy will refuse
+        # to create the engine if we give it pool settings
+        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            for key in ('SQLALCHEMY_POOL_SIZE', 'SQLALCHEMY_MAX_OVERFLOW',
+                        'SQLALCHEMY_POOL_TIMEOUT', 'SQLALCHEMY_POOL_RECYCLE'):
+                app.config[key] = None
+
 
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
+    'replay': ReplayConfig,
     'production': ProductionConfig,
 
     'default': DevelopmentConfig
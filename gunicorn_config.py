@@ -0,0 +1,91 @@
+# Gunicorn config for Anti-Voicemail
+# Use it with: gunicorn -c gunicorn_config.py manage:app
+import os
+
+# Gunicorn treats every name in this file as a setting, and 'config' is one
+from config import config as flask_configs
+
+app_config = flask_configs[os.getenv('FLASK_CONFIG') or 'default']
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+
+# Heroku sets WEB_CONCURRENCY based on the dyno size
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = app_config.GUNICORN_WORKER_CLASS
+threads = app_config.GUNICORN_THREADS
+
+# Twilio gives up on a webhook after 15 seconds
+timeout = 15
+
+# Optionally load our app once in the master process, so forked workers
+# share its memory (copy-on-write) and are warmed up before they take
+# webhooks. It's off by default: bench-gunicorn shows it boots slower, and
+# the warm-up makes each worker bigger
+preload_app = app_config.GUNICORN_PRELOAD
+
+# Restart each worker after a while, to cap any slow memory growth. The
+# jitter stops every worker from restarting at the same time
+max_requests = app_config.GUNICORN_MAX_REQUESTS
+max_requests_jitter = app_config.GUNICORN_MAX_REQUESTS_JITTER
+
+
+def when_ready(server):
+    """Warms up shared data in the master, before any workers fork"""
+    if not preload_app:
+        return
+
+    from manage import app
+    from app.warmup import warm_up_shared
+
+    elapsed = warm_up_shared(app)
+    server.log.info('Warmed up shared data in %.1f ms', elapsed * 1000)
+
+
+def post_fork(server, worker):
+    """Warms up each worker before it accepts any webhooks"""
+    # Without preload_app the app isn't loaded yet - it'll warm up lazily
+    if not preload_app:
+        return
+
+    from manage import app
+    from app.warmup import warm_up_worker
+
+    # A worker which couldn't warm up can still serve webhooks
+    try:
+        elapsed = warm_up_worker(app)
+    except Exception:
+        server.log.exception('Worker %s failed to warm up', worker.pid)
+    else:
+        server.log.info('Worker %s warmed up in %.1f ms', worker.pid,
+                        elapsed * 1000)
+
+
+def worker_exit(server, worker):
+    """Writes anything this worker still has buffered before it exits"""
+    # The master calls this too, after reaping a worker - but it has nothing
+    # buffered, and might not even have loaded our app
+    if worker.pid != os.getpid():
+        return
+
+    from manage import app
+
+    # Our analytics events are only in memory until they're written
+    try:
+        app.analytics.close(timeout=5)
+    except Exception:
+        server.log.exception('Worker %s failed to write its analytics',
+                             worker.pid)
+
+    # And we've already told Twilio we have these delivery statuses, so it
+    # won't send them again
+    try:
+        with app.app_context():
+            app.deliveries.flush()
+    except Exception:
+        server.log.exception('Worker %s failed to write message statuses',
+                             worker.pid)
+
+
+def post_worker_init(worker):
+    """Logs when each worker has loaded our app and is ready for webhooks"""
+    worker.log.info('Worker %s ready', worker.pid)
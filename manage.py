@@ -2,7 +2,8 @@
 import os
 from app import create_app, db
 from app.models import Mailbox, Voicemail
-from flask.ext.script import Manager, Shell
+from app.whitelist import numbers_from_file
+from flask.ext.script import Command, Manager, Shell
 from flask.ext.migrate import Migrate, MigrateCommand
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
@@ -33,5 +34,250 @@ def reset():
     Mailbox.query.delete()
     print("Mailbox deleted")
 
+
+def whitelist_import(path):
+    """Adds every phone number in a vCard or CSV file to the whitelist"""
+    mailbox = Mailbox.query.one()
+
+    with open(path) as f:
+        added, invalid = mailbox.import_whitelist(numbers_from_file(f))
+
+    db.session.commit()
+    print("Added {0} numbers to the whitelist ({1} invalid numbers skipped)"
+          .format(added, invalid))
+manager.add_command('whitelist-import', Command(whitelist_import))
+
+
+def whitelist_export(path):
+    """Writes every phone number in the whitelist to a CSV file"""
+    mailbox = Mailbox.query.one()
+
+    with open(path, 'w') as f:
+        for phone_number in sorted(mailbox.whitelist):
+            f.write(phone_number + '\n')
+
+    print("Exported {0} numbers".format(len(mailbox.whitelist)))
+manager.add_command('whitelist-export', Command(whitelist_export))
+
+
+def blocklist_build(source, path=None):
+    """Builds a blocklist file from a file with one E.164 number per line"""
+    from app.blocklist import build_blocklist
+
+    path = path or app.config['BLOCKLIST_FILE']
+    if not path:
+        print("Set BLOCKLIST_FILE or pass --path")
+        return
+
+    with open(source) as f:
+        count, skipped = build_blocklist(f, path)
+
+    print("Blocked {0} numbers ({1} invalid lines skipped) in {2}".format(
+        count, skipped, path))
+manager.add_command('blocklist-build', Command(blocklist_build))
+
+
+def analytics_rollup():
+    """Rolls any analytics events our workers haven't yet into the counts"""
+    from app.analytics import rollup_events
+
+    print("Rolled up {0} events".format(rollup_events()))
+manager.add_command('analytics-rollup', Command(analytics_rollup))
+
+
+profiles = Manager(usage='Show request profiles, and turn profiling on or off')
+
+
+def profiles_show(endpoint=None, count=1):
+    """Shows the newest profiles of each endpoint (or just one)"""
+    from app.profiling import format_profile, get_profiles
+
+    for name, endpoint_profiles in sorted(get_profiles(endpoint).items()):
+        for profile in endpoint_profiles[:int(count)]:
+            print(format_profile(name, profile) + '\n')
+profiles.add_command('show', Command(profiles_show))
+
+
+def profiles_token():
+    """Prints a header which has a request profiled"""
+    from app.profiling import PROFILE_HEADER
+
+    if not app.config['SECRET_KEY']:
+        print("Set SECRET_KEY to sign profiling tokens")
+        return
+
+    print("{0}: {1}".format(PROFILE_HEADER,
+                            app.extensions['profiler'].make_token()))
+profiles.add_command('token', Command(profiles_token))
+
+
+def profiles_enable(rate=0.01, minutes=10):
+    """Profiles a sample of every worker's requests for a while"""
+    from app.profiling import enable
+
+    enable(float(rate), float(minutes) * 60)
+    print("Profiling {0:.1%} of requests for {1} minutes".format(
+        float(rate), minutes))
+profiles.add_command('enable', Command(profiles_enable))
+
+
+def profiles_disable():
+    """Stops profiling a sample of requests"""
+    from app.profiling import disable
+
+    disable()
+    print("Stopped profiling requests")
+profiles.add_command('disable', Command(profiles_disable))
+manager.add_command('profiles', profiles)
+
+
+def allocations(sites=10, reset=False, token=False):
+    """Shows what each endpoint's sampled requests left allocated"""
+    from app.allocations import ALLOCATIONS_HEADER, format_report, \
+        get_report, make_token, reset as reset_allocations
+
+    if token:
+        if not app.config['SECRET_KEY']:
+            print("Set SECRET_KEY to sign allocations tokens")
+        else:
+            print("{0}: {1}".format(ALLOCATIONS_HEADER, make_token()))
+        return
+
+    print(format_report(get_report(), sites=int(sites)))
+
+    if reset:
+        reset_allocations()
+        print("\nCleared every endpoint's allocations")
+manager.add_command('allocations', Command(allocations))
+
+
+def replay(path, speed='1x'):
+    """
+    Replays webhooks captured in WEBHOOK_CAPTURE_FILE against a fresh
+    database and our fake Twilio backend. Speed is 1x, Nx or max
+    """
+    from app.replay import format_report, load_webhooks, replay_webhooks
+
+    replay_app = create_app('replay')
+    speed = None if speed == 'max' else float(speed.rstrip('x'))
+
+    with replay_app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        with open(path) as f:
+            webhooks = load_webhooks(f)
+
+        report = replay_webhooks(replay_app, webhooks, speed=speed)
+
+    print(format_report(report))
+manager.add_command('replay', Command(replay))
+
+
+def bench_gunicorn(workers=4):
+    """Compares gunicorn's boot time and memory with and without preload"""
+    import re
+    import subprocess
+    import sys
+    from time import time
+
+    workers = int(workers)
+    print("{0:>8} {1:>8} {2:>13} {3:>13} {4:>13}".format(
+        'preload', 'boot ms', 'worker rss', 'worker pss', 'worker uss'))
+
+    for preload in ['false', 'true']:
+        env = dict(os.environ, GUNICORN_PRELOAD=preload,
+                   GUNICORN_MAX_REQUESTS='0')
+        start = time()
+        process = subprocess.Popen(
+            [sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()',
+             '-c', 'gunicorn_config.py',
+             '-w', str(workers), '-b', '127.0.0.1:0', 'manage:app'],
+            env=env, stderr=subprocess.PIPE, universal_newlines=True)
+
+        # Wait for every worker to load our app
+        pids = []
+        for line in process.stderr:
+            match = re.search(r'Worker (\d+) ready', line)
+            if match:
+                pids.append(match.group(1))
+            if len(pids) == workers:
+                break
+        boot_ms = (time() - start) * 1000
+
+        # Resident, proportional (shared pages split between processes) and
+        # unique memory for each worker, from the kernel
+        totals = {'Rss': 0, 'Pss': 0, 'Private_Clean': 0, 'Private_Dirty': 0}
+        for pid in pids:
+            with open('/proc/{0}/smaps_rollup'.format(pid)) as f:
+                for line in f:
+                    name, _, value = line.partition(':')
+                    if name in totals:
+                        totals[name] += int(value.split()[0])
+
+        process.terminate()
+        process.wait()
+
+        print("{0:>8} {1:>8.0f} {2:>10} kB {3:>10} kB {4:>10} kB".format(
+            preload, boot_ms, totals['Rss'] // workers,
+            totals['Pss'] // workers,
+            (totals['Private_Clean'] + totals['Private_Dirty']) // workers))
+manager.add_command('bench-gunicorn', Command(bench_gunicorn))
+
+
+def bench_config_image(iterations=5):
+    """Compares config image rendering with qrcode's PIL images"""
+    from io import BytesIO
+    from random import Random
+    from timeit import timeit
+    import qrcode
+    import qrcode.exceptions
+    from app.payload import encode_mailbox
+    from app.qrimage import render_png
+
+    def render_with_pil(qr):
+        img_io = BytesIO()
+        qr.make_image().save(img_io)
+        return img_io.getvalue()
+
+    def render_with_numpy(qr):
+        return render_png(qr.get_matrix())
+
+    iterations = int(iterations)
+    print("{0:>9} {1:>7} {2:>7} {3:>9} {4:>8} {5:>8} {6:>9} {7:>9}".format(
+        'whitelist', 'payload', 'version', 'encode ms', 'pil ms',
+        'numpy ms', 'pil bytes', 'numpy bytes'))
+
+    for size in [0, 10, 100, 250, 500, 1000]:
+        random = Random(size)
+        mailbox = Mailbox('+15555555555', carrier='Verizon Wireless',
+                          name='Jane Foo', email='jane@foo.com',
+                          whitelist=['+1{0}'.format(random.randint(
+                              2000000000, 9999999999)) for i in range(size)])
+        payload = encode_mailbox(mailbox)
+
+        # Building the QR code's matrix costs the same either way, so we
+        # time it separately from rasterizing it
+        qr = qrcode.QRCode()
+        qr.add_data(payload)
+        try:
+            encode_ms = timeit(lambda: qr.make(fit=True),
+                               number=iterations) / iterations * 1000
+        except qrcode.exceptions.DataOverflowError:
+            print("{0:>9} {1:>7} too large for a QR code".format(
+                size, len(payload)))
+            continue
+
+        results = []
+        for render in [render_with_pil, render_with_numpy]:
+            seconds = timeit(lambda: render(qr), number=iterations)
+            results.append((seconds / iterations * 1000, len(render(qr))))
+
+        print("{0:>9} {1:>7} {2:>7} {3:>9.1f} {4:>8.1f} {5:>8.1f} {6:>9} "
+              "{7:>9}".format(size, len(payload), qr.version, encode_ms,
+                              results[0][0], results[1][0], results[0][1],
+                              results[1][1]))
+manager.add_command('bench-config-image', Command(bench_config_image))
+
 if __name__ == '__main__':
     manager.run()
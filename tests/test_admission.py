@@ -0,0 +1,96 @@
+import importlib
+import unittest
+from time import time
+
+from app import create_app
+from app.admission import AdmissionController, get_queue_time
+
+
+class AdmissionControllerTestCase(unittest.TestCase):
+    def test_admit(self):
+        # Arrange
+        controller = AdmissionController(max_in_flight=2, latency_budget=1)
+
+        # Act / Assert
+        self.assertIsNone(controller.admit())
+        self.assertIsNone(controller.admit())
+        self.assertEqual(controller.admit(), 'in_flight')
+
+        controller.release(0.1)
+        self.assertIsNone(controller.admit())
+
+    def test_admit_queued(self):
+        # Arrange
+        controller = AdmissionController(max_in_flight=2, latency_budget=1)
+
+        # Act / Assert
+        self.assertEqual(controller.admit(queued_for=2), 'queued')
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_admit_latency(self):
+        # Arrange
+        controller = AdmissionController(max_in_flight=5, latency_budget=1,
+                                         smoothing=1)
+        controller.admit()
+        controller.release(3)
+
+        # Act / Assert
+        # One request always gets through, so the average can recover
+        self.assertIsNone(controller.admit())
+        self.assertEqual(controller.admit(), 'latency')
+
+        controller.release(0.1)
+        self.assertIsNone(controller.admit())
+        self.assertIsNone(controller.admit())
+
+    def test_default_worker_config(self):
+        # Arrange
+        gunicorn_config = importlib.import_module('gunicorn_config')
+        controller = AdmissionController(
+            gunicorn_config.app_config.ADMISSION_MAX_IN_FLIGHT,
+            gunicorn_config.app_config.ADMISSION_LATENCY_BUDGET)
+
+        # Act
+        # Each of a worker's threads takes a request at the same time
+        reasons = [controller.admit()
+                   for thread in range(gunicorn_config.threads)]
+
+        # Assert
+        self.assertNotEqual(gunicorn_config.worker_class, 'sync')
+        self.assertIn('in_flight', reasons)
+        self.assertEqual(controller.in_flight,
+                         gunicorn_config.app_config.ADMISSION_MAX_IN_FLIGHT)
+
+
+class QueueTimeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+
+    def test_heroku_header(self):
+        # Arrange
+        started = int((time() - 2) * 1000)
+
+        # Act
+        with self.app.test_request_context(
+                headers={'X-Request-Start': str(started)}):
+            queue_time = get_queue_time()
+
+        # Assert
+        self.assertAlmostEqual(queue_time, 2, delta=0.5)
+
+    def test_nginx_header(self):
+        # Act
+        with self.app.test_request_context(
+                headers={'X-Request-Start': 't={0}'.format(time() - 1)}):
+            queue_time = get_queue_time()
+
+        # Assert
+        self.assertAlmostEqual(queue_time, 1, delta=0.5)
+
+    def test_no_header(self):
+        # Act
+        with self.app.test_request_context():
+            queue_time = get_queue_time()
+
+        # Assert
+        self.assertEqual(queue_time, 0)
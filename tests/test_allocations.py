@@ -0,0 +1,162 @@
+import json
+import tracemalloc
+import unittest
+from flask import current_app
+from unittest.mock import patch
+
+from app import create_app
+from app.allocations import format_report, get_report, make_token, reset
+from config import config
+
+
+# Where our leaky view keeps what it allocates
+leaked = []
+
+
+def leaky_view():
+    leaked.append(bytearray(100000))
+    return 'ok'
+
+
+def leak():
+    leaked.append(bytearray(100000))
+
+
+def background_leaky_view():
+    current_app.worker.submit(leak)
+    current_app.worker.join()
+    return 'ok'
+
+
+class AllocationsTestCase(unittest.TestCase):
+    def setUp(self):
+        with patch.object(config['testing'], 'ALLOCATION_TRACKING', True):
+            self.app = create_app('testing')
+        self.app.config['ALLOCATION_SAMPLE_RATE'] = 1
+        self.app.config['SECRET_KEY'] = 'secret'
+        self.app.add_url_rule('/leak', 'leak', leaky_view)
+        self.app.add_url_rule('/background-leak', 'background_leak',
+                              background_leaky_view)
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+
+    def tearDown(self):
+        del leaked[:]
+        tracemalloc.stop()
+        self.app_context.pop()
+
+    def test_track_leak(self):
+        # Act
+        self.test_client.get('/leak')
+        self.test_client.get('/leak')
+
+        # Assert
+        report = dict((totals['endpoint'], totals) for totals in get_report())
+        totals = report['leak']
+
+        self.assertEqual(totals['requests'], 2)
+        self.assertGreaterEqual(totals['bytes_per_request'], 100000)
+
+        site = totals['sites'][0]
+        self.assertIn('tests/test_allocations.py', site['site'])
+        self.assertGreaterEqual(site['bytes'], 200000)
+        self.assertEqual(site['requests'], 2)
+
+    def test_not_sampled(self):
+        # Arrange
+        self.app.config['ALLOCATION_SAMPLE_RATE'] = 0
+
+        # Act
+        self.test_client.get('/leak')
+
+        # Assert
+        self.assertEqual(get_report(), [])
+
+    def test_one_request_at_a_time(self):
+        # Arrange
+        tracker = self.app.extensions['allocations']
+        tracker.lock.acquire()
+
+        # Act
+        try:
+            self.test_client.get('/leak')
+        finally:
+            tracker.lock.release()
+
+        # Assert
+        self.assertEqual(get_report(), [])
+
+    def test_allocations_view(self):
+        # Arrange
+        self.test_client.get('/leak')
+
+        # Act
+        response = self.test_client.get('/allocations', headers={
+            'X-Allocations-Token': make_token()})
+
+        # Assert
+        content = json.loads(response.data.decode('utf-8'))
+        self.assertTrue(content['tracking'])
+        self.assertIn('leak', [totals['endpoint']
+                               for totals in content['endpoints']])
+
+    def test_snapshot_failure_releases_lock(self):
+        # Act
+        with patch('app.allocations.tracemalloc.take_snapshot',
+                   side_effect=RuntimeError('not tracing')):
+            failed_response = self.test_client.get('/leak')
+        self.test_client.get('/leak')
+
+        # Assert
+        self.assertEqual(failed_response.status_code, 200)
+        report = dict((totals['endpoint'], totals) for totals in get_report())
+        self.assertEqual(report['leak']['requests'], 1)
+
+    def test_allocations_view_needs_token(self):
+        # Act
+        response = self.test_client.get('/allocations')
+        forged_response = self.test_client.get('/allocations', headers={
+            'X-Allocations-Token': 'allocations.forged.signature'})
+
+        # Assert
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(forged_response.status_code, 403)
+
+    def test_background_threads_not_counted(self):
+        # Act
+        self.test_client.get('/background-leak')
+
+        # Assert
+        totals = get_report()[0]
+        self.assertEqual(totals['endpoint'], 'background_leak')
+        self.assertLess(totals['net_bytes'], 100000)
+
+    def test_format_report(self):
+        # Arrange
+        report = [{
+            'endpoint': 'voice.incoming_call', 'requests': 4,
+            'net_bytes': 4096, 'bytes_per_request': 1024,
+            'sites': [{'site': 'python3.6/threading.py:846 via app/models.py:248',
+                       'bytes': 4000, 'requests': 4}]}]
+
+        # Act
+        text = format_report(report)
+
+        # Assert
+        self.assertIn('voice.incoming_call: +1,024 bytes per request '
+                      '(+4,096 over 4 requests)', text)
+        self.assertIn('+4,000  python3.6/threading.py:846 via '
+                      'app/models.py:248 (grew in 4 requests)', text)
+
+    def test_reset(self):
+        # Arrange
+        self.test_client.get('/leak')
+
+        # Act
+        reset()
+
+        # Assert
+        self.assertEqual(get_report(), [])
@@ -0,0 +1,244 @@
+import importlib
+import json
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from app import create_app, db
+from app.allocations import make_token
+from app.analytics import AnalyticsCursor, AnalyticsEvent, DailyCount, \
+    HourlyCount, get_hourly_counts, insert_events, rollup_events, summarize
+from app.models import Mailbox
+
+
+class AnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['ANALYTICS_ENABLED'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+
+        db.create_all()
+
+    def tearDown(self):
+        self.app.analytics.join()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_record_event(self):
+        # Act
+        for _ in range(3):
+            self.app.analytics.record('call.received')
+        self.app.analytics.join()
+
+        # Assert
+        self.assertEqual(AnalyticsEvent.query.count(), 3)
+        self.assertEqual(HourlyCount.query.one().count, 3)
+        self.assertEqual(DailyCount.query.one().count, 3)
+
+    def test_record_event_disabled(self):
+        # Arrange
+        self.app.config['ANALYTICS_ENABLED'] = False
+
+        # Act
+        self.app.analytics.record('call.received')
+        self.app.analytics.join()
+
+        # Assert
+        self.assertEqual(AnalyticsEvent.query.count(), 0)
+        self.assertIsNone(self.app.analytics.thread)
+
+    def test_rollup_incremental(self):
+        # Arrange
+        noon = datetime(2026, 10, 19, 12, 15)
+        insert_events([('call.received', noon), ('call.received', noon),
+                       ('call.deflected', noon)])
+        rollup_events()
+
+        insert_events([('call.received', noon + timedelta(hours=1))])
+
+        # Act
+        rolled_up = rollup_events()
+
+        # Assert
+        self.assertEqual(rolled_up, 1)
+
+        hourly = dict(((row.start.hour, row.kind), row.count)
+                      for row in HourlyCount.query)
+        self.assertEqual(hourly, {(12, 'call.received'): 2,
+                                  (12, 'call.deflected'): 1,
+                                  (13, 'call.received'): 1})
+
+        daily = DailyCount.query.filter_by(kind='call.received').one()
+        self.assertEqual(daily.count, 3)
+        self.assertEqual(AnalyticsCursor.query.one().last_event_id, 4)
+
+    def test_rollup_in_batches(self):
+        # Arrange
+        self.app.config['ANALYTICS_ROLLUP_BATCH_SIZE'] = 2
+        insert_events([('call.received', datetime(2026, 10, 19))] * 5)
+
+        # Act
+        rolled_up = rollup_events()
+
+        # Assert
+        self.assertEqual(rolled_up, 5)
+        self.assertEqual(DailyCount.query.one().count, 5)
+
+    def test_rollup_nothing_new(self):
+        # Arrange
+        insert_events([('call.received', datetime(2026, 10, 19))])
+        rollup_events()
+
+        # Act
+        rolled_up = rollup_events()
+
+        # Assert
+        self.assertEqual(rolled_up, 0)
+        self.assertEqual(DailyCount.query.one().count, 1)
+
+    def test_rollup_lag(self):
+        # Arrange
+        self.app.config['ANALYTICS_ROLLUP_LAG'] = 60
+        now = datetime.utcnow()
+
+        # A batch which got its ids first, but committed after a newer one
+        insert_events([('call.received', now - timedelta(minutes=5))])
+        insert_events([('call.deflected', now)])
+        insert_events([('call.received', now - timedelta(minutes=2))])
+
+        # Act
+        rolled_up = rollup_events()
+
+        # Assert
+        self.assertEqual(rolled_up, 1)
+        self.assertEqual(AnalyticsCursor.query.one().last_event_id, 1)
+
+    def test_close(self):
+        # Arrange
+        self.app.config['ANALYTICS_FLUSH_INTERVAL'] = 60
+        self.app.analytics.record('call.received')
+        thread = self.app.analytics.thread
+
+        # Act
+        self.app.analytics.close(timeout=5)
+
+        # Assert
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(AnalyticsEvent.query.count(), 1)
+
+    def test_worker_exit(self):
+        # Arrange
+        gunicorn_config = importlib.import_module('gunicorn_config')
+        self.app.config['ANALYTICS_FLUSH_INTERVAL'] = 60
+        self.app.analytics.record('call.received')
+
+        # Act
+        with patch.dict('sys.modules', {'manage': MagicMock(app=self.app)}):
+            gunicorn_config.worker_exit(MagicMock(), MagicMock(pid=os.getpid()))
+
+        # Assert
+        self.assertEqual(AnalyticsEvent.query.count(), 1)
+
+    def test_summarize(self):
+        # Arrange
+        counts = {
+            datetime(2026, 10, 19, 12): {
+                'call.received': 4, 'call.deflected': 1,
+                'call.prompted': 3, 'contact_info.sent': 1},
+            datetime(2026, 10, 19, 13): {
+                'call.pressed_one': 1, 'voicemail.received': 1},
+        }
+
+        # Act
+        summary = summarize(counts)
+
+        # Assert
+        self.assertEqual(summary, {
+            'calls': 4, 'deflected': 3, 'pressed_one': 1,
+            'contact_info_sent': 1, 'voicemails': 1})
+
+    def test_hourly_counts(self):
+        # Arrange
+        now = datetime(2026, 10, 19, 12, 30)
+        db.session.add_all([
+            HourlyCount(start=datetime(2026, 10, 19, 12),
+                        kind='call.received', count=2),
+            HourlyCount(start=datetime(2026, 10, 18, 13),
+                        kind='call.received', count=3),
+            HourlyCount(start=datetime(2026, 10, 18, 12),
+                        kind='call.received', count=100)])
+
+        # Act
+        counts = get_hourly_counts(now=now)
+
+        # Assert
+        self.assertEqual(list(counts.values()), [
+            {'call.received': 3}, {'call.received': 2}])
+
+    def test_stats_endpoint(self):
+        # Arrange
+        self.app.config['SECRET_KEY'] = 'secret'
+        now = datetime.utcnow()
+        db.session.add_all([
+            HourlyCount(start=now.replace(minute=0, second=0, microsecond=0),
+                        kind='call.received', count=2),
+            DailyCount(start=now.date(), kind='call.received', count=5)])
+        db.session.commit()
+
+        # Act
+        response = self.test_client.get('/stats', headers={
+            'X-Allocations-Token': make_token()})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+
+        stats = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(stats['last_24_hours']['calls'], 2)
+        self.assertEqual(stats['last_30_days']['calls'], 5)
+        self.assertEqual(stats['daily'][0]['counts'],
+                         {'call.received': 5})
+
+    def test_stats_endpoint_needs_token(self):
+        # Arrange
+        self.app.config['SECRET_KEY'] = 'secret'
+
+        # Act
+        response = self.test_client.get('/stats')
+        forged_response = self.test_client.get('/stats', headers={
+            'X-Allocations-Token': 'allocations.forged.signature'})
+
+        # Assert
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(forged_response.status_code, 403)
+
+    def test_call_events(self):
+        # Arrange
+        mailbox = Mailbox(
+            phone_number='+15555555555',
+            carrier='Foo Wireless',
+            name='Jane Foo',
+            email='jane@foo.com')
+        db.session.add(mailbox)
+        db.session.commit()
+
+        mock_lookup_result = MagicMock(carrier={'type': 'landline', 'name': 'Foo Telecom'})
+
+        # Act
+        with patch('app.voice.views.look_up_number', return_value=mock_lookup_result):
+            self.test_client.post('/call', data={'From': '+17777777777'})
+            self.test_client.post('/call', data={'From': '+18888888888'})
+        self.test_client.post('/record', data={'Digits': '1'})
+        db.session.remove()
+        self.app.analytics.join()
+
+        # Assert
+        summary = summarize(get_hourly_counts())
+        self.assertEqual(summary['calls'], 2)
+        self.assertEqual(summary['deflected'], 1)
+        self.assertEqual(summary['pressed_one'], 1)
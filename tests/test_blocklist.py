@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app import create_app, db
+from app.blocklist import Blocklist, BlocklistFile, build_blocklist, \
+    is_blocked, parse_number
+from app.metrics import get_metrics
+
+
+class BlocklistTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'blocklist.bin')
+
+        self.app = create_app('testing')
+        self.app.config['BLOCKLIST_FILE'] = self.path
+        self.app.config['BLOCKLIST_CHECK_INTERVAL'] = 0
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+        shutil.rmtree(self.directory)
+
+    def test_parse_number(self):
+        # Assert
+        self.assertEqual(parse_number('+15555555555\n'), 15555555555)
+        self.assertIsNone(parse_number('555-5555'))
+        self.assertIsNone(parse_number('+1234567890123456'))
+
+    def test_build(self):
+        # Act
+        count, skipped = build_blocklist(
+            ['+15555555555', '+15555555555', '+447700900123', 'spam'],
+            self.path)
+
+        # Assert
+        self.assertEqual((count, skipped), (2, 1))
+
+        blocklist = Blocklist(self.path)
+        self.assertEqual(len(blocklist), 2)
+        self.assertIn(15555555555, blocklist)
+        self.assertIn(447700900123, blocklist)
+        self.assertNotIn(15555555556, blocklist)
+
+    def test_bloom_filter(self):
+        # Arrange
+        numbers = [15550000000 + i * 7 for i in range(5000)]
+        build_blocklist(('+{0}'.format(n) for n in numbers), self.path)
+        blocklist = Blocklist(self.path)
+
+        # Act
+        false_positives = sum(
+            blocklist.might_contain(16660000000 + i) for i in range(5000))
+
+        # Assert
+        self.assertTrue(all(blocklist.might_contain(n) for n in numbers))
+        self.assertTrue(all(n in blocklist for n in numbers))
+        self.assertLess(false_positives, 150)
+
+    def test_empty_blocklist(self):
+        # Act
+        build_blocklist([], self.path)
+
+        # Assert
+        self.assertNotIn(15555555555, Blocklist(self.path))
+
+    def test_not_a_blocklist(self):
+        # Arrange
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * 64)
+
+        # Assert
+        with self.assertRaises(ValueError):
+            Blocklist(self.path)
+
+    def test_reload(self):
+        # Arrange
+        build_blocklist(['+15555555555'], self.path)
+        blocklist_file = BlocklistFile(self.path, check_interval=0)
+        old_blocklist = blocklist_file.get()
+
+        # Act
+        build_blocklist(['+16666666666'], self.path)
+        new_blocklist = blocklist_file.get()
+
+        # Assert
+        self.assertNotIn(16666666666, old_blocklist)
+        self.assertIn(15555555555, old_blocklist)
+        self.assertIn(16666666666, new_blocklist)
+        self.assertNotIn(15555555555, new_blocklist)
+
+    def test_reload_waits_for_interval(self):
+        # Arrange
+        build_blocklist(['+15555555555'], self.path)
+        blocklist_file = BlocklistFile(self.path, check_interval=60)
+        blocklist = blocklist_file.get()
+
+        # Act
+        build_blocklist(['+16666666666'], self.path)
+
+        # Assert
+        self.assertIs(blocklist_file.get(), blocklist)
+
+    def test_no_file(self):
+        # Assert
+        self.assertFalse(is_blocked('+15555555555'))
+
+    def test_blocked_call_rejected(self):
+        # Arrange
+        build_blocklist(['+17777777777'], self.path)
+
+        # Act
+        with patch('app.voice.views.Mailbox') as mock_mailbox, \
+                patch('app.voice.views.look_up_number') as mock_lookup:
+            response = self.test_client.post('/call', data={
+                'From': '+17777777777'})
+
+        # Assert
+        self.assertIn('<Reject', response.data.decode('utf-8'))
+        self.assertFalse(mock_mailbox.query.first.called)
+        self.assertFalse(mock_lookup.called)
+        self.assertEqual(get_metrics()['blocklist.rejected'], 1)
+
+    def test_unblocked_call(self):
+        # Arrange
+        build_blocklist(['+17777777777'], self.path)
+
+        # Act
+        response = self.test_client.post('/call', data={
+            'From': '+18888888888'})
+
+        # Assert
+        self.assertNotIn('<Reject', response.data.decode('utf-8'))
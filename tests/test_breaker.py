@@ -0,0 +1,123 @@
+import unittest
+from time import time
+
+from app import create_app, db
+from app.breaker import CircuitBreaker
+from app.metrics import get_metrics
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_breaker_closed(self):
+        # Arrange
+        breaker = CircuitBreaker('foo', failure_threshold=2)
+
+        # Act
+        breaker.record_failure()
+
+        # Assert
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow_request())
+
+    def test_breaker_opens(self):
+        # Arrange
+        breaker = CircuitBreaker('foo', failure_threshold=2)
+
+        # Act
+        breaker.record_failure()
+        breaker.record_failure()
+
+        # Assert
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow_request())
+
+        metrics = get_metrics()
+        self.assertEqual(metrics['breaker.foo.opened'], 1)
+        self.assertEqual(metrics['breaker.foo.short_circuited'], 1)
+
+    def test_breaker_success_resets_failures(self):
+        # Arrange
+        breaker = CircuitBreaker('foo', failure_threshold=2)
+
+        # Act
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        # Assert
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_breaker_half_open(self):
+        # Arrange
+        breaker = CircuitBreaker('foo', failure_threshold=1, reset_timeout=30)
+        self.app.cache.set('breaker:foo:opened_at', time() - 60)
+
+        # Act
+        first_request = breaker.allow_request()
+        second_request = breaker.allow_request()
+
+        # Assert
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertTrue(first_request)
+        self.assertFalse(second_request)
+
+    def test_breaker_half_open_failure(self):
+        # Arrange
+        breaker = CircuitBreaker('foo', failure_threshold=5, reset_timeout=30)
+        self.app.cache.set('breaker:foo:opened_at', time() - 60)
+        breaker.allow_request()
+
+        # Act
+        breaker.record_failure()
+
+        # Assert
+        self.assertEqual(breaker.state, 'open')
+
+    def test_breaker_half_open_success(self):
+        # Arrange
+        breaker = CircuitBreaker('foo', failure_threshold=5, reset_timeout=30)
+        self.app.cache.set('breaker:foo:opened_at', time() - 60)
+        breaker.allow_request()
+
+        # Act
+        breaker.record_success()
+
+        # Assert
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow_request())
+
+    def test_breaker_half_open_release_trial(self):
+        # Arrange
+        breaker = CircuitBreaker('foo', failure_threshold=5, reset_timeout=30)
+        self.app.cache.set('breaker:foo:opened_at', time() - 60)
+        breaker.allow_request()
+
+        # Act
+        breaker.release_trial()
+
+        # Assert
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertTrue(breaker.allow_request())
+
+    def test_metrics_view(self):
+        # Arrange
+        CircuitBreaker('lookups', failure_threshold=1).record_failure()
+
+        # Act
+        response = self.test_client.get('/metrics')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+
+        content = response.data.decode('utf-8')
+        self.assertIn('"lookups": "open"', content)
+        self.assertIn('"breaker.lookups.failures": 1', content)
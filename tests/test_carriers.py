@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import MagicMock, call, patch
+
+from app import create_app, db
+from app.carriers import resolve_mailbox_carrier
+from app.models import Mailbox
+
+
+class CarriersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_resolve_supported_carrier(self):
+        # Arrange
+        db.session.add(Mailbox('+15555555555'))
+        db.session.commit()
+
+        mock_lookup_result = MagicMock(carrier={'name': 'Verizon Wireless'})
+
+        # Act
+        with patch('app.carriers.look_up_number', return_value=mock_lookup_result):
+            resolve_mailbox_carrier('+15555555555')
+
+        # Assert
+        self.assertEqual(Mailbox.query.one().carrier, 'Verizon Wireless')
+
+    def test_resolve_unsupported_carrier(self):
+        # Arrange
+        db.session.add(Mailbox('+15555555555'))
+        db.session.commit()
+
+        mock_lookup_result = MagicMock(carrier={'name': 'Foo Wireless'})
+        mock_client = MagicMock()
+
+        # Act
+        with patch('app.carriers.look_up_number', return_value=mock_lookup_result):
+            with patch('app.carriers.get_twilio_rest_client', return_value=mock_client):
+                resolve_mailbox_carrier('+15555555555')
+
+        # Assert
+        self.assertEqual(Mailbox.query.count(), 0)
+
+        body = mock_client.messages.create.call_args[1]['body']
+        self.assertIn('Your phone is using Foo Wireless', body)
+
+    def test_resolve_carrier_no_mailbox(self):
+        # Arrange
+        self.app.config['CARRIER_WORKER_RETRY_DELAY'] = 0
+
+        # Act
+        with patch('app.carriers.look_up_number') as mock_lookup:
+            resolve_mailbox_carrier('+15555555555')
+
+        # Assert
+        self.assertTrue(mock_lookup.called)
+        self.assertEqual(Mailbox.query.count(), 0)
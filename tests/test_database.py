@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import MagicMock
+
+from app import create_app, db
+from app.database import _connection_options
+from app.metrics import get_metrics
+from app.models import Mailbox
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_sqlite_wal_mode(self):
+        # Act
+        journal_mode = db.session.execute('PRAGMA journal_mode').scalar()
+
+        # Assert
+        self.assertEqual(journal_mode, 'wal')
+
+    def test_write_request_commits(self):
+        # Act
+        with self.app.app_context():
+            db.session.add(Mailbox('+15555555555', carrier='Foo Wireless'))
+
+        # Assert
+        self.assertEqual(Mailbox.query.count(), 1)
+        self.assertEqual(get_metrics()['db.commits'], 1)
+
+    def test_flushed_write_request_commits(self):
+        # Act
+        with self.app.app_context():
+            db.session.add(Mailbox('+15555555555', carrier='Foo Wireless'))
+
+            # Querying flushes our new Mailbox, which empties session.new
+            Mailbox.query.first()
+
+        # Assert
+        self.assertEqual(Mailbox.query.count(), 1)
+
+    def test_bulk_delete_request_commits(self):
+        # Arrange
+        db.session.add(Mailbox('+15555555555', carrier='Foo Wireless'))
+        db.session.commit()
+
+        # Act
+        with self.app.app_context():
+            Mailbox.query.delete()
+
+        # Assert
+        self.assertEqual(Mailbox.query.count(), 0)
+
+    def test_read_only_request_skips_commit(self):
+        # Act
+        with self.app.app_context():
+            Mailbox.query.first()
+
+        # Assert
+        metrics = get_metrics()
+        self.assertNotIn('db.commits', metrics)
+        self.assertEqual(metrics['db.commits_skipped'], 1)
+        self.assertGreaterEqual(metrics['db.queries'], 1)
+
+    def test_pre_ping_not_counted(self):
+        # Arrange
+        self.assertTrue(self.app.config['DATABASE_PRE_PING'])
+
+        # Act
+        with self.app.app_context():
+            Mailbox.query.first()
+
+        # Assert
+        self.assertEqual(get_metrics()['db.queries'], 1)
+
+    def test_postgres_statement_timeout_committed(self):
+        # Arrange
+        dbapi_connection = MagicMock()
+        set_connection_options = _connection_options('postgresql', 5000)
+
+        # Act
+        set_connection_options(dbapi_connection, None)
+
+        # Assert
+        dbapi_connection.cursor.return_value.execute.assert_called_once_with(
+            'SET statement_timeout = 5000')
+        dbapi_connection.commit.assert_called_once_with()
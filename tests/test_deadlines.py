@@ -0,0 +1,291 @@
+import socket
+import unittest
+from flask import g
+from time import time
+from unittest.mock import MagicMock, patch
+
+from app import create_app, db
+from app.breaker import get_lookups_breaker
+from app.database import _deadline_timeout, _forget_statement_timeout
+from app.deadlines import DeadlineExceeded, get_timeout, has_time, remaining, \
+    until_deadline
+from app.models import Mailbox
+from app.utils import get_twilio_rest_client, look_up_number
+
+
+class DeadlinesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+
+        db.create_all()
+
+    def tearDown(self):
+        g.deadline = None
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_no_deadline(self):
+        # Act
+        timeout = get_timeout(10)
+
+        # Assert
+        self.assertIsNone(remaining())
+        self.assertEqual(timeout, 10)
+        self.assertTrue(has_time(60))
+
+    def test_request_deadline(self):
+        # Arrange
+        self.app.config['REQUEST_DEADLINE'] = 3
+
+        # Act
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+            left = remaining()
+
+        # Assert
+        self.assertTrue(2 < left <= 3)
+
+    def test_deadline_ends_with_request(self):
+        # Act
+        self.test_client.get('/healthz')
+
+        # Assert
+        self.assertIsNone(remaining())
+
+    def test_get_timeout(self):
+        # Arrange
+        g.deadline = time() + 2
+
+        # Act
+        timeout = get_timeout(10)
+
+        # Assert
+        self.assertTrue(1 < timeout <= 2)
+        self.assertEqual(get_timeout(0.5), 0.5)
+
+    def test_get_timeout_expired(self):
+        # Arrange
+        g.deadline = time() - 1
+
+        # Act / Assert
+        with self.assertRaises(DeadlineExceeded):
+            get_timeout(10)
+
+    def test_has_time(self):
+        # Arrange
+        g.deadline = time() + 0.2
+
+        # Act / Assert
+        self.assertFalse(has_time())
+        self.assertTrue(has_time(0.1))
+
+    def test_query_after_deadline(self):
+        # Arrange
+        g.deadline = time() - 1
+
+        # Act / Assert
+        with self.assertRaises(DeadlineExceeded):
+            Mailbox.query.first()
+
+    def test_query_timeout_follows_deadline(self):
+        # Arrange
+        g.deadline = time() + 2
+
+        # Act
+        Mailbox.query.first()
+
+        # Assert
+        statement_timeout = db.session.connection().info['statement_timeout']
+        self.assertTrue(1000 < statement_timeout <= 2000)
+
+    def test_postgres_deadline_timeout_is_local(self):
+        # Arrange
+        g.deadline = time() + 2
+        set_deadline_timeout = _deadline_timeout('postgresql', 5000)
+        conn, cursor = MagicMock(info={}), MagicMock()
+
+        # Act
+        set_deadline_timeout(conn, cursor, 'SELECT 1', {}, None, False)
+        _forget_statement_timeout(conn)
+        set_deadline_timeout(conn, cursor, 'SELECT 1', {}, None, False)
+
+        # Assert
+        # Each transaction starts with the connection's own limit again
+        self.assertEqual(cursor.execute.call_count, 2)
+        self.assertTrue(cursor.execute.call_args[0][0].startswith(
+            'SET LOCAL statement_timeout = '))
+
+    def test_rest_client_timeout(self):
+        # Arrange
+        g.deadline = time() + 3
+
+        # Act
+        with patch('app.utils.TwilioRestClient') as mock_client:
+            get_twilio_rest_client()
+
+        # Assert
+        self.assertTrue(2 < mock_client.call_args[1]['timeout'] <= 3)
+
+    def test_lookup_skipped(self):
+        # Arrange
+        g.deadline = time() + 0.1
+
+        # Act
+        with patch('app.utils.TwilioLookupsClient') as mock_client:
+            result = look_up_number('+15555555555')
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertFalse(mock_client.called)
+
+    def test_lookup_skipped_keeps_trial(self):
+        # Arrange
+        g.deadline = time() + 0.1
+        self.app.cache.set('breaker:lookups:opened_at', time() - 60)
+
+        # Act
+        with patch('app.utils.TwilioLookupsClient') as mock_client:
+            result = look_up_number('+15555555555')
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertFalse(mock_client.called)
+        self.assertTrue(get_lookups_breaker().allow_request())
+
+    def test_lookup_cut_short(self):
+        # Arrange
+        g.deadline = time() + 1
+        mock_client = MagicMock()
+        mock_client.phone_numbers.get.side_effect = socket.timeout()
+
+        # Act
+        with patch('app.utils.TwilioLookupsClient',
+                   return_value=mock_client) as mock_class, \
+                patch('app.utils.get_lookups_breaker') as mock_breaker:
+            result = look_up_number('+15555555555')
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertLessEqual(mock_class.call_args[1]['timeout'], 1)
+
+        # Our own deadline timing out isn't the API's fault
+        self.assertFalse(mock_breaker.return_value.record_failure.called)
+        self.assertTrue(mock_breaker.return_value.release_trial.called)
+
+    def test_call_skips_contact_info(self):
+        # Arrange
+        mailbox = Mailbox(
+            phone_number='+15555555555',
+            carrier='Foo Wireless',
+            name='Jane Foo',
+            email='jane@foo.com')
+        db.session.add(mailbox)
+        db.session.commit()
+
+        mock_lookup_result = MagicMock(carrier={'type': 'mobile', 'name': 'Foo Wireless'})
+
+        # Act
+        with patch('app.voice.views.look_up_number', return_value=mock_lookup_result), \
+                patch('app.voice.views.has_time', return_value=False), \
+                patch.object(Mailbox, 'send_contact_info') as mock:
+            response = self.test_client.post('/call', data={
+                'From': '+17777777777'})
+
+        # Assert
+        content = str(response.data)
+        self.assertIn('jane@foo.com', content)
+        self.assertNotIn('I am sending you a text message', content)
+        self.assertFalse(mock.called)
+
+    def test_call_past_deadline(self):
+        # Arrange
+        self.app.config['REQUEST_DEADLINE'] = -1
+
+        # Act
+        response = self.test_client.post('/call', data={
+            'From': '+17777777777'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('leave a message', str(response.data))
+
+    def test_record_past_deadline(self):
+        # Act
+        with patch('app.voice.views.record_event', side_effect=DeadlineExceeded):
+            response = self.test_client.post('/record', data={'Digits': '1'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('<Record', str(response.data))
+
+    def test_voice_webhook_past_deadline(self):
+        # Arrange
+        self.app.config['REQUEST_DEADLINE'] = -1
+
+        # Act
+        response = self.test_client.post('/send-notification', data={
+            'From': '+17777777777', 'RecordingSid': 'RE1234'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('<Response />', str(response.data))
+
+    def test_message_past_deadline(self):
+        # Arrange
+        self.app.config['REQUEST_DEADLINE'] = -1
+
+        # Act
+        response = self.test_client.post('/message', data={
+            'From': '+15555555555', 'Body': 'help'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('try sending it again', str(response.data))
+
+    def test_until_deadline(self):
+        # Arrange
+        g.deadline = time() + 60
+        lines = until_deadline(['one', 'two'])
+
+        # Act
+        first_line = next(lines)
+        g.deadline = time()
+
+        # Assert
+        self.assertEqual(first_line, 'one')
+        with self.assertRaises(DeadlineExceeded):
+            next(lines)
+
+    def test_whitelist_file_past_deadline(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+        db.session.add(mailbox)
+        db.session.commit()
+
+        def slow_lines(**kwargs):
+            yield 'name,phone'
+            yield '415 555 0001'
+
+            # The sender trickles in lines until our time is up
+            g.deadline = time()
+            yield '415 555 0002'
+
+        mock_response = MagicMock(iter_lines=slow_lines)
+
+        # Act
+        with patch('app.setup.views.requests.get', return_value=mock_response):
+            response = self.test_client.post('/message', data={
+                'From': '+15555555555',
+                'MediaUrl0': 'http://example.com/contacts.csv',
+                'MediaContentType0': 'text/csv'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('try sending it again', str(response.data))
+        self.assertEqual(Mailbox.query.one().whitelist, set())
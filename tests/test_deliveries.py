@@ -0,0 +1,171 @@
+import importlib
+import os
+import unittest
+from datetime import datetime
+from time import sleep
+from unittest.mock import MagicMock, patch
+
+from app import create_app, db
+from app.deliveries import MessageStatus, get_status_callback_url, \
+    write_statuses
+
+
+class DeliveriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        # Tests flush by hand, so keep our background thread out of the way
+        self.app.config['STATUS_FLUSH_INTERVAL'] = 60
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_coalesce(self):
+        # Arrange
+        buffer = self.app.deliveries
+
+        # Act
+        buffer.add('SM1', 'queued')
+        buffer.add('SM1', 'delivered')
+        buffer.add('SM1', 'sent')
+        buffer.add('SM2', 'sent')
+
+        # Assert
+        self.assertEqual(len(buffer.pending), 2)
+        self.assertEqual(buffer.pending['SM1'][0], 'delivered')
+
+    def test_flush(self):
+        # Arrange
+        buffer = self.app.deliveries
+        buffer.add('SM1', 'sent', to='+15555555555')
+        buffer.add('SM2', 'undelivered', error_code=30003)
+
+        # Act
+        written = buffer.flush()
+
+        # Assert
+        self.assertEqual(written, 2)
+        self.assertEqual(buffer.pending, {})
+
+        statuses = dict((row.sid, row) for row in MessageStatus.query)
+        self.assertEqual(statuses['SM1'].status, 'sent')
+        self.assertEqual(statuses['SM1'].to, '+15555555555')
+        self.assertEqual(statuses['SM2'].error_code, 30003)
+
+    def test_flush_updates(self):
+        # Arrange
+        buffer = self.app.deliveries
+        buffer.add('SM1', 'sent')
+        buffer.add('SM2', 'delivered')
+        buffer.flush()
+
+        buffer.add('SM1', 'delivered')
+        buffer.add('SM2', 'sent')
+
+        # Act
+        buffer.flush()
+
+        # Assert
+        statuses = dict((row.sid, row.status) for row in MessageStatus.query)
+        self.assertEqual(statuses, {'SM1': 'delivered', 'SM2': 'delivered'})
+
+    def test_flush_failed(self):
+        # Arrange
+        buffer = self.app.deliveries
+        buffer.add('SM1', 'sent')
+        db.drop_all()
+
+        # Act
+        with self.assertRaises(Exception):
+            buffer.flush()
+
+        # Assert
+        self.assertEqual(buffer.pending['SM1'][0], 'sent')
+        db.create_all()
+
+    def test_batch_size_wakes_thread(self):
+        # Arrange
+        self.app.config['STATUS_BATCH_SIZE'] = 2
+        buffer = self.app.deliveries
+        buffer.add('SM1', 'sent')
+
+        # Act
+        buffer.add('SM2', 'sent')
+
+        # Assert
+        for _ in range(200):
+            if MessageStatus.query.count() == 2:
+                break
+            sleep(0.01)
+        self.assertEqual(MessageStatus.query.count(), 2)
+
+    def test_worker_exit_flushes(self):
+        # Arrange
+        gunicorn_config = importlib.import_module('gunicorn_config')
+        self.app.deliveries.add('SM1', 'delivered', to='+15555555555')
+
+        # Act
+        with patch.dict('sys.modules', {'manage': MagicMock(app=self.app)}):
+            gunicorn_config.worker_exit(MagicMock(), MagicMock(pid=os.getpid()))
+
+        # Assert
+        self.assertEqual(self.app.deliveries.pending, {})
+        self.assertEqual(MessageStatus.query.one().status, 'delivered')
+
+    def test_write_statuses_chunks(self):
+        # Arrange
+        now = datetime.utcnow()
+        pending = dict(('SM{0}'.format(i), ('sent', None, None, now))
+                       for i in range(1200))
+
+        # Act
+        write_statuses(pending)
+
+        # Assert
+        self.assertEqual(MessageStatus.query.count(), 1200)
+
+    def test_message_status_view(self):
+        # Act
+        response = self.test_client.post('/message-status', data={
+            'MessageSid': 'SM1',
+            'MessageStatus': 'failed',
+            'ErrorCode': '30006',
+            'To': '+15555555555'})
+
+        # Assert
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.app.deliveries.pending['SM1'][:3],
+                         ('failed', 30006, '+15555555555'))
+
+        # Nothing's written until we flush
+        self.assertEqual(MessageStatus.query.count(), 0)
+
+    def test_status_callback_url(self):
+        # Act
+        with self.app.test_request_context():
+            url = get_status_callback_url()
+
+        # Assert
+        self.assertEqual(url, 'http://localhost/message-status')
+
+        # Background threads get the URL from our last request
+        self.assertEqual(get_status_callback_url(), url)
+
+    def test_status_callback_url_disabled(self):
+        # Arrange
+        self.app.config['MESSAGE_STATUS_CALLBACKS'] = False
+
+        # Act
+        with self.app.test_request_context():
+            url = get_status_callback_url()
+
+        # Assert
+        self.assertIsNone(url)
@@ -0,0 +1,119 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from app import create_app
+from app.breaker import CircuitBreaker
+from app.health import DatabaseProbe, get_outbox_state
+
+
+class HealthTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_probe_ok(self):
+        # Arrange
+        probe = DatabaseProbe(interval=60)
+
+        # Act
+        ok = probe.check()
+
+        # Assert
+        self.assertTrue(ok)
+        self.assertIsNone(probe.error)
+
+    def test_probe_failure(self):
+        # Arrange
+        probe = DatabaseProbe(interval=60)
+
+        # Act
+        with patch('app.health.db') as mock_db:
+            mock_db.engine.execute.side_effect = Exception('down')
+            ok = probe.check()
+
+        # Assert
+        self.assertFalse(ok)
+        self.assertIn('down', probe.error)
+
+    def test_probe_rate_limited(self):
+        # Arrange
+        probe = DatabaseProbe(interval=60)
+
+        # Act
+        with patch('app.health.db') as mock_db:
+            probe.check()
+            probe.check()
+            probe.check()
+
+        # Assert
+        self.assertEqual(mock_db.engine.execute.call_count, 1)
+
+    def test_probe_interval_passed(self):
+        # Arrange
+        probe = DatabaseProbe(interval=0)
+
+        # Act
+        with patch('app.health.db') as mock_db:
+            probe.check()
+            probe.check()
+
+        # Assert
+        self.assertEqual(mock_db.engine.execute.call_count, 2)
+
+    def test_outbox_state(self):
+        # Arrange
+        self.app.worker.submit(lambda: None)
+        self.app.worker.join()
+
+        # Act
+        state = get_outbox_state()
+
+        # Assert
+        self.assertEqual(state['jobs'], {'queued': 0, 'running': True})
+        self.assertEqual(state['emails'], {'queued': 0, 'running': False})
+        self.assertEqual(state['statuses'], {'queued': 0, 'running': False})
+
+    def test_healthz(self):
+        # Act
+        with patch('app.health.db') as mock_db:
+            response = self.test_client.get('/healthz')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(mock_db.engine.execute.called)
+
+    @patch('app.utils.get_twilio_rest_client')
+    def test_readyz(self, mock_client):
+        # Arrange
+        CircuitBreaker('lookups', failure_threshold=1).record_failure()
+
+        # Act
+        response = self.test_client.get('/readyz')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(mock_client.called)
+
+        content = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(content['status'], 'ok')
+        self.assertTrue(content['database']['ok'])
+        self.assertTrue(content['cache']['ok'])
+        self.assertEqual(content['breakers'], {'lookups': 'open'})
+        self.assertIn('jobs', content['outbox'])
+
+    def test_readyz_database_down(self):
+        # Act
+        with patch('app.health.db') as mock_db:
+            mock_db.engine.execute.side_effect = Exception('down')
+            response = self.test_client.get('/readyz')
+
+        # Assert
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(b'unavailable', response.data)
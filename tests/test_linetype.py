@@ -0,0 +1,80 @@
+import unittest
+
+from app import create_app
+from app.linetype import CarrierPrefixIndex, classify_number, get_hit_ratio
+from app.metrics import get_metrics
+
+
+class CarrierPrefixIndexTestCase(unittest.TestCase):
+    def test_carrier_for(self):
+        # Arrange
+        index = CarrierPrefixIndex({
+            '4479': {'en': 'Foo Wireless'},
+            '44791': {'en': 'Bar Mobile'},
+            '4478': {'fr': 'Baz Mobile'},
+        }, longest_prefix=5)
+
+        # Act / Assert
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.carrier_for('+447911123456'), 'Bar Mobile')
+        self.assertEqual(index.carrier_for('+447921123456'), 'Foo Wireless')
+        self.assertEqual(index.carrier_for('+447811123456'), 'Baz Mobile')
+        self.assertIsNone(index.carrier_for('+447711123456'))
+
+
+class ClassifyNumberTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_mobile(self):
+        # Act
+        result = classify_number('+491701234567')
+
+        # Assert
+        self.assertEqual(result.carrier, {'type': 'mobile',
+                                          'name': 'T-Mobile'})
+        self.assertEqual(get_metrics(), {'linetype.offline': 1})
+
+    def test_landline(self):
+        # Act
+        result = classify_number('+442079460000')
+
+        # Assert
+        self.assertEqual(result.carrier['type'], 'landline')
+
+    def test_nanp_is_ambiguous(self):
+        # Act
+        result = classify_number('+12125551234')
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertEqual(get_metrics(), {'linetype.ambiguous': 1})
+
+    def test_invalid_is_ambiguous(self):
+        # Act
+        result = classify_number('+15555555555')
+
+        # Assert
+        self.assertIsNone(result)
+
+    def test_disabled(self):
+        # Arrange
+        self.app.config['OFFLINE_LINE_TYPES'] = False
+
+        # Act
+        result = classify_number('+491701234567')
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertEqual(get_metrics(), {})
+
+    def test_get_hit_ratio(self):
+        # Act / Assert
+        self.assertIsNone(get_hit_ratio({}))
+        self.assertEqual(get_hit_ratio(
+            {'linetype.offline': 3, 'linetype.ambiguous': 1}), 0.75)
@@ -0,0 +1,106 @@
+import asyncore
+import smtpd
+import unittest
+from threading import Thread
+
+from app import create_app
+from app.metrics import get_metrics
+
+
+class LocalSMTPServer(smtpd.SMTPServer):
+    """A stand-in SMTP server which keeps every message it receives"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.messages = []
+        self.connections = 0
+
+        self.thread = Thread(target=asyncore.loop,
+                             kwargs={'timeout': 0.05, 'map': self._map},
+                             daemon=True)
+        self.thread.start()
+
+    def handle_accepted(self, conn, addr):
+        self.connections += 1
+        super().handle_accepted(conn, addr)
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.messages.append((rcpttos, data))
+
+    def stop(self):
+        self.close()
+        for channel in list(self._map.values()):
+            channel.close()
+        self.thread.join()
+
+
+class MailerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalSMTPServer()
+
+        self.app = create_app('testing')
+        self.app.config.update(
+            MAIL_SERVER='127.0.0.1', MAIL_PORT=self.server.port,
+            MAIL_USE_TLS=False, MAIL_POOL_SIZE=1)
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app.mailer.pool.close()
+        self.server.stop()
+        self.app_context.pop()
+
+    def test_send(self):
+        # Act
+        self.app.mailer.send('jane@foo.com', 'Hello', 'Hi Jane')
+        self.app.mailer.join()
+
+        # Assert
+        self.assertEqual(len(self.server.messages), 1)
+
+        recipients, data = self.server.messages[0]
+        self.assertEqual(recipients, ['jane@foo.com'])
+        self.assertIn(b'Subject: Hello', data)
+        self.assertIn(b'Hi Jane', data)
+
+    def test_reuses_connection(self):
+        # Act
+        for i in range(5):
+            self.app.mailer.send('jane@foo.com', 'Hello', str(i))
+        self.app.mailer.join()
+
+        self.app.mailer.send('jane@foo.com', 'Hello', 'Again')
+        self.app.mailer.join()
+
+        # Assert
+        self.assertEqual(len(self.server.messages), 6)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(get_metrics()['mail.connections'], 1)
+
+    def test_reconnects_after_idle_timeout(self):
+        # Arrange
+        self.app.config['MAIL_IDLE_TIMEOUT'] = 0
+
+        # Act
+        self.app.mailer.send('jane@foo.com', 'Hello', 'One')
+        self.app.mailer.join()
+        self.app.mailer.send('jane@foo.com', 'Hello', 'Two')
+        self.app.mailer.join()
+
+        # Assert
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_failed_send(self):
+        # Arrange
+        self.server.stop()
+        self.app.config['MAIL_PORT'] = 1
+
+        # Act
+        self.app.mailer.send('jane@foo.com', 'Hello', 'Hi Jane')
+        self.app.mailer.join()
+
+        # Assert
+        self.assertEqual(get_metrics()['mail.failed'], 1)
@@ -0,0 +1,51 @@
+import unittest
+
+from app import create_app
+from app.metrics import get_metrics, increment, set_gauge, timer
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_increment(self):
+        # Act
+        increment('foo')
+        increment('foo', 2)
+
+        # Assert
+        self.assertEqual(get_metrics(), {'foo': 3})
+
+    def test_increment_buffered(self):
+        # Arrange
+        self.app.config['METRICS_FLUSH_INTERVAL'] = 60
+
+        # Act
+        increment('foo')
+
+        # Assert
+        self.assertIsNone(self.app.cache.get('metrics:foo'))
+        self.assertEqual(get_metrics(), {'foo': 1})
+
+    def test_timer(self):
+        # Act
+        with timer('foo'):
+            pass
+
+        # Assert
+        metrics = get_metrics()
+        self.assertEqual(metrics['foo.count'], 1)
+        self.assertIn('foo.ms', metrics)
+
+    def test_set_gauge(self):
+        # Act
+        set_gauge('foo', 'open')
+        set_gauge('foo', 'closed')
+
+        # Assert
+        self.assertEqual(get_metrics(), {'foo': 'closed'})
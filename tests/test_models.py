@@ -4,6 +4,8 @@ from unittest.mock import MagicMock, patch
 
 from app import create_app, db
 from app.models import Mailbox, Voicemail
+from app.payload import decode_mailbox, encode_mailbox
+from app.whitelist import numbers_from_file
 
 
 class MailboxTestCase(unittest.TestCase):
@@ -20,12 +22,10 @@ class MailboxTestCase(unittest.TestCase):
 
     def test_mailbox_init(self):
         # Arrange
-        mock_lookup_result = MagicMock()
-        mock_lookup_result.carrier = {'name': 'Foo Wireless'}
+        self.app.cache.set('carrier:+15555555555', {'type': 'mobile', 'name': 'Foo Wireless'})
 
         # Act
-        with patch('app.models.look_up_number', return_value=mock_lookup_result):
-            mailbox = Mailbox('+15555555555')
+        mailbox = Mailbox('+15555555555')
 
         # Assert
         self.assertEqual(str(mailbox), "<Mailbox '+15555555555'>")
@@ -33,18 +33,36 @@ class MailboxTestCase(unittest.TestCase):
         self.assertEqual(mailbox.whitelist, set())
 
     def test_mailbox_init_whitelist(self):
+        # Act
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless', whitelist=['+17777777777'])
+
+        # Assert
+        self.assertEqual(str(mailbox), "<Mailbox '+15555555555'>")
+        self.assertEqual(mailbox.carrier, 'Foo Wireless')
+        self.assertEqual(mailbox.whitelist, set(['+17777777777']))
+
+    def test_mailbox_init_unknown_carrier(self):
+        # Act
+        with patch('app.models.look_up_number') as mock_lookup:
+            mailbox = Mailbox('+15555555555')
+
+        # Assert
+        self.assertIsNone(mailbox.carrier)
+        self.assertFalse(mock_lookup.called)
+
+    def test_resolve_carrier(self):
         # Arrange
+        mailbox = Mailbox('+15555555555')
         mock_lookup_result = MagicMock()
         mock_lookup_result.carrier = {'name': 'Foo Wireless'}
 
         # Act
         with patch('app.models.look_up_number', return_value=mock_lookup_result):
-            mailbox = Mailbox('+15555555555', whitelist=['+17777777777'])
+            carrier = mailbox.resolve_carrier()
 
         # Assert
-        self.assertEqual(str(mailbox), "<Mailbox '+15555555555'>")
+        self.assertEqual(carrier, 'Foo Wireless')
         self.assertEqual(mailbox.carrier, 'Foo Wireless')
-        self.assertEqual(mailbox.whitelist, set(['+17777777777']))
 
     def test_supported_carrier(self):
         # Arrange
@@ -96,6 +114,52 @@ class MailboxTestCase(unittest.TestCase):
         # Assert
         self.assertEqual(region_code, 'US')
 
+    def test_import_whitelist(self):
+        # Arrange
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless', whitelist=['+14155550001'])
+        old_whitelist = mailbox.whitelist
+
+        # Act
+        with patch.object(self.app.worker, 'submit') as mock_submit:
+            added, invalid = mailbox.import_whitelist(['415 555 0001', '415 555 0002', '(415) 555-0002', '415 555'])
+
+        # Assert
+        self.assertFalse(mock_submit.called)
+        self.assertEqual(added, 1)
+        self.assertEqual(invalid, 1)
+        self.assertEqual(mailbox.whitelist, set(['+14155550001', '+14155550002']))
+        self.assertIsNot(mailbox.whitelist, old_whitelist)
+
+    def test_version(self):
+        # Arrange
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless', whitelist=['+14155550001'])
+        db.session.add(mailbox)
+        db.session.commit()
+        saved_version = mailbox.version
+
+        # Act
+        db.session.remove()
+        loaded = Mailbox.query.first()
+        loaded_version = loaded.version
+        loaded.whitelist = loaded.whitelist.union(set(['+14155550002']))
+
+        # Assert
+        self.assertEqual(loaded_version, saved_version)
+        self.assertNotEqual(loaded.version, saved_version)
+
+    def test_import_whitelist_csv_names(self):
+        # Arrange
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless')
+        csv_lines = ['name,phone', 'Tom to Jerry,415 555 0001', 'Jane Foo*,415 555 0100 to 0199']
+
+        # Act
+        added, invalid = mailbox.import_whitelist(numbers_from_file(csv_lines))
+
+        # Assert
+        self.assertEqual(added, 2)
+        self.assertEqual(invalid, 0)
+        self.assertEqual(mailbox.whitelist, set(['+14155550001', '+14155550100..+14155550199']))
+
     def test_send_contact_info(self):
         # Arrange
         mailbox = Mailbox('+15555555555', name='Jane Foo', email='jane@foo.com', carrier='Foo Wireless')
@@ -156,16 +220,18 @@ class MailboxTestCase(unittest.TestCase):
         mailbox = Mailbox('+15555555555', carrier='Foo Wireless')
 
         # Act
-        with patch('app.models.qrcode') as mock_qrcode:
+        with patch('app.models.render_qr_code') as mock_render:
             mailbox.generate_config_image()
 
         # Assert
-        assert mock_qrcode.make.called
+        assert mock_render.called
+
+        payload = mock_render.call_args[0][0]
+        self.assertTrue(payload.startswith('AV1:'))
 
-        qrcode_json = mock_qrcode.make.call_args[0][0]
-        self.assertIn('+1555555555', qrcode_json)
-        self.assertIn('"call_forwarding_set": false', qrcode_json)
-        self.assertNotIn('_sa_instance_state', qrcode_json)
+        mailbox_dict = decode_mailbox(payload)
+        self.assertEqual(mailbox_dict['phone_number'], '+15555555555')
+        self.assertFalse(mailbox_dict['call_forwarding_set'])
 
     def test_send_config_image(self):
         # Arrange
@@ -208,6 +274,26 @@ class MailboxTestCase(unittest.TestCase):
 
         self.assertIn('Now I remember *everything* about you', result)
 
+    def test_import_config_image_compact(self):
+        # Arrange
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless',
+                          name='Jane Foo', whitelist=['+17777777777'])
+        payload = encode_mailbox(mailbox)
+
+        mock_response = MagicMock()
+        mock_response.json.return_value = [{'type': 'qrcode', 'symbol': [{'data': payload, 'error': None, 'seq': 0}]}]
+
+        # Act
+        with patch('app.models.requests.get', return_value=mock_response):
+            result = Mailbox.import_config_image('http://example.com')
+
+        # Assert
+        imported_mailbox = Mailbox.query.one()
+        self.assertEqual(imported_mailbox.name, 'Jane Foo')
+        self.assertEqual(imported_mailbox.whitelist, {'+17777777777'})
+
+        self.assertIn('Now I remember *everything* about you', result)
+
     def test_import_config_image_failure(self):
         # Arrange
         mock_response = MagicMock()
@@ -264,3 +350,27 @@ class VoicemailTestCase(unittest.TestCase):
         self.assertIn('(777) 777-7777', body)
         self.assertIn('hello world', body)
         self.assertIn('http://localhost/recording/12345', body)
+
+    def test_send_notification_email(self):
+        # Arrange
+        self.app.config['MAIL_SERVER'] = 'localhost'
+
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless',
+                          name='Jane Foo', email='jane@foo.com')
+        db.session.add(mailbox)
+        db.session.commit()
+
+        voicemail = Voicemail('+17777777777', 'hello world', '12345')
+
+        # Act
+        with self.app.test_request_context():
+            with patch('app.models.get_twilio_rest_client'):
+                with patch.object(self.app.mailer, 'send') as mock:
+                    voicemail.send_notification()
+
+        # Assert
+        to, subject, body = mock.call_args[0]
+        self.assertEqual(to, 'jane@foo.com')
+        self.assertEqual(subject, 'New voicemail from (777) 777-7777')
+        self.assertIn('hello world', body)
+        self.assertIn('http://localhost/recording/12345', body)
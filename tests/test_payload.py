@@ -0,0 +1,99 @@
+import json
+import unittest
+
+from app.models import Mailbox
+from app.payload import BASE45_ALPHABET, b45decode, b45encode, \
+    decode_mailbox, encode_mailbox
+
+
+class Base45TestCase(unittest.TestCase):
+    def test_encode(self):
+        # Examples from RFC 9285
+        self.assertEqual(b45encode(b'AB'), 'BB8')
+        self.assertEqual(b45encode(b'Hello!!'), '%69 VD92EX0')
+        self.assertEqual(b45encode(b'ietf!'), 'QED8WEX0')
+
+    def test_decode(self):
+        # Act / Assert
+        self.assertEqual(b45decode('QED8WEX0'), b'ietf!')
+
+    def test_decode_invalid(self):
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            b45decode('GGW')
+
+        with self.assertRaises(ValueError):
+            b45decode('abc')
+
+
+class PayloadTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        # Arrange
+        mailbox = Mailbox(
+            '+15555555555', id=1, carrier='Foo Wireless', name='Jane Foo',
+            email='jane@foo.com', feelings_on_qr_codes='love',
+            whitelist=['+17777777777', '+447911123456', 'anonymous'])
+
+        # Act
+        mailbox_dict = decode_mailbox(encode_mailbox(mailbox))
+
+        # Assert
+        self.assertEqual(mailbox_dict, {
+            'id': 1,
+            'phone_number': '+15555555555',
+            'carrier': 'Foo Wireless',
+            'name': 'Jane Foo',
+            'email': 'jane@foo.com',
+            'call_forwarding_set': False,
+            'feelings_on_qr_codes': 'love',
+            'whitelist': ['+17777777777', '+447911123456', 'anonymous']})
+
+    def test_schedule_round_trip(self):
+        # Arrange
+        schedule = [('weekly', (0, 1, 2, 3, 4), 540, 1020, 'strict'),
+                    ('date', '2026-12-25', 'record')]
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless',
+                          schedule=schedule)
+
+        # Act
+        mailbox_dict = decode_mailbox(encode_mailbox(mailbox))
+
+        # Assert
+        self.assertEqual(mailbox_dict['schedule'], schedule)
+
+    def test_alphanumeric(self):
+        # Arrange
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless',
+                          name='Jane Foo')
+
+        # Act
+        payload = encode_mailbox(mailbox)
+
+        # Assert
+        self.assertTrue(set(payload) <= set(BASE45_ALPHABET))
+
+    def test_smaller_than_json(self):
+        # Arrange
+        whitelist = ['+1555000{0:04d}'.format(i) for i in range(500)]
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless',
+                          whitelist=whitelist)
+
+        legacy_json = json.dumps({'phone_number': mailbox.phone_number,
+                                  'carrier': mailbox.carrier,
+                                  'whitelist': whitelist})
+
+        # Act
+        payload = encode_mailbox(mailbox)
+
+        # Assert
+        self.assertLess(len(payload) * 4, len(legacy_json))
+        self.assertEqual(sorted(decode_mailbox(payload)['whitelist']),
+                         sorted(whitelist))
+
+    def test_decode_invalid(self):
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            decode_mailbox('{"phone_number": "+15555555555"}')
+
+        with self.assertRaises(ValueError):
+            decode_mailbox('AV1:' + b45encode(b'\x09'))
@@ -0,0 +1,195 @@
+import unittest
+from threading import Thread
+from unittest.mock import patch
+
+from app import create_app, db
+from app.profiling import disable, enable, format_profile, get_profiles, \
+    save_profile
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['SECRET_KEY'] = 'secret'
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+        self.profiler = self.app.extensions['profiler']
+
+        db.create_all()
+
+    def tearDown(self):
+        self.app.worker.join()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, *args, **kwargs):
+        """Makes a request, and waits for its profile to be saved"""
+        response = self.test_client.get(*args, **kwargs)
+        self.app.worker.join()
+        return response
+
+    def post(self, *args, **kwargs):
+        """Like get(), for a webhook"""
+        response = self.test_client.post(*args, **kwargs)
+        self.app.worker.join()
+        return response
+
+    def test_not_profiled(self):
+        # Act
+        with patch('app.profiling.cProfile') as mock_cprofile:
+            response = self.get('/healthz')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(mock_cprofile.Profile.called)
+        self.assertEqual(get_profiles(), {})
+
+    def test_profile_header(self):
+        # Act
+        response = self.get('/healthz', headers={
+            'X-Profile': self.profiler.make_token()})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+
+        profiles = get_profiles()['status.liveness']
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['reason'], 'header')
+        self.assertEqual(profiles[0]['path'], '/healthz')
+        self.assertTrue(any('jsonify' in function['function']
+                            for function in profiles[0]['functions']))
+
+    def test_profile_header_invalid(self):
+        # Act
+        response = self.get('/healthz', headers={
+            'X-Profile': 'profile.forged.signature'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_profiles(), {})
+
+    def test_profile_header_without_secret_key(self):
+        # Arrange
+        token = self.profiler.make_token()
+        self.app.config['SECRET_KEY'] = None
+
+        # Act
+        self.get('/healthz', headers={'X-Profile': token})
+
+        # Assert
+        self.assertEqual(get_profiles(), {})
+
+    def test_sampling(self):
+        # Arrange
+        enable(rate=1, seconds=60)
+
+        # Act
+        self.post('/hang-up')
+        self.post('/hang-up')
+
+        # Assert
+        profiles = get_profiles('voice.hang_up')['voice.hang_up']
+        self.assertEqual([profile['reason'] for profile in profiles],
+                         ['sampled', 'sampled'])
+
+    def test_sampling_disabled(self):
+        # Arrange
+        enable(rate=1, seconds=60)
+        disable()
+
+        # Act
+        self.post('/hang-up')
+
+        # Assert
+        self.assertEqual(get_profiles(), {})
+
+    def test_sampling_expired(self):
+        # Arrange
+        enable(rate=1, seconds=-1)
+
+        # Act
+        self.post('/hang-up')
+
+        # Assert
+        self.assertEqual(get_profiles(), {})
+
+    def test_status_not_sampled(self):
+        # Arrange
+        enable(rate=1, seconds=60)
+
+        # Act
+        with patch.object(self.profiler, '_refresh') as mock_refresh:
+            self.get('/healthz')
+            self.get('/readyz')
+
+        # Assert
+        self.assertFalse(mock_refresh.called)
+        self.assertEqual(get_profiles(), {})
+
+    def test_keep_newest(self):
+        # Arrange
+        self.app.config['PROFILING_KEEP'] = 2
+        self.app.config['PROFILING_TOP_N'] = 3
+        enable(rate=1, seconds=60)
+
+        # Act
+        for path in ('/hang-up', '/hang-up?a', '/hang-up?b'):
+            self.post(path)
+
+        # Assert
+        profiles = get_profiles()['voice.hang_up']
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual(len(profiles[0]['functions']), 3)
+
+    def test_keep_newest_concurrently(self):
+        # Arrange
+        self.app.config['PROFILING_KEEP'] = 3
+
+        def save(i):
+            with self.app.app_context():
+                save_profile('status.liveness', {'path': str(i)})
+
+        threads = [Thread(target=save, args=[i]) for i in range(10)]
+
+        # Act
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Assert
+        self.assertEqual(len(get_profiles()['status.liveness']), 3)
+
+    def test_toggle_shared(self):
+        # Arrange
+        other_app = create_app('testing')
+
+        # Act
+        # Like 'manage.py profiles enable', from a different process
+        with other_app.app_context():
+            enable(rate=1, seconds=60)
+        self.post('/hang-up')
+
+        # Assert
+        self.assertIn('voice.hang_up', get_profiles())
+
+    def test_format_profile(self):
+        # Arrange
+        profile = {
+            'method': 'POST', 'path': '/call', 'reason': 'header',
+            'elapsed_ms': 12.5, 'pid': 42, 'functions': [{
+                'function': 'voice/views.py:57(incoming_call)', 'calls': 1,
+                'own_ms': 0.25, 'total_ms': 12.0}]}
+
+        # Act
+        text = format_profile('voice.incoming_call', profile)
+
+        # Assert
+        self.assertIn('voice.incoming_call POST /call (header, 12.5 ms',
+                      text)
+        self.assertIn('12.000      0.250        1  '
+                      'voice/views.py:57(incoming_call)', text)
@@ -0,0 +1,36 @@
+import unittest
+from io import BytesIO
+
+import qrcode
+from PIL import Image, ImageChops
+
+from app.qrimage import render_png, render_qr_code
+
+
+class QRImageTestCase(unittest.TestCase):
+    def test_render_png(self):
+        # Arrange
+        matrix = [[True, False], [False, True]]
+
+        # Act
+        image = Image.open(BytesIO(render_png(matrix, box_size=3)))
+
+        # Assert
+        self.assertEqual(image.mode, '1')
+        self.assertEqual(image.size, (6, 6))
+        self.assertEqual(image.getpixel((0, 0)), 0)
+        self.assertEqual(image.getpixel((2, 2)), 0)
+        self.assertEqual(image.getpixel((3, 0)), 255)
+        self.assertEqual(image.getpixel((5, 5)), 0)
+
+    def test_render_qr_code_matches_qrcode(self):
+        # Arrange
+        expected = qrcode.make('AV1:FOO BAR').convert('1')
+
+        # Act
+        image = Image.open(BytesIO(render_qr_code('AV1:FOO BAR')))
+
+        # Assert
+        self.assertEqual(image.size, expected.size)
+        self.assertIsNone(ImageChops.difference(
+            image.convert('L'), expected.convert('L')).getbbox())
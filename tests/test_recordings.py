@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from app.recordings import RecordingArchive
+
+
+class RecordingArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.archive = RecordingArchive(self.directory, max_bytes=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _mock_response(self, *chunks):
+        return MagicMock(iter_content=MagicMock(return_value=list(chunks)))
+
+    def test_archive(self):
+        # Arrange
+        mock_response = self._mock_response(b'abc', b'def')
+
+        # Act
+        with patch('app.recordings.requests.get',
+                   return_value=mock_response) as mock:
+            self.archive.archive('RE1234', 'https://example.com/RE1234',
+                                 {'from_number': '+15555555555'}, timeout=10)
+
+        # Assert
+        mock.assert_called_once_with('https://example.com/RE1234.mp3',
+                                     auth=None, stream=True, timeout=10)
+
+        self.assertTrue(self.archive.has_recording('RE1234'))
+        with open(self.archive.audio_path('RE1234'), 'rb') as f:
+            self.assertEqual(f.read(), b'abcdef')
+
+        self.assertEqual(self.archive.get_metadata('RE1234'),
+                         {'from_number': '+15555555555'})
+        self.assertFalse(os.path.exists(
+            self.archive.audio_path('RE1234') + '.part'))
+
+    def test_prune(self):
+        # Arrange
+        for mtime, recording_sid in enumerate(['RE1', 'RE2', 'RE3']):
+            path = self.archive.audio_path(recording_sid)
+            with open(path, 'wb') as f:
+                f.write(b'12345')
+            os.utime(path, (mtime, mtime))
+
+        # Act
+        self.archive.prune()
+
+        # Assert
+        self.assertFalse(self.archive.has_recording('RE1'))
+        self.assertTrue(self.archive.has_recording('RE2'))
+        self.assertTrue(self.archive.has_recording('RE3'))
+
+    def test_archive_failed_download(self):
+        # Arrange
+        mock_response = MagicMock(
+            iter_content=MagicMock(side_effect=IOError('Connection reset')))
+
+        # Act
+        with patch('app.recordings.requests.get',
+                   return_value=mock_response):
+            with self.assertRaises(IOError):
+                self.archive.archive('RE1234', 'https://example.com/RE1234',
+                                     {'from_number': '+15555555555'})
+
+        # Assert
+        self.assertFalse(self.archive.has_recording('RE1234'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_prune_partial_downloads(self):
+        # Arrange
+        stale_path = self.archive.audio_path('RE1') + '.part'
+        fresh_path = self.archive.audio_path('RE2') + '.part'
+        for path in (stale_path, fresh_path):
+            with open(path, 'wb') as f:
+                f.write(b'12345')
+        os.utime(stale_path, (0, 0))
+
+        recording_path = self.archive.audio_path('RE3')
+        with open(recording_path, 'wb') as f:
+            f.write(b'123456')
+
+        # Act
+        self.archive.prune()
+
+        # Assert
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertTrue(os.path.exists(fresh_path))
+
+        # The download still in progress counts towards our max_bytes
+        self.assertFalse(self.archive.has_recording('RE3'))
+
+    def test_get_metadata_missing(self):
+        # Act
+        metadata = self.archive.get_metadata('RE1234')
+
+        # Assert
+        self.assertIsNone(metadata)
+
+    def test_invalid_sid(self):
+        # Act / Assert
+        with self.assertRaises(ValueError):
+            self.archive.audio_path('../secret')
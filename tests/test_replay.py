@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app import create_app, db
+from app.models import Mailbox
+from app.replay import format_report, load_webhooks, percentile, \
+    replay_webhooks
+from config import config
+
+
+class CaptureTestCase(unittest.TestCase):
+    def setUp(self):
+        handle, self.capture_file = tempfile.mkstemp()
+        os.close(handle)
+
+        with patch.object(config['testing'], 'WEBHOOK_CAPTURE_FILE',
+                          self.capture_file):
+            self.app = create_app('testing')
+        self.app.config['TWILIO_FAKE_BACKEND'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        os.remove(self.capture_file)
+
+    def test_capture(self):
+        # Act
+        self.test_client.post('/call', data={'From': '+17777777777'},
+                              headers={'X-Twilio-Signature': 'secret'})
+        self.test_client.get('/')
+
+        # Assert
+        with open(self.capture_file) as f:
+            webhooks = load_webhooks(f)
+
+        self.assertEqual(len(webhooks), 1)
+        self.assertEqual(webhooks[0]['path'], '/call')
+        self.assertEqual(webhooks[0]['form'], {'From': ['+17777777777']})
+        self.assertEqual(webhooks[0]['status'], 200)
+        self.assertIn('<Response>', webhooks[0]['response'])
+        self.assertNotIn('secret', json.dumps(webhooks[0]))
+
+
+class ReplayTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('replay')
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        db.session.add(Mailbox('+15555555555', carrier='Verizon Wireless',
+                               name='Jane Foo', email='jane@foo.com'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def webhook(self, response, status=200, time=0):
+        return {'time': time, 'method': 'POST', 'path': '/call', 'query': {},
+                'form': {'From': ['+17777777778']}, 'status': status,
+                'elapsed_ms': 5, 'response': response}
+
+    def test_replay(self):
+        # Arrange
+        # The second call from the same number is sent straight to /record
+        test_client = self.app.test_client()
+        webhooks = []
+        for time in [0, 0.01]:
+            response = test_client.post('/call',
+                                        data={'From': '+17777777778'})
+            webhooks.append(self.webhook(response.get_data(as_text=True),
+                                         response.status_code, time))
+
+        self.app.cache.clear()
+
+        # Act
+        report = replay_webhooks(self.app, webhooks, speed=1)
+
+        # Assert
+        self.assertEqual(len(report['latencies']['/call']['replayed']), 2)
+        self.assertEqual(report['diffs'], [])
+
+    def test_replay_diff(self):
+        # Act
+        report = replay_webhooks(self.app, [self.webhook('<Response/>')],
+                                 speed=None)
+
+        # Assert
+        number, path, diff = report['diffs'][0]
+        self.assertEqual(path, '/call')
+        self.assertIn('-<Response/>', diff)
+
+        self.assertIn('1 responses differed', format_report(report))
+
+    def test_percentile(self):
+        # Act / Assert
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([5], 90), 5)
+        self.assertIsNone(percentile([], 50))
@@ -0,0 +1,123 @@
+import unittest
+from datetime import datetime
+
+import pytz
+
+from app.schedules import compile_schedule, format_rule, get_action, \
+    get_timezone, parse_rule
+
+
+def local_time(timezone_name, *args):
+    return pytz.timezone(timezone_name).localize(datetime(*args))
+
+
+class SchedulesTestCase(unittest.TestCase):
+    def test_parse_weekly_rule(self):
+        # Assert
+        self.assertEqual(parse_rule('Weekdays 9:00-17:00 strict'),
+                         ('weekly', (0, 1, 2, 3, 4), 540, 1020, 'strict'))
+        self.assertEqual(parse_rule('fri-mon 22-7 voicemail'),
+                         ('weekly', (0, 4, 5, 6), 1320, 420, 'record'))
+        self.assertEqual(parse_rule('sat,sun 0:00-24:00 record'),
+                         ('weekly', (5, 6), 0, 1440, 'record'))
+
+    def test_parse_date_rule(self):
+        # Assert
+        self.assertEqual(parse_rule('2026-12-25 record'),
+                         ('date', '2026-12-25', 'record'))
+
+    def test_parse_invalid_rule(self):
+        # Assert
+        for text in ('weekdays 9:00-17:00', 'someday 9-17 strict',
+                     'daily 9-9 strict', 'daily 9-25 strict',
+                     '2026-13-01 record', 'daily 9-17 sometimes'):
+            with self.assertRaises(ValueError):
+                parse_rule(text)
+
+    def test_format_rule(self):
+        # Arrange
+        rules = [parse_rule('weekdays 9:00-17:30 strict'),
+                 parse_rule('2026-12-25 record')]
+
+        # Act
+        texts = [format_rule(rule) for rule in rules]
+
+        # Assert
+        self.assertEqual(texts, ['mon,tue,wed,thu,fri 9:00-17:30 strict',
+                                 '2026-12-25 record'])
+        self.assertEqual([parse_rule(text) for text in texts], rules)
+
+    def test_get_timezone(self):
+        # Assert
+        self.assertEqual(get_timezone('+14155550100', 'US'),
+                         'America/Los_Angeles')
+        self.assertEqual(get_timezone('+442079460000', 'GB'),
+                         'Europe/London')
+
+    def test_compile_merges_intervals(self):
+        # Act
+        index = compile_schedule([
+            parse_rule('mon 9-12 strict'), parse_rule('mon 12-17 strict')],
+            'UTC')
+
+        # Assert
+        self.assertEqual(index['starts'], [0, 540, 1020])
+        self.assertEqual(index['actions'], ['normal', 'strict', 'normal'])
+
+    def test_later_rules_win(self):
+        # Arrange
+        index = compile_schedule([
+            parse_rule('weekdays 9-17 strict'),
+            parse_rule('wed 12-13 record')], 'UTC')
+
+        # Assert
+        self.assertEqual(
+            get_action(index, local_time('UTC', 2026, 10, 21, 12, 30)),
+            'record')
+        self.assertEqual(
+            get_action(index, local_time('UTC', 2026, 10, 21, 13, 0)),
+            'strict')
+
+    def test_overnight_rule(self):
+        # Arrange
+        index = compile_schedule([parse_rule('sun 22:00-7:00 record')],
+                                 'America/Los_Angeles')
+
+        # Assert
+        self.assertEqual(get_action(index, local_time(
+            'America/Los_Angeles', 2026, 10, 18, 23, 0)), 'record')
+        self.assertEqual(get_action(index, local_time(
+            'America/Los_Angeles', 2026, 10, 19, 6, 59)), 'record')
+        self.assertEqual(get_action(index, local_time(
+            'America/Los_Angeles', 2026, 10, 19, 7, 0)), 'normal')
+
+    def test_action_in_mailbox_timezone(self):
+        # Arrange
+        index = compile_schedule([parse_rule('daily 9-17 strict')],
+                                 'America/Los_Angeles')
+
+        # Act - 18:00 in London is 10:00 in San Francisco
+        action = get_action(index, local_time('Europe/London', 2026, 10, 19,
+                                              18, 0))
+
+        # Assert
+        self.assertEqual(action, 'strict')
+
+    def test_date_override(self):
+        # Arrange
+        index = compile_schedule([
+            parse_rule('daily 9-17 strict'), parse_rule('2026-12-25 record')],
+            'UTC')
+
+        # Assert
+        self.assertEqual(
+            get_action(index, local_time('UTC', 2026, 12, 25, 10, 0)),
+            'record')
+        self.assertEqual(
+            get_action(index, local_time('UTC', 2026, 12, 24, 10, 0)),
+            'strict')
+
+    def test_no_schedule(self):
+        # Assert
+        self.assertIsNone(compile_schedule([], 'UTC'))
+        self.assertEqual(get_action(None), 'normal')
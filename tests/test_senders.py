@@ -0,0 +1,138 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from app import create_app
+from app.senders import SenderPool, TokenBucket, get_sender_numbers
+from app.utils import set_twilio_number_urls
+
+
+class SenderPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_token_bucket(self):
+        # Arrange
+        bucket = TokenBucket(rate=2, burst=2)
+        now = bucket.updated
+
+        # Act
+        waits = [bucket.take(now) for _ in range(4)]
+
+        # Assert
+        self.assertEqual(waits, [0, 0, 0.5, 1])
+
+    def test_token_bucket_refills(self):
+        # Arrange
+        bucket = TokenBucket(rate=2, burst=2)
+        now = bucket.updated
+        bucket.take(now)
+        bucket.take(now)
+
+        # Act
+        wait = bucket.take(now + 0.5)
+
+        # Assert
+        self.assertEqual(wait, 0)
+
+    def test_sticky_assignment(self):
+        # Arrange
+        pool = SenderPool(['+12222222222', '+13333333333'], rate=1, burst=5)
+
+        # Act
+        senders = [pool.acquire('+15555555555')[0] for _ in range(3)]
+
+        # Assert
+        self.assertEqual(senders, ['+12222222222'] * 3)
+
+    def test_least_loaded(self):
+        # Arrange
+        pool = SenderPool(['+12222222222', '+13333333333'], rate=1, burst=5)
+        pool.acquire('+15555555555')
+
+        # Act
+        sender, wait = pool.acquire('+16666666666')
+
+        # Assert
+        self.assertEqual(sender, '+13333333333')
+        self.assertEqual(wait, 0)
+
+    def test_removed_number_reassigned(self):
+        # Arrange
+        self.app.cache.set('sender:+15555555555', '+19999999999')
+        pool = SenderPool(['+12222222222'], rate=1, burst=5)
+
+        # Act
+        sender, _ = pool.acquire('+15555555555')
+
+        # Assert
+        self.assertEqual(sender, '+12222222222')
+        self.assertEqual(self.app.cache.get('sender:+15555555555'),
+                         '+12222222222')
+
+    def test_acquire_default(self):
+        # Arrange
+        pool = SenderPool(['+12222222222', '+13333333333'], rate=1, burst=5)
+        pool.acquire('+16666666666')
+
+        # Act
+        sender, _ = pool.acquire('+15555555555', default='+12222222222')
+
+        # Assert
+        self.assertEqual(sender, '+12222222222')
+
+    def test_pin(self):
+        # Arrange
+        pool = SenderPool(['+12222222222', '+13333333333'], rate=1, burst=5)
+        pool.acquire('+15555555555')
+
+        # Act
+        pool.pin('+15555555555', '+13333333333')
+        pool.pin('+16666666666', '+19999999999')
+
+        # Assert
+        self.assertEqual(pool.acquire('+15555555555')[0], '+13333333333')
+        self.assertEqual(pool.acquire('+16666666666')[0], '+12222222222')
+
+    def test_get_sender_numbers(self):
+        # Arrange
+        main_number = self.app.config['TWILIO_PHONE_NUMBER']
+        self.app.config['TWILIO_SENDER_NUMBERS'] = [
+            '+13333333333', main_number]
+
+        # Act
+        numbers = get_sender_numbers()
+
+        # Assert
+        self.assertEqual(numbers, [main_number, '+13333333333'])
+
+    def test_set_twilio_urls_batched(self):
+        # Arrange
+        self.app.config['TWILIO_SENDER_NUMBERS'] = [
+            '+13333333333', '+14444444444']
+
+        numbers = [MagicMock(
+            phone_number=phone_number, voice_url=None, sms_url=None,
+            voice_fallback_url=None, sms_fallback_url=None)
+            for phone_number in get_sender_numbers()]
+        mock_client = MagicMock()
+        mock_client.phone_numbers.list.side_effect = \
+            lambda phone_number=None: \
+            numbers[:2] if phone_number is None else numbers[2:]
+
+        # Act
+        with self.app.test_request_context(), \
+                patch('app.utils.get_twilio_rest_client',
+                      return_value=mock_client):
+            set_twilio_number_urls()
+
+        # Assert
+        self.assertEqual(mock_client.phone_numbers.list.call_count, 2)
+        for number in numbers:
+            self.assertEqual(
+                number.update.call_args[1]['sms_url'],
+                'http://localhost/message')
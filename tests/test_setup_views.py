@@ -1,9 +1,14 @@
 import unittest
+from datetime import datetime, timedelta
 from flask import current_app
-from unittest.mock import MagicMock, patch
+from random import Random
+from unittest.mock import ANY, MagicMock, patch
 
 from app import create_app, db
+from app.analytics import DailyCount
+from app.carriers import resolve_mailbox_carrier
 from app.models import Mailbox, Voicemail
+from app.senders import get_sender_pool
 from app.setup.views import _import_config, _process_command, _process_answer
 
 
@@ -34,29 +39,45 @@ class SMSViewTestCase(unittest.TestCase):
 
     def test_sms_no_mailbox_good_carrier(self):
         # Arrange
-        mock_lookup_result = MagicMock()
-        mock_lookup_result.carrier = {'name': 'Verizon Wireless'}
+        self.app.cache.set('carrier:+15555555555', {'name': 'Verizon Wireless'})
 
         # Act
-        with patch('app.models.look_up_number', return_value=mock_lookup_result):
+        with patch.object(self.app.worker, 'submit') as mock_submit:
             response = self.test_client.post('/message', data={'From': '+15555555555'})
 
         # Assert
         self.assertEqual(response.status_code, 200)
         mailbox = Mailbox.query.one()
         self.assertEqual(mailbox.phone_number, '+15555555555')
+        self.assertEqual(mailbox.carrier, 'Verizon Wireless')
+        self.assertFalse(mock_submit.called)
+
+        content = str(response.data)
+        self.assertIn("your name", content)
+
+    def test_sms_no_mailbox_unknown_carrier(self):
+        # Act
+        with patch('app.models.look_up_number') as mock_lookup:
+            with patch.object(self.app.worker, 'submit') as mock_submit:
+                response = self.test_client.post('/message', data={'From': '+15555555555'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(mock_lookup.called)
+        mock_submit.assert_called_once_with(resolve_mailbox_carrier, '+15555555555')
+
+        mailbox = Mailbox.query.one()
+        self.assertIsNone(mailbox.carrier)
 
         content = str(response.data)
         self.assertIn("your name", content)
 
     def test_sms_no_mailbox_bad_carrier(self):
         # Arrange
-        mock_lookup_result = MagicMock()
-        mock_lookup_result.carrier = {'name': 'Foo Wireless'}
+        self.app.cache.set('carrier:+15555555555', {'name': 'Foo Wireless'})
 
         # Act
-        with patch('app.models.look_up_number', return_value=mock_lookup_result):
-            response = self.test_client.post('/message', data={'From': '+15555555555'})
+        response = self.test_client.post('/message', data={'From': '+15555555555'})
 
         # Assert
         self.assertEqual(response.status_code, 200)
@@ -78,6 +99,32 @@ class SMSViewTestCase(unittest.TestCase):
 
         self.assertEqual(Mailbox.query.count(), 1)
 
+    def test_sms_pins_sender_for_notifications(self):
+        # Arrange
+        main_number = self.app.config['TWILIO_PHONE_NUMBER']
+        self.app.config['TWILIO_SENDER_NUMBERS'] = ['+13333333333']
+
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Verizon Wireless',
+                          name='Jane Foo', email='jane@foo.com', call_forwarding_set=True)
+        db.session.add(mailbox)
+        db.session.commit()
+
+        # Our main number is busier, so it isn't the least loaded any more
+        get_sender_pool().acquire('+16666666666')
+
+        mock_client = MagicMock()
+
+        # Act
+        self.test_client.post('/message', data={
+            'From': '+15555555555', 'To': main_number, 'Body': 'help'})
+
+        with self.app.test_request_context():
+            with patch('app.models.get_twilio_rest_client', return_value=mock_client):
+                Voicemail('+17777777777', 'hello world', '12345').send_notification()
+
+        # Assert
+        self.assertEqual(mock_client.messages.create.call_args[1]['from_'], main_number)
+
     def test_sms_config_image(self):
         # Act
         with patch('app.setup.views._import_config', return_value='Image processed!') as mock:
@@ -92,6 +139,80 @@ class SMSViewTestCase(unittest.TestCase):
         content = str(response.data)
         self.assertIn('Image processed!', content)
 
+    def test_config_image(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Verizon Wireless',
+                          name='Jane Foo', email='jane@foo.com')
+        db.session.add(mailbox)
+
+        # Act
+        response = self.test_client.get('/config-image')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+
+    def test_config_image_too_large(self):
+        # Arrange
+        random = Random(1000)
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Verizon Wireless',
+                          name='Jane Foo', email='jane@foo.com',
+                          whitelist=['+1{0}'.format(random.randint(2000000000, 9999999999))
+                                     for i in range(1000)])
+        db.session.add(mailbox)
+
+        # Act
+        response = self.test_client.get('/config-image')
+
+        # Assert
+        self.assertEqual(response.status_code, 413)
+        self.assertIn(b'too large', response.data)
+
+    def test_sms_whitelist_file(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+        db.session.add(mailbox)
+
+        mock_response = MagicMock()
+        mock_response.iter_lines.return_value = iter([
+            'BEGIN:VCARD', 'FN:Jane Foo', 'TEL;TYPE=CELL:(415) 555-0001',
+            'TEL;TYPE=HOME:555', 'END:VCARD'])
+
+        # Act
+        with patch('app.setup.views.requests.get', return_value=mock_response) as mock_get:
+            response = self.test_client.post('/message', data={
+                'From': '+15555555555',
+                'MediaUrl0': 'http://example.com/jane.vcf',
+                'MediaContentType0': 'text/x-vcard'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        mock_get.assert_called_once_with('http://example.com/jane.vcf', stream=True, timeout=ANY)
+
+        # We get whatever's left of our request's deadline
+        self.assertLessEqual(mock_get.call_args[1]['timeout'], 10)
+        self.assertEqual(mailbox.whitelist, set(['+14155550001']))
+
+        content = str(response.data)
+        self.assertIn('I added 1 new number to your whitelist', content)
+        self.assertIn('1 of the numbers you sent', content)
+
+    def test_sms_whitelist_file_not_our_user(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+        db.session.add(mailbox)
+
+        # Act
+        with patch('app.setup.views.requests.get') as mock_get:
+            response = self.test_client.post('/message', data={
+                'From': '+17777777777',
+                'MediaUrl0': 'http://example.com/numbers.csv',
+                'MediaContentType0': 'text/csv'})
+
+        # Assert
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(mock_get.called)
+
     def test_sms_process_command(self):
         # Arrange
         mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
@@ -110,6 +231,23 @@ class SMSViewTestCase(unittest.TestCase):
         content = str(response.data)
         self.assertIn('Command processed!', content)
 
+    def test_sms_whitelist_lines(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+        db.session.add(mailbox)
+
+        # Act
+        response = self.test_client.post('/message', data={
+            'From': '+15555555555',
+            'Body': 'whitelist 415 555 0101\n415 555 0102\n'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mailbox.whitelist, set(['+14155550101', '+14155550102']))
+
+        content = str(response.data)
+        self.assertIn('I added 2 new numbers to your whitelist', content)
+
     def test_sms_process_answer(self):
         # Arrange
         mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
@@ -210,19 +348,110 @@ class ProcessCommandTestCase(unittest.TestCase):
 
         # Act
         body = 'whitelist 415 777 7777'
-        reply = _process_command('whitelist', body.split(), mailbox, '+15555555555')
+        reply = _process_command('whitelist', body.split(None, 1), mailbox, '+15555555555')
 
         # Assert
         self.assertEqual(mailbox.whitelist, set(['+14157777777']))
         self.assertIn('always allow calls from (415) 777-7777', reply)
 
+    def test_sms_whitelist_many_numbers(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+
+        # Act
+        body = 'whitelist 415 777 7777, 415 888 8888; 415 777'
+        reply = _process_command('whitelist', body.split(None, 1), mailbox, '+15555555555')
+
+        # Assert
+        self.assertEqual(mailbox.whitelist, set(['+14157777777', '+14158888888']))
+        self.assertIn('I added 2 new numbers to your whitelist', reply)
+        self.assertIn('1 of the numbers you sent', reply)
+
+    def test_sms_whitelist_prefix(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+
+        # Act
+        body = 'whitelist 415 777*'
+        reply = _process_command('whitelist', body.split(None, 1), mailbox, '+15555555555')
+
+        # Assert
+        self.assertEqual(mailbox.whitelist, set(['+1415777*']))
+        self.assertIn('always allow calls from any number starting with +1415777', reply)
+        self.assertTrue(mailbox.is_whitelisted('+14157771234'))
+
+    def test_sms_whitelist_range(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+
+        # Act
+        body = 'whitelist 415 777 0100 to 0199, 415 888 8888'
+        reply = _process_command('whitelist', body.split(None, 1), mailbox, '+15555555555')
+
+        # Assert
+        self.assertEqual(mailbox.whitelist, set(['+14157770100..+14157770199', '+14158888888']))
+        self.assertIn('I added 2 new numbers to your whitelist', reply)
+        self.assertTrue(mailbox.is_whitelisted('+14157770150'))
+
+    def test_sms_whitelist_bad_rule(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+
+        # Act
+        body = 'whitelist +1*'
+        reply = _process_command('whitelist', body.split(None, 1), mailbox, '+15555555555')
+
+        # Assert
+        self.assertEqual(mailbox.whitelist, set())
+        self.assertIn('an you send it to me again?', reply)
+
+    def test_sms_schedule(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+
+        # Act
+        _process_command('schedule', 'schedule weekdays 9-17 strict'.split(None, 1), mailbox, '+15555555555')
+        reply = _process_command('schedule', 'schedule 2026-12-25 record'.split(None, 1), mailbox, '+15555555555')
+
+        # Assert
+        self.assertEqual(mailbox.schedule, [
+            ('weekly', (0, 1, 2, 3, 4), 540, 1020, 'strict'),
+            ('date', '2026-12-25', 'record')])
+        self.assertEqual(mailbox.schedule_index['timezone'], 'America/New_York')
+        self.assertIn('mon,tue,wed,thu,fri 9:00-17:00 strict', reply)
+        self.assertIn('2026-12-25 record', reply)
+
+    def test_sms_schedule_clear(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless',
+                          schedule=[('date', '2026-12-25', 'record')])
+
+        # Act
+        reply = _process_command('schedule', ['schedule', 'clear'], mailbox, '+15555555555')
+
+        # Assert
+        self.assertEqual(mailbox.schedule, [])
+        self.assertIsNone(mailbox.schedule_index)
+        self.assertIn("You don't have a schedule", reply)
+
+    def test_sms_schedule_invalid(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+
+        # Act
+        reply = _process_command('schedule', 'schedule someday 9-17 strict'.split(None, 1), mailbox, '+15555555555')
+
+        # Assert
+        self.assertEqual(mailbox.schedule, [])
+        self.assertIn("didn't understand that schedule", reply)
+
     def test_sms_whitelist_bad_number(self):
         # Arrange
         mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
 
         # Act
         body = 'whitelist 415 777'
-        reply = _process_command('whitelist', body.split(), mailbox, '+15555555555')
+        reply = _process_command('whitelist', body.split(None, 1), mailbox, '+15555555555')
 
         # Assert
         self.assertEqual(mailbox.whitelist, set())
@@ -233,12 +462,10 @@ class ProcessCommandTestCase(unittest.TestCase):
         mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
         db.session.add(mailbox)
 
-        mock_lookup_result = MagicMock()
-        mock_lookup_result.carrier = {'name': 'Bar Wireless'}
+        self.app.cache.set('carrier:+15555555555', {'name': 'Bar Wireless'})
 
         # Act
-        with patch('app.models.look_up_number', return_value=mock_lookup_result):
-            reply = _process_command('reset', ['reset'], mailbox, '+15555555555')
+        reply = _process_command('reset', ['reset'], mailbox, '+15555555555')
 
         # Assert
         self.assertIn('Bzzzzt!', reply)
@@ -247,6 +474,25 @@ class ProcessCommandTestCase(unittest.TestCase):
         self.assertEqual(len(mailboxes), 1)
         self.assertEqual(mailboxes[0].carrier, 'Bar Wireless')
 
+    def test_sms_stats_command(self):
+        # Arrange
+        mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
+        today = datetime.utcnow().date()
+        db.session.add_all([
+            DailyCount(start=today, kind='call.received', count=12),
+            DailyCount(start=today, kind='call.deflected', count=9),
+            DailyCount(start=today - timedelta(days=3), kind='call.received',
+                       count=5),
+            DailyCount(start=today - timedelta(days=10), kind='call.received',
+                       count=100)])
+
+        # Act
+        reply = _process_command('stats', ['stats'], mailbox, '+15555555555')
+
+        # Assert
+        self.assertIn('Today: 12 calls, 9 sent away', reply)
+        self.assertIn('Last 7 days: 17 calls', reply)
+
     def test_unknown_command(self):
         # Arrange
         mailbox = Mailbox(phone_number='+15555555555', carrier='Foo Wireless')
@@ -296,6 +542,38 @@ class ProcessAnswerTestCase(unittest.TestCase):
         self.assertEqual(mailbox.email, 'jane@foo.com')
         self.assertIn('forward your missed calls', reply)
 
+    def test_email_carrier_unknown(self):
+        # Arrange
+        mailbox = Mailbox(
+            phone_number='+15555555555',
+            name='Jane Foo')
+
+        # Act
+        with patch('app.models.look_up_number', return_value=None):
+            reply = _process_answer('jane@foo.com', mailbox)
+
+        # Assert
+        self.assertIsNone(mailbox.email)
+        self.assertIn('send me your email address again', reply)
+
+    def test_email_carrier_unsupported(self):
+        # Arrange
+        mailbox = Mailbox(
+            phone_number='+15555555555',
+            name='Jane Foo')
+        db.session.add(mailbox)
+        db.session.commit()
+        lookup_info = MagicMock(carrier={'name': 'Foo Wireless'})
+
+        # Act
+        with patch('app.models.look_up_number', return_value=lookup_info):
+            reply = _process_answer('jane@foo.com', mailbox)
+        db.session.commit()
+
+        # Assert
+        self.assertIn("I don't support that carrier", reply)
+        self.assertEqual(Mailbox.query.count(), 0)
+
     def test_invalid_email(self):
         # Arrange
         mailbox = Mailbox(
@@ -0,0 +1,75 @@
+import unittest
+
+from app.sms import count_segments, fit_to_segments, transliterate
+
+
+class SMSTestCase(unittest.TestCase):
+    def test_gsm7_segments(self):
+        # Assert
+        self.assertEqual(count_segments(''), ('gsm7', 0))
+        self.assertEqual(count_segments('a' * 160), ('gsm7', 1))
+        self.assertEqual(count_segments('a' * 161), ('gsm7', 2))
+        self.assertEqual(count_segments('a' * 306), ('gsm7', 2))
+        self.assertEqual(count_segments('a' * 307), ('gsm7', 3))
+
+    def test_gsm7_extended_counts_twice(self):
+        # Assert
+        self.assertEqual(count_segments('€' * 80), ('gsm7', 1))
+        self.assertEqual(count_segments('€' * 81), ('gsm7', 2))
+
+    def test_ucs2_segments(self):
+        # Assert
+        self.assertEqual(count_segments('ő' * 70), ('ucs2', 1))
+        self.assertEqual(count_segments('ő' * 71), ('ucs2', 2))
+        self.assertEqual(count_segments('\U0001F600' * 35), ('ucs2', 1))
+        self.assertEqual(count_segments('\U0001F600' * 36), ('ucs2', 2))
+
+    def test_transliterate(self):
+        # Act
+        text = transliterate('It’s “fine” — cafá…')
+
+        # Assert
+        self.assertEqual(text, 'It\'s "fine" - cafa...')
+        self.assertEqual(count_segments(text)[0], 'gsm7')
+
+    def test_transliterate_keeps_gsm(self):
+        # Assert
+        self.assertEqual(transliterate('Café Ñandú'), 'Café Ñandu')
+
+    def test_transliterate_unsafe(self):
+        # Arrange
+        original = 'It’s \U0001F600'
+
+        # Act
+        text = transliterate(original)
+
+        # Assert
+        self.assertEqual(text, original)
+
+    def test_fit_to_segments_short(self):
+        # Act
+        text = fit_to_segments('Said: [t] /link', '[t]', 'hello', 1)
+
+        # Assert
+        self.assertEqual(text, 'Said: hello /link')
+
+    def test_fit_to_segments_truncates(self):
+        # Arrange
+        transcription = ' '.join(['word'] * 200)
+
+        # Act
+        text = fit_to_segments('Said: [t]\n/recording/12345', '[t]',
+                               transcription, 2)
+
+        # Assert
+        self.assertEqual(count_segments(text), ('gsm7', 2))
+        self.assertTrue(text.endswith('word...\n/recording/12345'))
+        self.assertGreater(len(text), 280)
+
+    def test_fit_to_segments_transliterates(self):
+        # Act
+        text = fit_to_segments('Said: [t]', '[t]', 'don’t ' * 100, 1)
+
+        # Assert
+        self.assertEqual(count_segments(text), ('gsm7', 1))
+        self.assertTrue(text.startswith("Said: don't don't"))
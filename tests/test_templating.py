@@ -0,0 +1,113 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from app import create_app, db
+from app.metrics import get_metrics
+from app.models import Mailbox
+from app.templating import render_reply, render_truncated_reply
+
+
+class TemplatingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_templates_preloaded(self):
+        # Assert
+        self.assertIsNotNone(self.app.jinja_env.bytecode_cache)
+        cached_templates = [str(key) for key in self.app.jinja_env.cache.keys()]
+        self.assertTrue(any('no_idea.txt' in key for key in cached_templates))
+
+    def test_static_reply_memoized(self):
+        # Act
+        with patch('app.templating.render_template', return_value='Hello!') as mock_render:
+            first_reply = render_reply('setup/no_idea.txt')
+            second_reply = render_reply('setup/no_idea.txt')
+
+        # Assert
+        self.assertEqual(first_reply, 'Hello!')
+        self.assertEqual(second_reply, 'Hello!')
+        mock_render.assert_called_once_with('setup/no_idea.txt')
+
+        metrics = get_metrics()
+        self.assertEqual(metrics['templates.memoized'], 1)
+        self.assertEqual(metrics['templates.render.count'], 1)
+
+    def test_mailbox_reply_rendered_after_change(self):
+        # Arrange
+        mailbox = Mailbox('+15555555555', carrier='Foo Wireless', name='Jane Foo')
+
+        # Act
+        first_reply = render_reply('setup/email/ask.txt', mailbox=mailbox)
+        mailbox.name = 'John Foo'
+        second_reply = render_reply('setup/email/ask.txt', mailbox=mailbox)
+
+        # Assert
+        self.assertIn('Jane Foo', first_reply)
+        self.assertIn('John Foo', second_reply)
+
+    def test_unhashable_context_not_memoized(self):
+        # Act
+        with patch('app.templating.render_template', return_value='Hello!') as mock_render:
+            render_reply('voice/new_voicemail.txt', voicemail=MagicMock())
+            render_reply('voice/new_voicemail.txt', voicemail=MagicMock())
+
+        # Assert
+        self.assertEqual(mock_render.call_count, 2)
+
+    def test_memoize_replies_disabled(self):
+        # Arrange
+        self.app.config['MEMOIZE_REPLIES'] = False
+
+        # Act
+        with patch('app.templating.render_template', return_value='Hello!') as mock_render:
+            render_reply('setup/no_idea.txt')
+            render_reply('setup/no_idea.txt')
+
+        # Assert
+        self.assertEqual(mock_render.call_count, 2)
+
+    def test_reply_segments_counted(self):
+        # Act
+        with patch('app.templating.render_template', return_value='a' * 200):
+            render_reply('setup/no_idea.txt')
+            render_reply('setup/no_idea.txt')
+
+        # Assert
+        metrics = get_metrics()
+        self.assertEqual(metrics['sms.messages'], 2)
+        self.assertEqual(metrics['sms.segments'], 4)
+        self.assertEqual(metrics['sms.segments.gsm7'], 4)
+
+    def test_memoized_reply_segments_not_counted_again(self):
+        # Arrange
+        render_reply('setup/no_idea.txt')
+
+        # Act
+        with patch('app.templating.count_segments') as mock_count:
+            render_reply('setup/no_idea.txt')
+
+        # Assert
+        self.assertFalse(mock_count.called)
+        self.assertEqual(get_metrics()['sms.messages'], 2)
+
+    def test_truncated_reply(self):
+        # Arrange
+        voicemail = MagicMock(from_number='+17777777777', recording_sid='12345')
+        transcription = 'Hi, it’s me. ' * 100
+
+        # Act
+        with self.app.test_request_context():
+            reply = render_truncated_reply(
+                'voice/new_voicemail.txt', 'transcription', transcription, 2,
+                voicemail=voicemail)
+
+        # Assert
+        self.assertIn("Hi, it's me.", reply)
+        self.assertIn('...', reply)
+        self.assertTrue(reply.strip().endswith('/recording/12345'))
+        self.assertEqual(get_metrics()['sms.segments.gsm7'], 2)
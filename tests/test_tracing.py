@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import unittest
+from threading import Thread
+from unittest.mock import patch
+
+from app import create_app, db
+from config import config
+from app.models import Mailbox
+from app.tracing import Tracer, begin_trace, end_trace, propagate, span
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        handle, self.trace_file = tempfile.mkstemp()
+        os.close(handle)
+
+        self.app = create_app('testing')
+        self.app.config['TRACE_FILE'] = self.trace_file
+        self.tracer = Tracer(self.trace_file, sample_rate=1)
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+        os.remove(self.trace_file)
+
+    def read_spans(self):
+        with open(self.trace_file) as f:
+            return [json.loads(line) for line in f]
+
+    def test_span(self):
+        # Act
+        begin_trace(self.tracer, 'POST /call', 'CA1234')
+        with span('twilio.lookups'):
+            pass
+        end_trace(status=200)
+
+        # Assert
+        child, root = self.read_spans()
+        self.assertEqual(root['name'], 'POST /call')
+        self.assertEqual(root['trace_id'], 'CA1234')
+        self.assertEqual(root['attributes'], {'status': 200})
+        self.assertEqual(child['name'], 'twilio.lookups')
+        self.assertEqual(child['parent_id'], root['span_id'])
+
+    def test_span_without_trace(self):
+        # Act
+        with span('twilio.lookups') as child:
+            pass
+
+        # Assert
+        self.assertIsNone(child)
+        self.assertEqual(self.read_spans(), [])
+
+    def test_sampling(self):
+        # Arrange
+        tracer = Tracer(self.trace_file, sample_rate=0)
+
+        # Act
+        begin_trace(tracer, 'POST /call', 'CA1234')
+        with span('twilio.lookups'):
+            pass
+        end_trace()
+
+        # Assert
+        self.assertEqual(self.read_spans(), [])
+
+    def test_propagate(self):
+        # Arrange
+        def send_message():
+            with span('twilio.messages.create'):
+                pass
+
+        # Act
+        begin_trace(self.tracer, 'POST /call', 'CA1234')
+        thread = Thread(target=propagate(send_message))
+        end_trace()
+
+        thread.start()
+        thread.join()
+
+        # Assert
+        root, child, background = sorted(
+            self.read_spans(), key=lambda s: s['name'])
+        self.assertEqual(background['name'], 'twilio.messages.create')
+        self.assertEqual(background['trace_id'], 'CA1234')
+        self.assertEqual(child['name'], 'send_message')
+        self.assertEqual(child['parent_id'], root['span_id'])
+
+    def test_request(self):
+        # Arrange
+        with patch.object(config['testing'], 'TRACE_FILE', self.trace_file):
+            with patch.object(config['testing'], 'TRACE_SAMPLE_RATE', 1):
+                app = create_app('testing')
+
+        with app.app_context():
+            db.create_all()
+            db.session.add(Mailbox('+15555555555', carrier='Foo Wireless'))
+            db.session.commit()
+
+            # Act
+            app.test_client().post('/call', data={
+                'From': '+17777777777', 'CallSid': 'CA1234'})
+
+            db.drop_all()
+
+        # Assert
+        spans = self.read_spans()
+        root = spans[-1]
+        self.assertEqual(root['name'], 'POST /call')
+        self.assertEqual(root['trace_id'], 'CA1234')
+        self.assertEqual(root['attributes']['status'], 200)
+        self.assertIn('db.query', [s['name'] for s in spans])
@@ -1,8 +1,12 @@
+import socket
 import unittest
+from time import time
 from twilio.rest.exceptions import TwilioRestException
 from unittest.mock import MagicMock, patch
 
 from app import SchemeProxyFix, create_app, db
+from app.breaker import get_lookups_breaker
+from app.metrics import get_metrics
 from app.utils import look_up_number, convert_to_national_format, send_async_message, set_twilio_number_urls
 
 
@@ -34,7 +38,8 @@ class UtilsTestCase(unittest.TestCase):
             body='Async foo',
             to='+15555555555',
             from_='+19999999999',
-            media_url=None)
+            media_url=None,
+            status_callback=None)
 
     def test_send_async_message_media(self):
         # Arrange
@@ -52,25 +57,29 @@ class UtilsTestCase(unittest.TestCase):
             body='Async foo',
             to='+15555555555',
             from_='+19999999999',
-            media_url=['http://example.com/image'])
+            media_url=['http://example.com/image'],
+            status_callback=None)
 
     def test_look_up_number(self):
         # Arrange
+        mock_lookup_result = MagicMock(carrier={'type': 'mobile', 'name': 'Foo Wireless'})
         mock_client = MagicMock()
-        mock_client.phone_numbers.get.return_value = 'lookup info'
+        mock_client.phone_numbers.get.return_value = mock_lookup_result
 
         # Act
         with patch('app.utils.TwilioLookupsClient', return_value=mock_client):
             result = look_up_number('+15555555555')
 
         # Assert
-        self.assertEqual(result, 'lookup info')
+        self.assertEqual(result, mock_lookup_result)
         mock_client.phone_numbers.get.assert_called_once_with('+15555555555', include_carrier_info=True)
 
+        self.assertEqual(self.app.cache.get('carrier:+15555555555'), {'type': 'mobile', 'name': 'Foo Wireless'})
+
     def test_look_up_number_error(self):
         # Arrange
         mock_client = MagicMock()
-        mock_client.phone_numbers.get.side_effect = TwilioRestException('foo', 'bar')
+        mock_client.phone_numbers.get.side_effect = TwilioRestException(404, 'bar')
 
         # Act
         with patch('app.utils.TwilioLookupsClient', return_value=mock_client):
@@ -79,6 +88,66 @@ class UtilsTestCase(unittest.TestCase):
         # Assert
         self.assertIsNone(result)
         mock_client.phone_numbers.get.assert_called_once_with('+15555555555', include_carrier_info=True)
+        self.assertEqual(get_lookups_breaker().state, 'closed')
+
+    def test_look_up_number_server_error(self):
+        # Arrange
+        self.app.config['TWILIO_LOOKUPS_FAILURE_THRESHOLD'] = 1
+
+        mock_client = MagicMock()
+        mock_client.phone_numbers.get.side_effect = TwilioRestException(503, 'bar')
+
+        # Act
+        with patch('app.utils.TwilioLookupsClient', return_value=mock_client):
+            result = look_up_number('+15555555555')
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertEqual(get_lookups_breaker().state, 'open')
+
+    def test_look_up_number_timeout(self):
+        # Arrange
+        self.app.config['TWILIO_LOOKUPS_FAILURE_THRESHOLD'] = 1
+
+        mock_client = MagicMock()
+        mock_client.phone_numbers.get.side_effect = socket.timeout
+
+        # Act
+        with patch('app.utils.TwilioLookupsClient', return_value=mock_client) as MockClient:
+            result = look_up_number('+15555555555')
+
+        # Assert
+        self.assertIsNone(result)
+        self.assertEqual(MockClient.call_args[1]['timeout'], 2)
+        self.assertEqual(get_lookups_breaker().state, 'open')
+
+    def test_look_up_number_cached(self):
+        # Arrange
+        self.app.cache.set('carrier:+15555555555', {'type': 'mobile', 'name': 'Foo Wireless'})
+
+        # Act
+        with patch('app.utils.TwilioLookupsClient') as MockClient:
+            result = look_up_number('+15555555555')
+
+        # Assert
+        self.assertFalse(MockClient.called)
+        self.assertEqual(result.carrier, {'type': 'mobile', 'name': 'Foo Wireless'})
+
+    def test_look_up_number_breaker_open(self):
+        # Arrange
+        self.app.cache.set('carrier:+15555555555', {'type': 'mobile', 'name': 'Foo Wireless'})
+        self.app.cache.set('breaker:lookups:opened_at', time())
+
+        # Act
+        with patch('app.utils.TwilioLookupsClient') as MockClient:
+            result = look_up_number('+15555555555')
+            uncached_result = look_up_number('+17777777777')
+
+        # Assert
+        self.assertFalse(MockClient.called)
+        self.assertEqual(result.carrier, {'type': 'mobile', 'name': 'Foo Wireless'})
+        self.assertIsNone(uncached_result)
+        self.assertEqual(get_metrics()['lookups.degraded'], 1)
 
     def test_national_format_error(self):
         # Act
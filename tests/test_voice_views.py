@@ -1,8 +1,13 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
 from flask import current_app
 from unittest.mock import MagicMock, patch
 
 from app import create_app, db
+from app.metrics import get_metrics
 from app.models import Mailbox, Voicemail
 
 
@@ -138,6 +143,70 @@ class VoiceViewsTestCase(unittest.TestCase):
         content = str(response.data)
         self.assertIn('/record', content)
 
+    def test_call_caller_matches_whitelist_rule(self):
+        # Arrange
+        mailbox = Mailbox(
+            phone_number='+15555555555',
+            carrier='Foo Wireless',
+            name='Jane Foo',
+            email='jane@foo.com',
+            whitelist=['+1777777*'])
+        db.session.add(mailbox)
+        db.session.commit()
+
+        # Act
+        response = self.test_client.post('/call', data={
+            'From': '+17777771234'})
+
+        # Assert
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/record', str(response.data))
+
+    def test_call_scheduled_record(self):
+        # Arrange
+        mailbox = Mailbox(
+            phone_number='+15555555555',
+            carrier='Foo Wireless',
+            name='Jane Foo',
+            email='jane@foo.com',
+            schedule=[('weekly', (0, 1, 2, 3, 4, 5, 6), 0, 1440, 'record')])
+        db.session.add(mailbox)
+        db.session.commit()
+
+        # Act
+        with patch('app.voice.views.look_up_number') as mock_lookup:
+            response = self.test_client.post('/call', data={
+                'From': '+17777777777'})
+
+        # Assert
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/record', str(response.data))
+        self.assertFalse(mock_lookup.called)
+
+    def test_call_scheduled_strict(self):
+        # Arrange
+        mailbox = Mailbox(
+            phone_number='+15555555555',
+            carrier='Foo Wireless',
+            name='Jane Foo',
+            email='jane@foo.com',
+            schedule=[('weekly', (0, 1, 2, 3, 4, 5, 6), 0, 1440, 'strict')])
+        db.session.add(mailbox)
+        db.session.commit()
+
+        mock_lookup_result = MagicMock(carrier={'type': 'landline', 'name': 'Foo Telephone'})
+
+        # Act
+        with patch('app.voice.views.look_up_number', return_value=mock_lookup_result):
+            response = self.test_client.post('/call', data={
+                'From': '+17777777777'})
+
+        # Assert
+        content = response.data.decode('utf-8')
+        self.assertIn('jane@foo.com', content)
+        self.assertNotIn('<Gather', content)
+        self.assertIn('Goodbye', content)
+
     def test_call_no_mailbox(self):
         # Act
         response = self.test_client.post('/call', data={
@@ -182,6 +251,70 @@ class VoiceViewsTestCase(unittest.TestCase):
 
         self.assertIn('Thank you for not leaving a voicemail.', content)
 
+    def test_call_from_mobile_offline(self):
+        # Arrange
+        mailbox = Mailbox(
+            phone_number='+15555555555',
+            carrier='Foo Wireless',
+            name='Jane Foo',
+            email='jane@foo.com')
+        db.session.add(mailbox)
+
+        # Act
+        with patch('app.voice.views.look_up_number') as mock_lookup:
+            with patch.object(Mailbox, 'send_contact_info') as mock:
+                response = self.test_client.post('/call', data={
+                    'From': '+491701234567'
+                    })
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(mock_lookup.called)
+        mock.assert_called_once_with('+491701234567')
+
+    def test_call_shed(self):
+        # Arrange
+        mailbox = Mailbox(
+            phone_number='+15555555555',
+            carrier='Foo Wireless',
+            name='Jane Foo',
+            email='jane@foo.com')
+        db.session.add(mailbox)
+
+        # Send one call normally, so we have a gather prompt to shed with
+        with patch('app.voice.views.look_up_number', return_value=None):
+            normal = self.test_client.post('/call', data={
+                'From': '+17777777777'})
+
+        self.app.config['ADMISSION_MAX_IN_FLIGHT'] = 0
+        del self.app.extensions['admission']
+
+        # Act
+        with patch('app.voice.views.look_up_number') as mock_lookup:
+            response = self.test_client.post('/call', data={
+                'From': '+17777777778'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, normal.data)
+        self.assertFalse(mock_lookup.called)
+
+        metrics = get_metrics()
+        self.assertEqual(metrics['admission.shed'], 1)
+        self.assertEqual(metrics['admission.shed.in_flight'], 1)
+
+    def test_call_shed_to_record(self):
+        # Arrange
+        self.app.config['ADMISSION_MAX_IN_FLIGHT'] = 0
+
+        # Act
+        response = self.test_client.post('/call', data={
+            'From': '+17777777777'})
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('leave a message after the beep', str(response.data))
+
     def test_hang_up(self):
         # Act
         response = self.test_client.post('/hang-up')
@@ -231,3 +364,117 @@ class VoiceViewsTestCase(unittest.TestCase):
         # Assert
         self.assertEqual(response.status_code, 200)
         mock_client.recordings.get.assert_called_once_with('1234')
+
+    def test_view_recording_archived(self):
+        # Arrange
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        self.app.config['RECORDINGS_DIR'] = archive_dir
+
+        with open(os.path.join(archive_dir, 'RE1234.mp3'), 'wb') as f:
+            f.write(b'audio')
+        with open(os.path.join(archive_dir, 'RE1234.json'), 'w') as f:
+            json.dump({'from_number': '+15555555555',
+                       'transcription': 'YOUR VOICEMAIL IS COOL!',
+                       'date_created': '2016-01-01T00:00:00'}, f)
+
+        # Act
+        with patch('app.voice.views.get_twilio_rest_client') as mock:
+            response = self.test_client.get('/recording/RE1234')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(mock.called)
+
+        content = response.data.decode('utf-8')
+        self.assertIn('/recording/RE1234/audio.mp3', content)
+        self.assertIn('YOUR VOICEMAIL IS COOL!', content)
+
+
+class RecordingAudioTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.test_client = self.app.test_client()
+
+        self.archive_dir = tempfile.mkdtemp()
+        self.app.config['RECORDINGS_DIR'] = self.archive_dir
+
+        with open(os.path.join(self.archive_dir, 'RE1234.mp3'), 'wb') as f:
+            f.write(b'0123456789')
+
+    def tearDown(self):
+        shutil.rmtree(self.archive_dir)
+        self.app_context.pop()
+
+    def test_audio(self):
+        # Act
+        response = self.test_client.get('/recording/RE1234/audio.mp3')
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'0123456789')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(response.mimetype, 'audio/mpeg')
+        self.assertIn('public', response.headers['Cache-Control'])
+
+    def test_audio_range(self):
+        # Act
+        response = self.test_client.get(
+            '/recording/RE1234/audio.mp3', headers={'Range': 'bytes=2-5'})
+
+        # Assert
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'2345')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response.headers['Content-Length'], '4')
+
+    def test_audio_range_to_end(self):
+        # Act
+        response = self.test_client.get(
+            '/recording/RE1234/audio.mp3', headers={'Range': 'bytes=7-'})
+
+        # Assert
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'789')
+
+    def test_audio_range_unsatisfiable(self):
+        # Act
+        response = self.test_client.get(
+            '/recording/RE1234/audio.mp3', headers={'Range': 'bytes=20-30'})
+
+        # Assert
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], 'bytes */10')
+
+    def test_audio_not_modified(self):
+        # Arrange
+        etag = self.test_client.get(
+            '/recording/RE1234/audio.mp3').headers['ETag']
+
+        # Act
+        response = self.test_client.get(
+            '/recording/RE1234/audio.mp3', headers={'If-None-Match': etag})
+
+        # Assert
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_audio_not_archived(self):
+        # Act
+        response = self.test_client.get('/recording/RE5678/audio.mp3')
+
+        # Assert
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers['Location'].endswith(
+            '/Recordings/RE5678.mp3'))
+
+    def test_audio_invalid_sid(self):
+        # Act
+        response = self.test_client.get('/recording/..%2Fsecret/audio.mp3')
+
+        # Assert
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,127 @@
+import unittest
+
+from app.whitelist import compile_rules, is_rule, match_rules, normalize_numbers, numbers_from_file, numbers_from_text, parse_rule, range_to_prefixes
+
+
+class WhitelistTestCase(unittest.TestCase):
+
+    def test_numbers_from_text(self):
+        # Act
+        result = numbers_from_text('415 555 0001, 415 555 0002;415 555 0003')
+
+        # Assert
+        self.assertEqual(result, ['415 555 0001', ' 415 555 0002', '415 555 0003'])
+
+    def test_numbers_from_vcard(self):
+        # Arrange
+        vcard = [
+            'BEGIN:VCARD',
+            'VERSION:3.0',
+            'FN:Jane Foo',
+            'TEL;TYPE=CELL:(415) 555-0001',
+            'item1.TEL:+14155550002',
+            'NOTE:Call me at 415 555 0003',
+            'END:VCARD']
+
+        # Act
+        result = list(numbers_from_file(vcard))
+
+        # Assert
+        self.assertEqual(result, ['(415) 555-0001', '+14155550002'])
+
+    def test_numbers_from_csv(self):
+        # Arrange
+        csv_lines = ['name,phone', 'Jane Foo,415 555 0001', 'John Foo,"415-555-0002"']
+
+        # Act
+        result = list(numbers_from_file(csv_lines))
+
+        # Assert
+        self.assertEqual(result, ['name', 'phone', 'Jane Foo', '415 555 0001', 'John Foo', '415-555-0002'])
+
+    def test_normalize_numbers(self):
+        # Arrange
+        candidates = ['phone', '(415) 555-0001', '415 555 0001', '+14155550001', '415 555', 'abc123', '']
+
+        # Act
+        numbers, invalid = normalize_numbers(candidates, 'US')
+
+        # Assert
+        self.assertEqual(numbers, set(['+14155550001']))
+        self.assertEqual(invalid, 2)
+
+    def test_is_rule(self):
+        # Assert
+        self.assertTrue(is_rule('415 555*'))
+        self.assertTrue(is_rule('415 555 0100 to 0199'))
+        self.assertTrue(is_rule('+14155550100..+14155550199'))
+        self.assertFalse(is_rule('(415) 555-0100'))
+
+    def test_is_rule_names(self):
+        # Assert
+        self.assertFalse(is_rule('Tom to Jerry'))
+        self.assertFalse(is_rule('Jane Foo*'))
+        self.assertFalse(is_rule('Flat 2 to let'))
+        self.assertFalse(is_rule('*'))
+
+    def test_parse_prefix_rule(self):
+        # Assert
+        self.assertEqual(parse_rule('415 555*', 'US'), '+1415555*')
+        self.assertEqual(parse_rule('+44 20 7946*', 'US'), '+44207946*')
+        self.assertEqual(parse_rule('020 7946*', 'GB'), '+44207946*')
+        self.assertIsNone(parse_rule('+1*', 'US'))
+
+    def test_parse_range_rule(self):
+        # Assert
+        self.assertEqual(parse_rule('415 555 0100 to 0199', 'US'),
+                         '+14155550100..+14155550199')
+        self.assertEqual(parse_rule('(415) 555-0100 TO (415) 555-0199', 'US'),
+                         '+14155550100..+14155550199')
+        self.assertEqual(parse_rule('+14155550100..+14155550199', 'US'),
+                         '+14155550100..+14155550199')
+        self.assertIsNone(parse_rule('415 555 0199 to 0100', 'US'))
+        self.assertIsNone(parse_rule('415 555 to 0199', 'US'))
+
+    def test_range_to_prefixes(self):
+        # Assert
+        self.assertEqual(range_to_prefixes('0100', '0199'), ['01'])
+        self.assertEqual(range_to_prefixes('0100', '0100'), ['0100'])
+        self.assertEqual(range_to_prefixes('0000', '9999'),
+                         [str(digit) for digit in range(10)])
+        self.assertEqual(range_to_prefixes('0105', '0213'), [
+            '0105', '0106', '0107', '0108', '0109', '011', '012', '013',
+            '014', '015', '016', '017', '018', '019', '020', '0210', '0211',
+            '0212', '0213'])
+
+    def test_range_to_prefixes_exact(self):
+        # Arrange
+        low, high = 1234, 5678
+
+        # Act
+        prefixes = range_to_prefixes(str(low), str(high))
+
+        # Assert
+        covered = [n for n in range(10000)
+                   if any(str(n).zfill(4).startswith(p) for p in prefixes)]
+        self.assertEqual(covered, list(range(low, high + 1)))
+
+    def test_match_rules(self):
+        # Arrange
+        trie = compile_rules(['+14155550001', '+1415666*',
+                              '+14155550100..+14155550199'])
+
+        # Assert
+        self.assertTrue(match_rules(trie, '+14156660000'))
+        self.assertTrue(match_rules(trie, '+14155550100'))
+        self.assertTrue(match_rules(trie, '+14155550199'))
+        self.assertFalse(match_rules(trie, '+14155550200'))
+        self.assertFalse(match_rules(trie, '+141555501000'))
+        self.assertFalse(match_rules(trie, '+14155550001'))
+
+    def test_no_rules(self):
+        # Act
+        trie = compile_rules(['+14155550001'])
+
+        # Assert
+        self.assertIsNone(trie)
+        self.assertFalse(match_rules(trie, '+14155550001'))
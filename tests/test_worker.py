@@ -0,0 +1,33 @@
+import unittest
+from unittest.mock import MagicMock
+
+from app import create_app
+
+
+class BackgroundWorkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+
+    def test_worker_runs_job(self):
+        # Arrange
+        mock_job = MagicMock()
+
+        # Act
+        self.app.worker.submit(mock_job, '+15555555555')
+        self.app.worker.join()
+
+        # Assert
+        mock_job.assert_called_once_with('+15555555555')
+
+    def test_worker_survives_failed_job(self):
+        # Arrange
+        failing_job = MagicMock(side_effect=ValueError)
+        mock_job = MagicMock()
+
+        # Act
+        self.app.worker.submit(failing_job)
+        self.app.worker.submit(mock_job)
+        self.app.worker.join()
+
+        # Assert
+        self.assertTrue(mock_job.called)